@@ -1,10 +1,54 @@
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.db.models import F
+from django.template.response import TemplateResponse
+from django.urls import path
 from django.utils.html import format_html
+from django.utils import timezone
 from django.shortcuts import reverse
 
 from django_summernote.admin import SummernoteModelAdmin
 
-from signup import models, forms
+from signup import models, forms, search
+from signup.ip_ranges import find_overlaps, format_ip
+from signup.paginators import ApproximateCountPaginator
+
+
+EXACT_COUNT_VAR = 'exact_count'
+
+
+class ApproximateCountMixin(object):
+	"""
+	For changelists of tables too large to count on every page load. The
+	result count is estimated unless ?exact_count=1 is given and the
+	unfiltered total is not shown.
+	"""
+	paginator = ApproximateCountPaginator
+	show_full_result_count = False
+
+	def get_paginator(
+			self,
+			request,
+			queryset,
+			per_page,
+			orphans=0,
+			allow_empty_first_page=True,
+	):
+		return self.paginator(
+			queryset,
+			per_page,
+			orphans,
+			allow_empty_first_page,
+			exact=getattr(request, 'exact_count', False),
+		)
+
+	def changelist_view(self, request, extra_context=None):
+		# The changelist treats unknown parameters as field lookups.
+		if EXACT_COUNT_VAR in request.GET:
+			request.GET = request.GET.copy()
+			request.exact_count = request.GET.pop(EXACT_COUNT_VAR)[-1] == '1'
+
+		return super().changelist_view(request, extra_context)
 
 
 class PackageAdmin(SummernoteModelAdmin):
@@ -43,6 +87,9 @@ class BandingAdmin(SummernoteModelAdmin):
 		'currency',
 		'country',
 	)
+	list_select_related = (
+		'country',
+	)
 	list_filter = (
 		'country',
 		'redirect',
@@ -56,7 +103,7 @@ class BandingAdmin(SummernoteModelAdmin):
 	)
 
 
-class SignUpAdmin(SummernoteModelAdmin):
+class SignUpAdmin(ApproximateCountMixin, SummernoteModelAdmin):
 	list_display = (
 		'pk',
 		'institution',
@@ -68,6 +115,10 @@ class SignUpAdmin(SummernoteModelAdmin):
 		'organisation_actions',
 		'current_access_status',
 	)
+	list_select_related = (
+		'package',
+		'banding',
+	)
 	list_filter = (
 		'package',
 		'banding',
@@ -90,6 +141,96 @@ class SignUpAdmin(SummernoteModelAdmin):
 		'-pk',
 		'institution',
 	)
+	actions = (
+		'grant_access',
+		'revoke_access',
+	)
+
+	def get_search_results(self, request, queryset, search_term):
+		if not search.can_search(queryset):
+			return super().get_search_results(request, queryset, search_term)
+
+		queryset = search.search_signups(queryset, search_term)
+		# Sorting by institution is only cheap once a search term has
+		# narrowed the signups down, an empty term keeps the -pk ordering.
+		if request.path.endswith('/autocomplete/') and \
+				search.search_words(search_term):
+			queryset = queryset.order_by('institution', 'pk')
+		return queryset, False
+
+	def has_add_accesslog_permission(self, request):
+		return request.user.has_perm('signup.add_accesslog')
+
+	def grant_access(self, request, queryset):
+		return self.change_access(request, queryset, 'grant')
+	grant_access.short_description = 'Grant access to selected signups'
+	grant_access.allowed_permissions = ('add_accesslog',)
+
+	def revoke_access(self, request, queryset):
+		return self.change_access(request, queryset, 'revoke')
+	revoke_access.short_description = 'Revoke access from selected signups'
+	revoke_access.allowed_permissions = ('add_accesslog',)
+
+	def change_access(self, request, queryset, access_type):
+		"""
+		Asks for a shared IP range and payment handler, then records one
+		AccessLog entry for each selected signup in a single transaction.
+		Signups already in that state are skipped: granting skips signups
+		that have access with the same IP range and revoking skips those
+		without access.
+		"""
+		form = forms.BulkAccessForm(
+			request.POST if 'apply' in request.POST else None,
+		)
+
+		if form.is_valid():
+			ip_range = form.cleaned_data['ip_range']
+			if access_type == 'grant':
+				unchanged = {'access_status': 'grant'}
+				if ip_range:
+					unchanged['access_ip_range'] = ip_range
+				changed = queryset.exclude(**unchanged)
+				skipped_reason = 'already had access'
+			else:
+				changed = queryset.filter(access_status='grant')
+				skipped_reason = 'did not have access'
+
+			selected = queryset.count()
+			access_logs = models.record_access_changes(
+				changed,
+				access_type,
+				request.user,
+				ip_range=ip_range,
+				payment_handler=form.cleaned_data['payment_handler'],
+			)
+			message = 'Recorded {} for {} signup(s).'.format(
+				access_type,
+				len(access_logs),
+			)
+			if selected > len(access_logs):
+				message += ' Skipped {} signup(s) that {}.'.format(
+					selected - len(access_logs),
+					skipped_reason,
+				)
+			self.message_user(request, message)
+			return None
+
+		context = {
+			**self.admin_site.each_context(request),
+			'opts': self.model._meta,
+			'title': '{} access'.format(access_type.capitalize()),
+			'form': form,
+			'signups': queryset.select_related(None).only('pk', 'institution'),
+			'action': request.POST['action'],
+			'select_across': request.POST.get('select_across', '0'),
+			'access_type': access_type,
+			'action_checkbox_name': admin.helpers.ACTION_CHECKBOX_NAME,
+		}
+		return TemplateResponse(
+			request,
+			'admin/signup/signup/change_access.html',
+			context,
+		)
 
 	def organisation_actions(self, obj):
 		url = reverse('admin:%s_%s_add' % ('signup', 'accesslog'))
@@ -118,6 +259,9 @@ class ContactAdmin(SummernoteModelAdmin):
 		'country',
 		'contact_type',
 	)
+	list_select_related = (
+		'country',
+	)
 	list_filter = (
 		'country',
 		'contact_type',
@@ -133,6 +277,7 @@ class ContactAdmin(SummernoteModelAdmin):
 
 
 class OrganisationAdmin(SummernoteModelAdmin):
+	form = forms.OrganisationForm
 	list_display = (
 		'name',
 		'contact_email',
@@ -171,6 +316,10 @@ class NewsAdmin(SummernoteModelAdmin):
 		'posted',
 		'organisation',
 	)
+	list_select_related = (
+		'posted_by',
+		'organisation',
+	)
 	search_fields = (
 		'title',
 	)
@@ -184,7 +333,7 @@ class NewsAdmin(SummernoteModelAdmin):
 	save_as = True
 
 
-class AccessLogAdmin(admin.ModelAdmin):
+class AccessLogAdmin(ApproximateCountMixin, admin.ModelAdmin):
 	form = forms.AccessLogForm
 
 	list_display = (
@@ -193,6 +342,13 @@ class AccessLogAdmin(admin.ModelAdmin):
 		'user',
 		'date_stamp',
 	)
+	list_select_related = (
+		'signup',
+		'user',
+	)
+	autocomplete_fields = (
+		'signup',
+	)
 
 	def get_form(self, request, obj=None, **kwargs):
 		AccessLogForm = super(AccessLogAdmin, self).get_form(request, obj, **kwargs)
@@ -204,6 +360,61 @@ class AccessLogAdmin(admin.ModelAdmin):
 
 		return RequestAccessForm
 
+	def get_urls(self):
+		urls = [
+			path(
+				'overlaps/',
+				self.admin_site.admin_view(self.overlap_report),
+				name='signup_accesslog_overlaps',
+			),
+		]
+		return urls + super().get_urls()
+
+	def overlap_report(self, request):
+		"""
+		Lists IP ranges currently granted to one institution that overlap
+		those granted to another.
+		"""
+		if not self.has_view_permission(request):
+			raise PermissionDenied
+
+		ip_ranges = models.AccessLogIPRange.objects.filter(
+			access_log__signup__access_status='grant',
+			access_log__date_stamp=F('access_log__signup__access_status_date'),
+		).select_related(
+			'access_log__signup__package',
+		)
+
+		overlaps = find_overlaps(
+			(
+				ip_range.interval,
+				ip_range.access_log.signup.institution.strip().lower(),
+				ip_range,
+			) for ip_range in ip_ranges.iterator()
+		)
+
+		context = {
+			**self.admin_site.each_context(request),
+			'opts': self.model._meta,
+			'title': 'IP range overlaps',
+			'overlap_count': len(overlaps),
+			'overlaps': [
+				{
+					'range': ip_range,
+					'other_range': other_range,
+					'overlap': '{}-{}'.format(
+						format_ip(overlap.version, overlap.start),
+						format_ip(overlap.version, overlap.end),
+					),
+				} for ip_range, other_range, overlap in overlaps[:1000]
+			],
+		}
+		return TemplateResponse(
+			request,
+			'admin/signup/accesslog/overlaps.html',
+			context,
+		)
+
 
 class AccessLogExportCodeAdmin(admin.ModelAdmin):
 	list_display = (
@@ -216,6 +427,40 @@ class AccessLogExportCodeAdmin(admin.ModelAdmin):
 	)
 
 
+class OutboxMessageAdmin(admin.ModelAdmin):
+	list_display = (
+		'subject',
+		'to',
+		'status',
+		'attempts',
+		'next_attempt',
+		'sent',
+	)
+	list_filter = (
+		'status',
+	)
+	search_fields = (
+		'subject',
+	)
+	actions = (
+		'retry',
+	)
+
+	def retry(self, request, queryset):
+		updated = queryset.exclude(
+			status='sent',
+		).update(
+			status='pending',
+			attempts=0,
+			next_attempt=timezone.now(),
+		)
+		self.message_user(
+			request,
+			'{} message(s) queued for sending.'.format(updated),
+		)
+	retry.short_description = 'Retry sending selected messages'
+
+
 admin_list = [
 	(models.Package, PackageAdmin),
 	(models.Country, CountryAdmin),
@@ -227,6 +472,7 @@ admin_list = [
 	(models.NewsItem, NewsAdmin),
 	(models.AccessLog, AccessLogAdmin),
 	(models.AccessLogExportCode, AccessLogExportCodeAdmin),
+	(models.OutboxMessage, OutboxMessageAdmin),
 ]
 
 [admin.site.register(*t) for t in admin_list]
@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class SignupConfig(AppConfig):
+	name = 'signup'
+
+	def ready(self):
+		from signup import checks  # noqa: F401
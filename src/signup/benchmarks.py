@@ -0,0 +1,330 @@
+import io
+import json
+import statistics
+import timeit
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+
+from django.core import mail
+from django.core.management import call_command
+from django.db.models import Max
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from signup import models, views
+from signup.middleware import OrganisationMiddleware, organisation_cache
+from signup.templatetags.truncate import truncatesmart
+
+
+BenchmarkResult = namedtuple(
+	'BenchmarkResult',
+	('name', 'number', 'times'),
+)
+
+Regression = namedtuple(
+	'Regression',
+	('name', 'baseline', 'fastest', 'change', 'tolerance'),
+)
+
+# Setup functions by benchmark name, in the order they run. Each takes the
+# Fixtures and returns the function to time.
+BENCHMARKS = OrderedDict()
+
+EXPORT_SIZES = (10000, 100000, 1000000)
+
+# How many times its own spread a baseline allows before a slower fastest
+# time counts as a regression.
+NOISE_MULTIPLE = 3
+
+
+def benchmark(name):
+	def register(setup):
+		BENCHMARKS[name] = setup
+		return setup
+
+	return register
+
+
+def per_call(result):
+	return [time / result.number for time in result.times]
+
+
+def median(result):
+	return statistics.median(per_call(result))
+
+
+def fastest(result):
+	return min(per_call(result))
+
+
+def spread(result):
+	"""
+	Returns how far the median repeat is above the fastest, as a fraction
+	of the fastest: the noise of the machine the result was timed on.
+	"""
+	return median(result) / fastest(result) - 1
+
+
+def run_benchmark(name, func, repeat=10):
+	"""
+	Times a function the way timeit does: it is called once to warm up,
+	the number of calls that take at least 0.2 seconds is found and then
+	that many calls are timed repeat times.
+	:return: a BenchmarkResult
+	"""
+	func()
+	timer = timeit.Timer(func)
+	number, _time = timer.autorange()
+	return BenchmarkResult(name, number, timer.repeat(repeat, number))
+
+
+class Fixtures(object):
+	"""
+	The data the benchmarks run against, generated with the same seed each
+	time. Access log entries for the export are added as larger sizes are
+	asked for.
+	"""
+	def __init__(self):
+		call_command(
+			'generate_data',
+			organisations=1,
+			signups=1000,
+			access_logs=1,
+			contacts=10,
+			seed=1,
+			stdout=io.StringIO(),
+		)
+		self.organisation = models.Organisation.objects.get(
+			domain='org0.localhost',
+		)
+		self.export_code = self.organisation.accesslogexportcode_set.get()
+		self.signup = models.SignUp.objects.select_related(
+			'package',
+			'banding',
+		).filter(
+			package__organisation=self.organisation,
+			banding__country__isnull=False,
+		).first()
+		models.NewsItem.objects.bulk_create([
+			models.NewsItem(
+				organisation=self.organisation,
+				title='News item {}'.format(number),
+				body='<p>{}</p>'.format(' '.join(['Open access news.'] * 100)),
+				image='generated/news.png',
+			) for number in range(30)
+		])
+		self.factory = RequestFactory(HTTP_HOST=self.organisation.domain)
+
+	def request(self, path='/'):
+		request = self.factory.get(path)
+		request.organisation = self.organisation
+		return request
+
+	def email_context(self):
+		return {
+			'signup': self.signup,
+			'organisation': self.organisation,
+			'banding': self.signup.banding,
+			'package': self.signup.package,
+		}
+
+	def access_log_rows(self):
+		return models.AccessLog.objects.filter(
+			signup__package__organisation=self.organisation,
+		).count()
+
+	def grow_access_log(self, size, batch_size=10000):
+		"""
+		Adds access log entries for the organisation's signups until it
+		has size of them.
+		"""
+		signup_ids = list(
+			models.SignUp.objects.filter(
+				package__organisation=self.organisation,
+			).values_list(
+				'pk',
+				flat=True,
+			)
+		)
+		date_stamp = models.AccessLog.objects.aggregate(
+			Max('date_stamp'),
+		)['date_stamp__max']
+		existing = self.access_log_rows()
+
+		for start in range(existing, size, batch_size):
+			entries = []
+			for number in range(start, min(start + batch_size, size)):
+				date_stamp += timedelta(minutes=1)
+				entries.append(models.AccessLog(
+					signup_id=signup_ids[number % len(signup_ids)],
+					access_type=('grant', 'revoke')[number % 2],
+					date_stamp=date_stamp,
+					ip_range='10.{}.{}.0/24'.format(
+						number // 256 % 256,
+						number % 256,
+					),
+				))
+			models.AccessLog.objects.bulk_create(entries)
+
+		# Bulk inserts skip the signal that numbers entries for the export.
+		version = models.AccessLogExportVersion.bump(self.organisation.pk)
+		models.AccessLog.objects.filter(
+			signup__package__organisation=self.organisation,
+			export_sequence__isnull=True,
+		).update(
+			export_sequence=version,
+		)
+
+
+@benchmark('middleware.process_view')
+def middleware_process_view(fixtures):
+	middleware = OrganisationMiddleware(lambda request: HttpResponse())
+	request = fixtures.factory.get('/packages/')
+
+	def run():
+		middleware.process_view(request, views.packages, (), {})
+
+	return run
+
+
+@benchmark('middleware.process_view_uncached')
+def middleware_process_view_uncached(fixtures):
+	middleware = OrganisationMiddleware(lambda request: HttpResponse())
+	request = fixtures.factory.get('/packages/')
+
+	def run():
+		organisation_cache.clear()
+		middleware.process_view(request, views.packages, (), {})
+
+	return run
+
+
+@benchmark('signup.render_email')
+def signup_render_email(fixtures):
+	context = fixtures.email_context()
+
+	def run():
+		fixtures.signup.render_email(
+			context,
+			fixtures.organisation.billing_manager_message,
+		)
+
+	return run
+
+
+@benchmark('signup.send_billing_notifications')
+def signup_send_billing_notifications(fixtures):
+	context = fixtures.email_context()
+
+	def run():
+		fixtures.signup.send_billing_notifications(context)
+		del mail.outbox[:]
+
+	return run
+
+
+@benchmark('truncatesmart')
+def truncatesmart_filter(fixtures):
+	text = ' '.join(['Open access publishing for everyone.'] * 200)
+
+	def run():
+		truncatesmart(text, 400)
+
+	return run
+
+
+@benchmark('render.index')
+def render_index(fixtures):
+	request = fixtures.request()
+
+	def run():
+		views.index(request)
+
+	return run
+
+
+@benchmark('render.news')
+def render_news(fixtures):
+	request = fixtures.request('/news/')
+
+	def run():
+		views.news(request)
+
+	return run
+
+
+def export_benchmark(size):
+	def setup(fixtures):
+		fixtures.grow_access_log(size)
+		request = fixtures.factory.get('/', {'since': 0})
+
+		def run():
+			response = views.export_access_log(request, fixtures.export_code.uuid)
+			for _line in response.streaming_content:
+				pass
+
+		return run
+
+	return setup
+
+
+for size in EXPORT_SIZES:
+	benchmark('export_access_log.{}'.format(size))(export_benchmark(size))
+
+
+def load_baseline(path):
+	try:
+		with open(path) as baseline_file:
+			return json.load(baseline_file)
+	except FileNotFoundError:
+		return {}
+
+
+def save_baseline(path, results, baseline=None):
+	"""
+	Writes the median and fastest time per call and the spread of each
+	result to the baseline file, keeping any entries for benchmarks that
+	were not run.
+	"""
+	baseline = dict(baseline or {})
+	for result in results:
+		baseline[result.name] = {
+			'median': median(result),
+			'min': fastest(result),
+			'spread': spread(result),
+		}
+
+	with open(path, 'w') as baseline_file:
+		json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+
+
+def tolerance(entry, threshold):
+	"""
+	Returns the fraction slower than a baseline entry that counts as a
+	regression: threshold, or more when the baseline was noisier than that.
+	"""
+	return max(threshold, NOISE_MULTIPLE * entry.get('spread', 0))
+
+
+def find_regressions(results, baseline, threshold):
+	"""
+	Returns a Regression for each result whose fastest time per call is
+	slower than its baseline's by more than the tolerance. The fastest
+	repeat is compared because background load only ever adds time, so it
+	varies far less between runs than the median.
+	:param threshold: the smallest tolerance, 0.2 for 20%
+	"""
+	regressions = []
+	for result in results:
+		if result.name not in baseline:
+			continue
+		entry = baseline[result.name]
+		before = entry['min']
+		after = fastest(result)
+		allowed = tolerance(entry, threshold)
+		if after > before * (1 + allowed):
+			regressions.append(
+				Regression(result.name, before, after, after / before - 1, allowed),
+			)
+
+	return regressions
@@ -0,0 +1,72 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+
+
+MISSING = object()
+
+
+class LocalCache(object):
+	"""
+	A small cache held in the memory of each worker process.
+	Entries expire after `timeout_setting` seconds so that changes made by
+	other workers are eventually picked up; changes made in this worker
+	should be invalidated explicitly by calling clear() or delete().
+	At most `size_setting` entries are kept, the least recently used are
+	evicted first.
+	"""
+	def __init__(self, timeout_setting, default_timeout=60, size_setting=None,
+				 default_size=1000):
+		self.timeout_setting = timeout_setting
+		self.default_timeout = default_timeout
+		self.size_setting = size_setting
+		self.default_size = default_size
+		self._data = OrderedDict()
+		self._lock = Lock()
+
+	@property
+	def timeout(self):
+		return getattr(settings, self.timeout_setting, self.default_timeout)
+
+	@property
+	def max_size(self):
+		if self.size_setting is None:
+			return self.default_size
+		return getattr(settings, self.size_setting, self.default_size)
+
+	def get(self, key, default=MISSING):
+		with self._lock:
+			try:
+				expires, value = self._data[key]
+			except KeyError:
+				return default
+
+			if expires is not None and expires < monotonic():
+				del self._data[key]
+				return default
+
+			self._data.move_to_end(key)
+			return value
+
+	def set(self, key, value):
+		timeout = self.timeout
+		expires = monotonic() + timeout if timeout is not None else None
+		max_size = self.max_size
+		with self._lock:
+			self._data[key] = (expires, value)
+			self._data.move_to_end(key)
+			while len(self._data) > max_size:
+				self._data.popitem(last=False)
+
+	def delete(self, key):
+		with self._lock:
+			self._data.pop(key, None)
+
+	def clear(self):
+		with self._lock:
+			self._data.clear()
+
+	def __len__(self):
+		return len(self._data)
@@ -0,0 +1,40 @@
+from django.core.checks import Error, Tags, register
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+
+from signup import search
+
+
+SEARCH_MIGRATION = ('signup', '0035_signup_search_index')
+
+
+@register(Tags.database)
+def check_search_index(app_configs, databases=None, **kwargs):
+	"""
+	Reports search index triggers, tables or columns missing from a database
+	that has had them created. SQLite drops the triggers whenever its schema
+	editor rebuilds signup_signup, and searches then silently miss new and
+	changed signups.
+	"""
+	errors = []
+	for alias in databases or ():
+		connection = connections[alias]
+		if connection.vendor not in search.SEARCH_OBJECTS:
+			continue
+		recorder = MigrationRecorder(connection)
+		if not recorder.has_table() or \
+				SEARCH_MIGRATION not in recorder.applied_migrations():
+			continue
+
+		missing = search.missing_search_objects(connection)
+		if missing:
+			errors.append(Error(
+				'The signup search index on database {!r} is missing: '
+				'{}.'.format(alias, ', '.join(missing)),
+				hint='Recreate them with the SQL in migration {}, in a '
+					 'migration that runs after the one that rebuilt '
+					 'signup_signup.'.format(SEARCH_MIGRATION[1]),
+				id='signup.E001',
+			))
+
+	return errors
@@ -48,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'signup.middleware.MetricsMiddleware',
+    'signup.middleware.NPlusOneMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,6 +59,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 
     'signup.middleware.OrganisationMiddleware',
+    'signup.middleware.ProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'signup.urls'
@@ -152,4 +155,58 @@ X_FRAME_OPTIONS = 'SAMEORIGIN'
 
 PRIMARY_BASE_DOMAIN = 'http://localhost:8000/'
 FROM_ADDRESS = 'noreply@localhost'
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
\ No newline at end of file
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+# Seconds a worker keeps a host to Organisation lookup before rechecking,
+# and the most hosts it keeps.
+ORGANISATION_CACHE_TIMEOUT = 60
+ORGANISATION_CACHE_SIZE = 1000
+
+# Directory holding the pre-generated access log exports.
+ACCESS_LOG_SNAPSHOT_DIR = os.path.join(BASE_DIR, 'snapshots')
+
+# Seconds before a worker rebuilds an organisation's IP entitlement index
+# even if its export version has not changed, and the most addresses
+# accepted by one lookup request.
+ENTITLEMENT_INDEX_TIMEOUT = 300
+ENTITLEMENT_LOOKUP_BATCH_LIMIT = 1000
+
+# When enabled emails are queued in the OutboxMessage table and sent by
+# `manage.py send_outbox --loop` rather than during the request. When
+# disabled they are sent once the request's changes have been committed.
+EMAIL_OUTBOX = True
+EMAIL_OUTBOX_MAX_ATTEMPTS = 6
+EMAIL_TEMPLATE_CACHE_SIZE = 128
+
+# Seconds a worker keeps the notification recipients of an organisation.
+CONTACT_CACHE_TIMEOUT = 300
+
+# When enabled access changes are collected and `manage.py send_access_digests`
+# emails access managers one summary per window (in minutes).
+ACCESS_NOTIFICATION_DIGEST = False
+ACCESS_NOTIFICATION_DIGEST_WINDOW = 60
+
+# Changelists of large tables estimate their result count above this size.
+APPROXIMATE_COUNT_THRESHOLD = 10000
+
+# Bearer token that lets a Prometheus server read /metrics, which staff can
+# always see.
+METRICS_TOKEN = None
+
+# With several worker processes, set this to a directory they share so that
+# /metrics adds up all of them. Each worker writes its histograms there at
+# most every METRICS_FLUSH_INTERVAL seconds. Empty it when restarting the
+# deployment. Without it each worker serves its own, labelled by process.
+METRICS_DIR = None
+METRICS_FLUSH_INTERVAL = 5
+
+# Where profiles of requests made by staff with ?profile=1 are saved.
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+
+# NPlusOneMiddleware raises, or warns when set to 'warn', if one query shape
+# runs more than this many times in a request. Recording every query slows
+# requests down, so it only checks them when NPLUSONE_ENABLED is set, which
+# defaults to DEBUG. loadtest and benchmark turn it off.
+NPLUSONE_ENABLED = DEBUG
+NPLUSONE_THRESHOLD = 10
+NPLUSONE_ACTION = 'raise'
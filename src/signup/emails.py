@@ -0,0 +1,65 @@
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.template import Context, Template
+from django.template.defaultfilters import linebreaksbr
+from django.utils.html import strip_tags
+
+
+_templates = OrderedDict()
+_templates_lock = Lock()
+
+
+def compile_email_template(template_text):
+	"""
+	Returns a compiled Template for the text of an organisation's email
+	message. Compiled templates are kept in a per process LRU cache keyed by
+	a hash of their text, so an edited message simply gets a new entry.
+	:param template_text: the template source
+	:return: a django.template.Template
+	:raises TemplateSyntaxError: if the text is not a valid template
+	"""
+	key = hashlib.sha1(template_text.encode('utf-8')).hexdigest()
+
+	with _templates_lock:
+		template = _templates.get(key)
+		if template is not None:
+			_templates.move_to_end(key)
+			return template
+
+	template = Template(template_text)
+
+	with _templates_lock:
+		_templates[key] = template
+		while len(_templates) > getattr(
+			settings,
+			'EMAIL_TEMPLATE_CACHE_SIZE',
+			128,
+		):
+			_templates.popitem(last=False)
+
+	return template
+
+
+def render_email(context, template_text):
+	template = compile_email_template(template_text)
+	context['PRIMARY_BASE_DOMAIN'] = settings.PRIMARY_BASE_DOMAIN
+	html_content = template.render(Context(context))
+	return linebreaksbr(html_content)
+
+
+def build_email(to, subject, html, text=None):
+	if not type(to) in [list, tuple]:
+		to = [to]
+
+	msg = EmailMultiAlternatives(
+		subject,
+		text if text is not None else strip_tags(html),
+		settings.FROM_ADDRESS,
+		to,
+	)
+	msg.attach_alternative(html, "text/html")
+	return msg
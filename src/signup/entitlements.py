@@ -0,0 +1,197 @@
+import ipaddress
+from bisect import bisect_right
+from collections import namedtuple
+from threading import Lock
+
+from signup import models
+from signup.cache import LocalCache, MISSING
+from signup.ip_ranges import parse_ip_ranges
+
+
+Entitlement = namedtuple(
+	'Entitlement',
+	('signup_id', 'institution', 'package_id', 'package_name'),
+)
+
+ENTITLEMENT_FIELDS = (
+	'pk',
+	'institution',
+	'package_id',
+	'package__name',
+	'access_ip_range',
+)
+
+index_cache = LocalCache('ENTITLEMENT_INDEX_TIMEOUT')
+
+
+def granted_signups(organisation_id):
+	return models.SignUp.objects.filter(
+		package__organisation_id=organisation_id,
+		access_status='grant',
+	)
+
+
+class EntitlementIndex(object):
+	"""
+	Answers which granted signups cover an IP address. The IP ranges of
+	every granted signup are swept into sorted, non overlapping segments
+	each holding the entitlements that cover it, so a lookup is a single
+	binary search. Signups can be replaced one at a time with update(), the
+	segments are then recompiled on the next lookup without touching the
+	database. version is the AccessLogExportVersion of the organisation the
+	entries are current for.
+	"""
+	def __init__(self, rows=(), version=0):
+		self.version = version
+		self._lock = Lock()
+		self._entries = {}
+		self._compiled = None
+		for row in rows:
+			self._add(row)
+
+	def _add(self, row):
+		signup_id, institution, package_id, package_name, ip_range = row
+		intervals = parse_ip_ranges(ip_range)
+		if intervals:
+			self._entries[signup_id] = (
+				Entitlement(signup_id, institution, package_id, package_name),
+				intervals,
+			)
+
+	def update(self, signup_id, row=None):
+		"""
+		Replaces the entry for a signup.
+		:param signup_id: the pk of the SignUp
+		:param row: its ENTITLEMENT_FIELDS values, or None if the signup
+		no longer has access
+		"""
+		with self._lock:
+			self._entries.pop(signup_id, None)
+			if row:
+				self._add(row)
+			self._compiled = None
+
+	def _compile(self):
+		with self._lock:
+			if self._compiled is not None:
+				return self._compiled
+
+			events = {4: [], 6: []}
+			for entitlement, intervals in self._entries.values():
+				for interval in intervals:
+					events[interval.version].append(
+						(interval.start, 1, entitlement),
+					)
+					events[interval.version].append(
+						(interval.end + 1, -1, entitlement),
+					)
+
+			compiled = {}
+			for version, version_events in events.items():
+				version_events.sort(key=lambda event: event[0])
+				starts, values, active = [], [], {}
+				for position, change, entitlement in version_events:
+					count = active.get(entitlement, 0) + change
+					if count:
+						active[entitlement] = count
+					else:
+						active.pop(entitlement, None)
+
+					value = tuple(active)
+					if starts and starts[-1] == position:
+						values[-1] = value
+					else:
+						starts.append(position)
+						values.append(value)
+				compiled[version] = (starts, values)
+
+			self._compiled = compiled
+			return compiled
+
+	def lookup(self, ip):
+		"""
+		Returns the entitlements covering an IP address.
+		:param ip: an IPv4Address, IPv6Address or address string
+		:return: a tuple of Entitlement
+		"""
+		if isinstance(ip, str):
+			ip = ipaddress.ip_address(ip)
+
+		starts, values = self._compile()[ip.version]
+		position = bisect_right(starts, int(ip)) - 1
+		if position < 0:
+			return ()
+
+		return values[position]
+
+
+def lookup_result(index, ip):
+	"""
+	Looks up an address and returns a dict ready to be serialised as JSON.
+	"""
+	try:
+		found = index.lookup(ip)
+	except ValueError:
+		return {
+			'ip': ip,
+			'entitled': False,
+			'error': 'Invalid IP address',
+		}
+
+	return {
+		'ip': ip,
+		'entitled': bool(found),
+		'entitlements': [
+			{
+				'signup': entitlement.signup_id,
+				'institution': entitlement.institution,
+				'package': entitlement.package_id,
+				'package_name': entitlement.package_name,
+			} for entitlement in found
+		],
+	}
+
+
+def get_index(organisation_id):
+	"""
+	Returns the EntitlementIndex for an organisation, building it from the
+	current grant state if this worker has not got one cached or the
+	organisation's export version has moved on since it was built, which
+	every change made by any worker does.
+	"""
+	version = models.AccessLogExportVersion.current(organisation_id)
+	index = index_cache.get(organisation_id)
+
+	if index is MISSING or index.version != version:
+		index = EntitlementIndex(
+			granted_signups(organisation_id).values_list(
+				*ENTITLEMENT_FIELDS,
+			).iterator(),
+			version=version,
+		)
+		index_cache.set(organisation_id, index)
+
+	return index
+
+
+def update_signups(organisation_id, signup_ids, version):
+	"""
+	Refreshes the entries for some signups in the cached index of an
+	organisation, if this worker holds one and the change that bumped the
+	export version to version is the only one it has missed. Otherwise the
+	index is left to be rebuilt by the next lookup.
+	"""
+	index = index_cache.get(organisation_id, None)
+	if index is None or index.version != version - 1:
+		return
+
+	rows = {
+		row[0]: row for row in granted_signups(organisation_id).filter(
+			pk__in=signup_ids,
+		).values_list(
+			*ENTITLEMENT_FIELDS,
+		)
+	}
+	for signup_id in signup_ids:
+		index.update(signup_id, rows.get(signup_id))
+	index.version = version
@@ -0,0 +1,253 @@
+import csv
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from signup import models
+
+
+class Echo(object):
+	"""
+	A file-like object that returns what is written to it, so csv.writer can
+	be used to build the rows of a StreamingHttpResponse.
+	"""
+	def write(self, value):
+		return value
+
+
+ACCESS_LOG_EXPORT_HEADERS = [
+	'Institution',
+	'Address',
+	'Tech Contact',
+	'Package',
+	'Date',
+	'Grant or Revoke',
+	'Email Address',
+	'Phone Number',
+	'IP Range',
+	'Existing Customer?',
+	'Payment Handler',
+]
+
+ACCESS_LOG_EXPORT_COLUMNS = (
+	'signup__institution',
+	'signup__address',
+	'signup__technical_contact',
+	'signup__package__name',
+	'date_stamp',
+	'access_type',
+	'signup__email_address',
+	'signup__phone_number',
+	'ip_range',
+	'signup__existing_customer',
+	'payment_handler',
+)
+
+
+def organisation_access_logs(organisation_id):
+	return models.AccessLog.objects.filter(
+		signup__package__organisation_id=organisation_id,
+	)
+
+
+def access_log_csv_rows(log_entries, chunk_size=2000):
+	"""
+	Yields the CSV lines of an access log export. Signup and package columns
+	are joined in the same query and rows are fetched from the database in
+	chunks so memory use does not grow with the size of the log.
+	:param log_entries: an AccessLog queryset
+	:param chunk_size: number of rows fetched from the database at a time
+	"""
+	writer = csv.writer(Echo())
+	yield writer.writerow(ACCESS_LOG_EXPORT_HEADERS)
+
+	rows = log_entries.values_list(
+		*ACCESS_LOG_EXPORT_COLUMNS,
+	).iterator(
+		chunk_size=chunk_size,
+	)
+	for row in rows:
+		yield writer.writerow(row)
+
+
+class Snapshot(object):
+	"""
+	A complete access log export for an organisation, written to disk from
+	a version of its AccessLogExportVersion.
+	"""
+	def __init__(self, path, etag, cursor, version):
+		self.path = path
+		self.etag = etag
+		self.cursor = cursor
+		self.version = version
+
+	def open(self):
+		return open(self.path, 'rb')
+
+
+def snapshot_dir():
+	return getattr(
+		settings,
+		'ACCESS_LOG_SNAPSHOT_DIR',
+		os.path.join(settings.BASE_DIR, 'snapshots'),
+	)
+
+
+def snapshot_meta_path(organisation_id):
+	return os.path.join(
+		snapshot_dir(),
+		'access_log_{}.json'.format(organisation_id),
+	)
+
+
+def read_snapshot(organisation_id):
+	"""
+	Returns the latest Snapshot written for an organisation, which may be
+	stale, or None if one has not been written yet.
+	"""
+	try:
+		with open(snapshot_meta_path(organisation_id)) as meta_file:
+			meta = json.load(meta_file)
+	except (FileNotFoundError, ValueError):
+		return None
+
+	return Snapshot(
+		os.path.join(snapshot_dir(), meta['file']),
+		meta['etag'],
+		meta['cursor'],
+		meta.get('version', -1),
+	)
+
+
+@contextmanager
+def snapshot_lock(organisation_id, blocking=True):
+	"""
+	Holds an exclusive lock on an organisation's snapshot files, shared by
+	every process using the snapshot directory. Yields whether the lock was
+	taken, which is only False when not blocking and another process holds
+	it.
+	"""
+	directory = snapshot_dir()
+	os.makedirs(directory, exist_ok=True)
+	lock_path = os.path.join(
+		directory,
+		'access_log_{}.lock'.format(organisation_id),
+	)
+	operation = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+	with open(lock_path, 'a') as lock_file:
+		try:
+			fcntl.flock(lock_file, operation)
+		except BlockingIOError:
+			yield False
+			return
+
+		try:
+			yield True
+		finally:
+			fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _write_snapshot(organisation_id, version=None):
+	"""
+	Writes an organisation's export and publishes it by atomically renaming
+	its metadata file into place, unless a snapshot of a newer version has
+	been published meanwhile. version must have been read before any of the
+	entries. Files of replaced snapshots and of writers
+	that did not finish are removed. Must be called holding snapshot_lock.
+	"""
+	directory = snapshot_dir()
+	prefix = 'access_log_{}_'.format(organisation_id)
+
+	# Read before the entries, so changes committed while writing leave the
+	# snapshot stale rather than marked as including them.
+	if version is None:
+		version = models.AccessLogExportVersion.current(organisation_id)
+	log_entries = organisation_access_logs(organisation_id).filter(
+		export_sequence__lte=version,
+	)
+
+	digest = hashlib.sha256()
+	fd, temp_path = tempfile.mkstemp(dir=directory, prefix=prefix, suffix='.tmp')
+	try:
+		with os.fdopen(fd, 'w', newline='', encoding='utf-8') as snapshot_file:
+			for line in access_log_csv_rows(log_entries):
+				snapshot_file.write(line)
+				digest.update(line.encode('utf-8'))
+
+		etag = digest.hexdigest()
+		file_name = '{}{}.csv'.format(prefix, etag[:16])
+		os.replace(temp_path, os.path.join(directory, file_name))
+	except BaseException:
+		os.remove(temp_path)
+		raise
+
+	previous = read_snapshot(organisation_id)
+	if previous and previous.version > version:
+		if previous.path != os.path.join(directory, file_name):
+			os.remove(os.path.join(directory, file_name))
+		return previous
+
+	meta = {
+		'file': file_name,
+		'etag': etag,
+		'cursor': version,
+		'version': version,
+	}
+	fd, temp_meta_path = tempfile.mkstemp(dir=directory, prefix=prefix, suffix='.tmp')
+	with os.fdopen(fd, 'w') as meta_file:
+		json.dump(meta, meta_file)
+	os.replace(temp_meta_path, snapshot_meta_path(organisation_id))
+
+	for name in os.listdir(directory):
+		if name.startswith(prefix) and name != file_name:
+			try:
+				os.remove(os.path.join(directory, name))
+			except FileNotFoundError:
+				pass
+
+	return read_snapshot(organisation_id)
+
+
+def write_snapshot(organisation_id):
+	"""
+	Writes a full access log export for an organisation to disk.
+	:param organisation_id: the pk of an Organisation
+	:return: the new Snapshot
+	"""
+	with snapshot_lock(organisation_id):
+		return _write_snapshot(organisation_id)
+
+
+def get_snapshot(organisation_id):
+	"""
+	Returns an up to date Snapshot for an organisation. A missing or stale
+	snapshot is rebuilt by the first reader. While it is, other readers of a
+	stale snapshot are served the previous one, with its own ETag and
+	cursor, and only readers of a missing one wait.
+	"""
+	snapshot = read_snapshot(organisation_id)
+	version = models.AccessLogExportVersion.current(organisation_id)
+	if snapshot and snapshot.version >= version:
+		return snapshot
+
+	with snapshot_lock(organisation_id, blocking=snapshot is None) as locked:
+		if not locked:
+			return read_snapshot(organisation_id) or snapshot
+
+		# Another process may have rebuilt it while we waited.
+		snapshot = read_snapshot(organisation_id)
+		if snapshot and snapshot.version >= version:
+			return snapshot
+		return _write_snapshot(organisation_id, version)
+
+
+def is_stale(organisation_id):
+	snapshot = read_snapshot(organisation_id)
+	return snapshot is None or (
+		snapshot.version < models.AccessLogExportVersion.current(organisation_id)
+	)
@@ -1,6 +1,23 @@
 from django import forms
+from django.template import TemplateSyntaxError
 
 from signup import models
+from signup.emails import compile_email_template
+from signup.ip_ranges import invalid_ip_ranges
+
+
+def clean_ip_range(ip_range):
+	"""
+	Rejects IP range text with parts that are not an address, CIDR block,
+	start-end range or IPv4 wildcard pattern, as they would not grant any
+	access.
+	"""
+	invalid = invalid_ip_ranges(ip_range)
+	if invalid:
+		raise forms.ValidationError(
+			'Not an IP address or range: {}'.format(', '.join(invalid)),
+		)
+	return ip_range
 
 
 class SignupStart(forms.Form):
@@ -57,6 +74,9 @@ class AccessLogForm(forms.ModelForm):
 		self.request = kwargs.pop('request')
 		super().__init__(*args, **kwargs)
 
+	def clean_ip_range(self):
+		return clean_ip_range(self.cleaned_data['ip_range'])
+
 	def save(self, commit=True):
 		access_log = super(AccessLogForm, self).save(commit=False)
 		access_log.user = self.request.user
@@ -67,3 +87,99 @@ class AccessLogForm(forms.ModelForm):
 		return access_log
 
 
+class BulkAccessForm(forms.Form):
+	ip_range = forms.CharField(
+		required=False,
+		widget=forms.Textarea,
+		help_text="Leave blank to keep each signup's current IP range.",
+	)
+	payment_handler = forms.CharField(
+		required=False,
+		widget=forms.Textarea,
+	)
+
+	def clean_ip_range(self):
+		return clean_ip_range(self.cleaned_data['ip_range'])
+
+
+class AccessLogExportFilterForm(forms.Form):
+	since = forms.IntegerField(
+		required=False,
+		min_value=0,
+		help_text='Only return entries created or edited after this cursor, '
+				  'as returned in the X-Next-Cursor header of a previous '
+				  'export. Deletions and changes to signups or packages are '
+				  'only reflected in the full export.',
+	)
+	package = forms.IntegerField(
+		required=False,
+	)
+	access_type = forms.ChoiceField(
+		required=False,
+		choices=models.access_choices(),
+	)
+	date_from = forms.DateTimeField(
+		required=False,
+	)
+	date_to = forms.DateTimeField(
+		required=False,
+	)
+
+	def filter(self, log_entries):
+		"""
+		Applies the cleaned filters to an AccessLog queryset. When a cursor
+		is given entries are ordered by export_sequence, which is handed out
+		in commit order, so that neither entries entered with a back dated
+		date_stamp nor entries committed out of pk order are skipped.
+		:param log_entries: an AccessLog queryset
+		:return: the filtered queryset
+		"""
+		data = self.cleaned_data
+
+		if data.get('package'):
+			log_entries = log_entries.filter(signup__package_id=data['package'])
+		if data.get('access_type'):
+			log_entries = log_entries.filter(access_type=data['access_type'])
+		if data.get('date_from'):
+			log_entries = log_entries.filter(date_stamp__gte=data['date_from'])
+		if data.get('date_to'):
+			log_entries = log_entries.filter(date_stamp__lte=data['date_to'])
+		if data.get('since') is not None:
+			log_entries = log_entries.filter(
+				export_sequence__gt=data['since'],
+			).order_by(
+				'export_sequence',
+				'pk',
+			)
+
+		return log_entries
+
+
+class OrganisationForm(forms.ModelForm):
+	"""
+	Checks that the email messages are valid templates. Compiling them here
+	also puts them in the email template cache ready for the next send.
+	"""
+	template_fields = (
+		'billing_manager_message',
+		'institution_message',
+		'access_manager_message',
+	)
+
+	class Meta:
+		model = models.Organisation
+		fields = '__all__'
+
+	def clean(self):
+		cleaned_data = super().clean()
+
+		for field in self.template_fields:
+			template_text = cleaned_data.get(field)
+			if not template_text:
+				continue
+			try:
+				compile_email_template(template_text)
+			except TemplateSyntaxError as e:
+				self.add_error(field, 'Template error: {}'.format(e))
+
+		return cleaned_data
@@ -0,0 +1,186 @@
+import heapq
+import ipaddress
+import re
+from collections import namedtuple
+from itertools import product
+
+
+IPInterval = namedtuple('IPInterval', ('version', 'start', 'end'))
+
+# Cap on the number of intervals a single wildcard pattern such as
+# 10.*.5.* may expand to.
+MAX_PATTERN_INTERVALS = 65536
+
+_separators = re.compile(r'[\s,;]+')
+_range_dash = re.compile(r'\s*-\s*')
+_octet = re.compile(r'[0-9]{1,3}')
+
+
+def _ipv4_pattern_intervals(token):
+	"""
+	Expands IPv4 patterns where each octet is a number, a range such as
+	1-50 or a * wildcard, eg. 192.168.*.* or 10.0.1.1-50. Missing trailing
+	octets are treated as wildcards, so 192.168.* is the same as 192.168.*.*
+	The first octet must be a number followed by a dot, so that text such as
+	12-34 or a lone * is not read as a pattern covering whole /8 blocks.
+	"""
+	parts = token.split('.')
+	if not 2 <= len(parts) <= 4 or '*' not in token and '-' not in token:
+		return None
+	if not _octet.fullmatch(parts[0]):
+		return None
+	parts += ['*'] * (4 - len(parts))
+
+	octets = []
+	for part in parts:
+		if part == '*':
+			octets.append((0, 255))
+			continue
+		bounds = part.split('-')
+		if len(bounds) > 2 or not all(_octet.fullmatch(b) for b in bounds):
+			return None
+		low, high = int(bounds[0]), int(bounds[-1])
+		if not 0 <= low <= high <= 255:
+			return None
+		octets.append((low, high))
+
+	# Octets after the last partial one are full wildcards, so each
+	# combination of the preceding octets gives one contiguous interval.
+	last = max(
+		[i for i, octet in enumerate(octets) if octet != (0, 255)] or [0]
+	)
+	prefixes = [range(low, high + 1) for low, high in octets[:last]]
+	count = 1
+	for prefix in prefixes:
+		count *= len(prefix)
+	if count > MAX_PATTERN_INTERVALS:
+		return None
+
+	tail_bits = 8 * (3 - last)
+	low, high = octets[last]
+	intervals = []
+	for prefix in product(*prefixes):
+		base = 0
+		for octet in prefix:
+			base = (base << 8) | octet
+		base <<= 8 * (4 - last)
+		intervals.append(IPInterval(
+			4,
+			base | (low << tail_bits),
+			base | (high << tail_bits) | ((1 << tail_bits) - 1),
+		))
+
+	return intervals
+
+
+def _token_intervals(token):
+	try:
+		network = ipaddress.ip_network(token, strict=False)
+		return [IPInterval(
+			network.version,
+			int(network.network_address),
+			int(network.broadcast_address),
+		)]
+	except ValueError:
+		pass
+
+	if token.count('-') == 1:
+		start, end = token.split('-')
+		try:
+			start, end = ipaddress.ip_address(start), ipaddress.ip_address(end)
+		except ValueError:
+			pass
+		else:
+			if start.version == end.version and start <= end:
+				return [IPInterval(start.version, int(start), int(end))]
+			return None
+
+	return _ipv4_pattern_intervals(token)
+
+
+def tokenise(text):
+	if not text:
+		return []
+
+	return [t for t in _separators.split(_range_dash.sub('-', text)) if t]
+
+
+def parse_ip_ranges(text):
+	"""
+	Parses the free text of an AccessLog.ip_range into intervals.
+	Addresses, CIDR blocks, start-end ranges and IPv4 wildcard patterns
+	separated by whitespace, commas or semicolons are understood. Anything
+	else is ignored, use invalid_ip_ranges() to find it.
+	:param text: the ip_range text
+	:return: a list of IPInterval
+	"""
+	intervals = []
+	for token in tokenise(text):
+		intervals.extend(_token_intervals(token) or [])
+
+	return intervals
+
+
+def invalid_ip_ranges(text):
+	"""
+	Returns the parts of an ip_range text that parse_ip_ranges() ignores.
+	"""
+	return [t for t in tokenise(text) if not _token_intervals(t)]
+
+
+def format_ip(version, value):
+	if version == 4:
+		return str(ipaddress.IPv4Address(value))
+
+	return str(ipaddress.IPv6Address(value))
+
+
+def encode_ip(value):
+	"""
+	Encodes an integer address as fixed width hex. Unlike an integer column
+	this holds IPv6 addresses on every database while sorting the same way.
+	"""
+	return format(value, '032x')
+
+
+def decode_ip(value):
+	return int(value, 16)
+
+
+def find_overlaps(ranges):
+	"""
+	Finds pairs of ranges that overlap and belong to different owners by
+	sweeping through them in address order, keeping only the ranges that
+	are still open at each start point, rather than comparing every pair.
+	:param ranges: an iterable of (IPInterval, owner, item) where owner is
+	any hashable identifying who the range belongs to
+	:return: a list of (item, other_item, overlap IPInterval)
+	"""
+	overlaps = []
+	ordered = sorted(
+		ranges,
+		key=lambda r: (r[0].version, r[0].start),
+	)
+
+	version, open_ranges = None, []
+	for position, (interval, owner, item) in enumerate(ordered):
+		if interval.version != version:
+			version, open_ranges = interval.version, []
+
+		while open_ranges and open_ranges[0][0] < interval.start:
+			heapq.heappop(open_ranges)
+
+		for end, _position, other_owner, other_item in open_ranges:
+			if other_owner != owner:
+				overlaps.append((
+					other_item,
+					item,
+					IPInterval(version, interval.start, min(end, interval.end)),
+				))
+
+		heapq.heappush(
+			open_ranges,
+			(interval.end, position, owner, item),
+		)
+
+	return overlaps
@@ -0,0 +1,117 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from signup import benchmarks
+
+
+class Command(BaseCommand):
+	help = 'Times the hot paths against generated data in a throwaway test ' \
+		   'database and compares them with a stored baseline.'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--baseline',
+			default=os.path.join(settings.BASE_DIR, 'benchmark_baseline.json'),
+		)
+		parser.add_argument(
+			'--save',
+			action='store_true',
+			help='Record these results as the new baseline.',
+		)
+		parser.add_argument(
+			'--threshold',
+			type=float,
+			default=0.2,
+			help='Fraction slower than the fastest baseline time that counts '
+				 'as a regression, 0.2 by default. Benchmarks whose baseline '
+				 'was noisier allow {} times its spread instead.'.format(
+				benchmarks.NOISE_MULTIPLE,
+			),
+		)
+		parser.add_argument(
+			'--repeat',
+			type=int,
+			default=10,
+		)
+		parser.add_argument(
+			'--filter',
+			action='append',
+			default=[],
+			help='Only run benchmarks whose name contains this text. Can be '
+				 'given more than once.',
+		)
+
+	def handle(self, *args, **options):
+		names = [
+			name for name in benchmarks.BENCHMARKS
+			if not options['filter'] or any(
+				text in name for text in options['filter']
+			)
+		]
+
+		old_name = connection.settings_dict['NAME']
+		connection.creation.create_test_db(verbosity=0, autoclobber=True)
+		try:
+			# Debug query logging, the N+1 query detector and real email
+			# would distort the timings.
+			with override_settings(
+				DEBUG=False,
+				EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+				EMAIL_OUTBOX=False,
+				NPLUSONE_ENABLED=False,
+			):
+				results = self.run_benchmarks(names, options['repeat'])
+		finally:
+			connection.creation.destroy_test_db(old_name, verbosity=0)
+
+		baseline = benchmarks.load_baseline(options['baseline'])
+		regressions = {
+			regression.name: regression
+			for regression in benchmarks.find_regressions(
+				results,
+				baseline,
+				options['threshold'],
+			)
+		}
+
+		for result in results:
+			line = '{:<40} {:>12.4f} ms {:>6.1%} spread'.format(
+				result.name,
+				benchmarks.fastest(result) * 1000,
+				benchmarks.spread(result),
+			)
+			entry = baseline.get(result.name)
+			if entry:
+				line += ' {:>+8.1%} against {:.4f} ms (allowed {:+.0%})'.format(
+					benchmarks.fastest(result) / entry['min'] - 1,
+					entry['min'] * 1000,
+					benchmarks.tolerance(entry, options['threshold']),
+				)
+			if result.name in regressions:
+				line += '  REGRESSION'
+			self.stdout.write(line)
+
+		if options['save']:
+			benchmarks.save_baseline(options['baseline'], results, baseline)
+			self.stdout.write('Saved baseline to {}'.format(options['baseline']))
+		elif regressions:
+			raise CommandError(
+				'{} benchmark(s) are slower than the baseline by more than '
+				'the allowed tolerance: {}'.format(
+					len(regressions),
+					', '.join(sorted(regressions)),
+				)
+			)
+
+	def run_benchmarks(self, names, repeat):
+		fixtures = benchmarks.Fixtures()
+		results = []
+		for name in names:
+			func = benchmarks.BENCHMARKS[name](fixtures)
+			results.append(benchmarks.run_benchmark(name, func, repeat))
+			self.stderr.write('Ran {}'.format(name))
+		return results
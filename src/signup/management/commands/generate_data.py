@@ -0,0 +1,400 @@
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from install.countries import COUNTRY_CHOICES
+from signup import models
+
+
+INSTITUTION_FORMS = (
+	'University of {place}',
+	'{place} University',
+	'{place} College',
+	'{place} Institute of Technology',
+	'Royal {place} Academy',
+	'{place} Public Library',
+	'{place} School of Medicine',
+	'National Library of {place}',
+)
+
+PLACES = (
+	'Aberdeen', 'Amsterdam', 'Auckland', 'Barcelona', 'Bergen', 'Bologna',
+	'Boston', 'Bristol', 'Cambridge', 'Cape Town', 'Chicago', 'Coimbra',
+	'Copenhagen', 'Delft', 'Dublin', 'Durham', 'Edinburgh', 'Ghent',
+	'Glasgow', 'Graz', 'Heidelberg', 'Helsinki', 'Kyoto', 'Leeds', 'Leiden',
+	'Lisbon', 'London', 'Lund', 'Lyon', 'Madrid', 'Melbourne', 'Milan',
+	'Montreal', 'Munich', 'Nairobi', 'Oslo', 'Otago', 'Oxford', 'Padua',
+	'Prague', 'Quebec', 'Salamanca', 'Santiago', 'Seoul', 'Sheffield',
+	'Stockholm', 'Sydney', 'Toronto', 'Uppsala', 'Utrecht', 'Vienna',
+	'Warsaw', 'Wellington', 'York', 'Zurich',
+)
+
+FIRST_NAMES = (
+	'Alex', 'Ana', 'Ben', 'Chloe', 'Daniel', 'Eva', 'Farah', 'George',
+	'Hana', 'Ivan', 'Jane', 'Kofi', 'Lena', 'Mateo', 'Nadia', 'Omar',
+	'Priya', 'Quinn', 'Rosa', 'Sam', 'Tomas', 'Uma', 'Victor', 'Wei',
+)
+
+LAST_NAMES = (
+	'Andersen', 'Bauer', 'Chen', 'Dubois', 'Evans', 'Fischer', 'Garcia',
+	'Hughes', 'Ito', 'Jensen', 'Khan', 'Larsen', 'Martin', 'Nowak',
+	'Okafor', 'Patel', 'Rossi', 'Silva', 'Tanaka', 'Urban', 'Varga',
+	'Williams', 'Young', 'Zhang',
+)
+
+BANDING_TIERS = (
+	('Small', Decimal('500.00')),
+	('Medium', Decimal('1500.00')),
+	('Large', Decimal('3000.00')),
+	('Consortium', Decimal('7500.00')),
+)
+
+# Generated history starts here rather than now so that a seed always
+# gives the same data.
+HISTORY_START = datetime(2018, 1, 1, tzinfo=timezone.utc)
+
+
+def random_ip_range(rng):
+	"""
+	Returns the kind of ip_range text institutions send in: mostly CIDR
+	blocks and single addresses, with some start-end ranges, wildcard
+	patterns and IPv6 blocks, often several per entry.
+	"""
+	parts = []
+	for _ in range(rng.choice((1, 1, 1, 2, 3))):
+		a, b, c = rng.randint(1, 223), rng.randint(0, 255), rng.randint(0, 255)
+		kind = rng.random()
+		if kind < 0.45:
+			prefix = rng.choice((16, 20, 22, 24, 24, 24, 26, 28))
+			parts.append('{}.{}.{}.0/{}'.format(a, b, c, prefix))
+		elif kind < 0.65:
+			parts.append('{}.{}.{}.{}'.format(a, b, c, rng.randint(1, 254)))
+		elif kind < 0.8:
+			low = rng.randint(1, 200)
+			parts.append('{}.{}.{}.{}-{}.{}.{}.{}'.format(
+				a, b, c, low, a, b, c, rng.randint(low, 254),
+			))
+		elif kind < 0.92:
+			parts.append('{}.{}.*.*'.format(a, b))
+		else:
+			parts.append('2001:db8:{:x}::/48'.format(rng.randint(0, 0xffff)))
+
+	return ', '.join(parts)
+
+
+class Command(BaseCommand):
+	help = 'Fills the database with generated organisations, packages, ' \
+		   'bandings, contacts, signups and access log histories for load ' \
+		   'and scale testing. The same seed always gives the same data.'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--organisations',
+			type=int,
+			default=1,
+		)
+		parser.add_argument(
+			'--packages',
+			type=int,
+			default=5,
+			help='Packages per organisation.',
+		)
+		parser.add_argument(
+			'--bandings-per-country',
+			type=int,
+			default=3,
+			help='Price bands per country for each organisation, up to {}.'.format(
+				len(BANDING_TIERS),
+			),
+		)
+		parser.add_argument(
+			'--contacts',
+			type=int,
+			default=10,
+			help='Billing and access contacts per organisation.',
+		)
+		parser.add_argument(
+			'--signups',
+			type=int,
+			default=10000,
+			help='Signups per organisation.',
+		)
+		parser.add_argument(
+			'--access-logs',
+			type=int,
+			default=4,
+			help='Average number of access log entries per signup.',
+		)
+		parser.add_argument(
+			'--seed',
+			type=int,
+			default=1,
+		)
+		parser.add_argument(
+			'--batch-size',
+			type=int,
+			default=5000,
+		)
+
+	def handle(self, *args, **options):
+		self.rng = random.Random(options['seed'])
+		self.batch_size = options['batch_size']
+
+		countries = self.create_countries()
+		existing = models.Organisation.objects.count()
+
+		for number in range(existing, existing + options['organisations']):
+			with transaction.atomic():
+				organisation = self.create_organisation(number)
+				packages = self.create_packages(
+					organisation,
+					options['packages'],
+				)
+				bandings = self.create_bandings(
+					organisation,
+					countries,
+					options['bandings_per_country'],
+				)
+				self.create_contacts(
+					organisation,
+					countries,
+					options['contacts'],
+				)
+				export_code = models.AccessLogExportCode.objects.create(
+					organisation=organisation,
+					issued_to='Generated platform',
+				)
+
+			self.create_signups(
+				packages,
+				bandings,
+				options['signups'],
+				options['access_logs'],
+			)
+
+			self.stdout.write(
+				'Generated organisation {} on {} with export code {}'.format(
+					organisation.pk,
+					organisation.domain,
+					export_code.uuid,
+				)
+			)
+
+		self.reset_sequences()
+
+	def create_countries(self):
+		existing = set(models.Country.objects.values_list('code', flat=True))
+		models.Country.objects.bulk_create([
+			models.Country(code=code, name=name)
+			for code, name in COUNTRY_CHOICES if code not in existing
+		])
+		return list(models.Country.objects.order_by('code'))
+
+	def create_organisation(self, number):
+		place = PLACES[number % len(PLACES)]
+		return models.Organisation.objects.create(
+			name='{} Open Access Consortium {}'.format(place, number),
+			domain='org{}.localhost'.format(number),
+			image='generated/logo.png',
+			address_one='{} Press House'.format(number),
+			address_two=place,
+			post_code='GE{} 1RA'.format(number % 100),
+			hero_card_one_image='generated/hero.png',
+			hero_card_two_image='generated/hero.png',
+			hero_card_three_image='generated/hero.png',
+			institution_message='Thank you for supporting {{ signup.package }}.',
+			billing_manager_message='New signup from {{ signup.institution }}.',
+			access_manager_message='Access has changed for {{ signup.institution }}.',
+		)
+
+	def create_packages(self, organisation, count):
+		models.Package.objects.bulk_create([
+			models.Package(
+				organisation=organisation,
+				name='{} Package {}'.format(organisation.address_two, number),
+				image='generated/package.png',
+				items='<ul><li>Collection {}</li></ul>'.format(number),
+				front_page=number < 3,
+				hidden=number == count - 1 and count > 3,
+				order=number,
+			) for number in range(count)
+		])
+		return list(organisation.package_set.filter(hidden=False))
+
+	def create_bandings(self, organisation, countries, per_country):
+		tiers = BANDING_TIERS[:per_country]
+		bandings = [
+			models.Banding(
+				organisation=organisation,
+				name='{} ({})'.format(tier, country.code),
+				price=(
+					price * Decimal(self.rng.choice(('0.5', '0.8', '1', '1.2')))
+				).quantize(Decimal('0.01')),
+				currency=self.rng.choice(('GBP', 'EUR', 'USD')),
+				country=country,
+			) for country in countries for tier, price in tiers
+		] + [
+			models.Banding(
+				organisation=organisation,
+				name='{} (default)'.format(tier),
+				price=price,
+				currency='GBP',
+				country=None,
+			) for tier, price in tiers
+		]
+		models.Banding.objects.bulk_create(bandings, batch_size=self.batch_size)
+		return list(organisation.banding_set.all())
+
+	def create_contacts(self, organisation, countries, count):
+		models.Contact.objects.bulk_create([
+			models.Contact(
+				organisation=organisation,
+				name='{} {}'.format(
+					self.rng.choice(FIRST_NAMES),
+					self.rng.choice(LAST_NAMES),
+				),
+				email='contact{}@org{}.example.org'.format(number, organisation.pk),
+				contact_type=('billing', 'access')[number % 2],
+				country=self.rng.choice(countries) if number % 3 == 2 else None,
+			) for number in range(count)
+		])
+
+	def next_id(self, model):
+		return (model.objects.aggregate(Max('pk'))['pk__max'] or 0) + 1
+
+	def create_signups(self, packages, bandings, count, access_logs):
+		"""
+		Creates signups with their access log histories one batch at a time,
+		then brings the derived access state and IP ranges up to date.
+		Primary keys are assigned here so that log entries can refer to
+		signups without reading them back.
+		"""
+		created = logged = 0
+		while created < count:
+			size = min(self.batch_size, count - created)
+			with transaction.atomic():
+				first_id = self.next_id(models.SignUp)
+				signups = [
+					self.build_signup(first_id + offset, packages, bandings)
+					for offset in range(size)
+				]
+				models.SignUp.objects.bulk_create(
+					signups,
+					batch_size=self.batch_size,
+				)
+
+				log_id = self.next_id(models.AccessLog)
+				access_log_entries = []
+				for signup in signups:
+					for access_log in self.build_history(signup, access_logs):
+						access_log.pk = access_log.export_sequence = log_id
+						log_id += 1
+						access_log_entries.append(access_log)
+				models.AccessLog.objects.bulk_create(
+					access_log_entries,
+					batch_size=self.batch_size,
+				)
+				# Exports list entries up to the organisation's version.
+				models.AccessLogExportVersion.objects.update_or_create(
+					organisation_id=packages[0].organisation_id,
+					defaults={'version': log_id - 1},
+				)
+
+				models.AccessLogIPRange.objects.bulk_create(
+					[
+						ip_range for access_log in access_log_entries
+						for ip_range in models.AccessLogIPRange.from_access_log(
+							access_log,
+						)
+					],
+					batch_size=self.batch_size,
+				)
+				models.update_access_state(
+					models.SignUp.objects.filter(
+						pk__gte=first_id,
+					).values('pk'),
+				)
+
+			created += size
+			logged += len(access_log_entries)
+			self.stdout.write(
+				'{} of {} signups, {} access log entries'.format(
+					created,
+					count,
+					logged,
+				)
+			)
+
+	def build_signup(self, pk, packages, bandings):
+		rng = self.rng
+		place = rng.choice(PLACES)
+		first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+		institution = rng.choice(INSTITUTION_FORMS).format(place=place)
+		domain = '{}{}.ac.example'.format(place.lower().replace(' ', ''), pk)
+		return models.SignUp(
+			pk=pk,
+			first_name=first_name,
+			last_name=last_name,
+			email_address='{}.{}@{}'.format(
+				first_name.lower(),
+				last_name.lower(),
+				domain,
+			),
+			institution=institution,
+			phone_number='+44 {:010d}'.format(rng.randint(0, 10 ** 10 - 1)),
+			address='{} Library Road\n{}'.format(rng.randint(1, 400), place),
+			post_code='{}{} {}AB'.format(
+				place[:2].upper(),
+				rng.randint(1, 99),
+				rng.randint(1, 9),
+			),
+			banding=rng.choice(bandings),
+			package=rng.choice(packages),
+			technical_contact='it-support@{}'.format(domain),
+			existing_customer=rng.random() < 0.3,
+		)
+
+	def build_history(self, signup, average):
+		"""
+		Returns unsaved AccessLog entries alternating between grants and
+		revokes, starting with a grant, spread over the years after the
+		history start.
+		"""
+		rng = self.rng
+		count = rng.randint(1, max(1, 2 * average - 1))
+		date_stamp = HISTORY_START + timedelta(minutes=rng.randint(0, 525600))
+		ip_range = random_ip_range(rng)
+
+		history = []
+		for number in range(count):
+			grant = number % 2 == 0
+			if grant and rng.random() < 0.3:
+				ip_range = random_ip_range(rng)
+			history.append(models.AccessLog(
+				signup=signup,
+				access_type='grant' if grant else 'revoke',
+				date_stamp=date_stamp,
+				ip_range=ip_range,
+				payment_handler=rng.choice((None, 'Invoice', 'Card', 'Agent')),
+			))
+			date_stamp += timedelta(minutes=rng.randint(60, 262800))
+
+		return history
+
+	def reset_sequences(self):
+		# Primary keys were assigned explicitly, so databases with sequences
+		# must be told where to continue from.
+		statements = connection.ops.sequence_reset_sql(
+			no_style(),
+			[models.SignUp, models.AccessLog],
+		)
+		if statements:
+			with connection.cursor() as cursor:
+				for sql in statements:
+					cursor.execute(sql)
@@ -0,0 +1,369 @@
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import (
+	HTTPCookieProcessor,
+	HTTPRedirectHandler,
+	Request,
+	build_opener,
+)
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import (
+	ThreadedWSGIServer,
+	WSGIRequestHandler,
+	get_internal_wsgi_application,
+)
+from django.db import connection
+from django.shortcuts import reverse
+from django.test.utils import override_settings
+
+from signup import models
+
+
+_csrf_token = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+	def log_message(self, format, *args):
+		pass
+
+
+class NoRedirectHandler(HTTPRedirectHandler):
+	"""
+	Returns redirects as responses so each step of the funnel is timed on
+	its own.
+	"""
+	def redirect_request(self, req, fp, code, msg, headers, newurl):
+		return None
+
+
+def percentile(ordered, percent):
+	"""
+	Returns the nearest rank percentile of a sorted list.
+	"""
+	if not ordered:
+		return None
+
+	rank = max(1, math.ceil(percent / 100 * len(ordered)))
+	return ordered[rank - 1]
+
+
+class Results(object):
+	"""
+	Collects the latency and outcome of every request, by URL name.
+	"""
+	def __init__(self):
+		self._lock = threading.Lock()
+		self.latencies = defaultdict(list)
+		self.errors = defaultdict(int)
+
+	def add(self, name, seconds, ok):
+		with self._lock:
+			self.latencies[name].append(seconds)
+			if not ok:
+				self.errors[name] += 1
+
+	def summary(self, elapsed):
+		def summarise(latencies, errors):
+			ordered = sorted(latencies)
+			return {
+				'requests': len(ordered),
+				'errors': errors,
+				'error_rate': round(errors / len(ordered), 4) if ordered else 0,
+				'throughput': round(len(ordered) / elapsed, 2),
+				'p50_ms': round(percentile(ordered, 50) * 1000, 2) if ordered else None,
+				'p95_ms': round(percentile(ordered, 95) * 1000, 2) if ordered else None,
+				'p99_ms': round(percentile(ordered, 99) * 1000, 2) if ordered else None,
+			}
+
+		with self._lock:
+			urls = {
+				name: summarise(latencies, self.errors[name])
+				for name, latencies in sorted(self.latencies.items())
+			}
+			everything = [
+				latency for latencies in self.latencies.values()
+				for latency in latencies
+			]
+			total = summarise(everything, sum(self.errors.values()))
+
+		return {'urls': urls, 'total': total}
+
+
+class Client(object):
+	"""
+	A browser-like client with its own cookies, sending requests for one
+	organisation's host to the server under test.
+	"""
+	def __init__(self, base_url, host, results, timeout):
+		self.base_url = base_url
+		self.host = host
+		self.results = results
+		self.timeout = timeout
+		self.opener = build_opener(
+			HTTPCookieProcessor(CookieJar()),
+			NoRedirectHandler(),
+		)
+
+	def request(self, name, path, data=None, headers=None):
+		request = Request(
+			self.base_url + path,
+			data=urlencode(data).encode('utf-8') if data is not None else None,
+			headers={'Host': self.host, **(headers or {})},
+		)
+
+		start = time.perf_counter()
+		try:
+			with self.opener.open(request, timeout=self.timeout) as response:
+				status, body = response.status, response.read()
+		except HTTPError as e:
+			status, body = e.code, e.read()
+		except OSError:
+			status, body = None, b''
+
+		self.results.add(
+			name,
+			time.perf_counter() - start,
+			status is not None and status < 400,
+		)
+		return status, body.decode('utf-8', 'replace')
+
+
+class Command(BaseCommand):
+	help = 'Drives the signup funnel and the access log export with ' \
+		   'concurrent clients against a local threaded WSGI server and ' \
+		   'reports latency percentiles, throughput and error rates per URL ' \
+		   'as JSON. Signups made during the run are saved to the database.'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--clients',
+			type=int,
+			default=10,
+			help='Clients working through the signup funnel.',
+		)
+		parser.add_argument(
+			'--export-clients',
+			type=int,
+			default=1,
+			help='Clients downloading the access log export at the same time.',
+		)
+		parser.add_argument(
+			'--duration',
+			type=float,
+			default=30,
+			help='Seconds to run for.',
+		)
+		parser.add_argument(
+			'--organisation',
+			type=int,
+			help='The pk of the organisation to sign up to. Defaults to the '
+				 'first organisation with a package and an export code.',
+		)
+		parser.add_argument(
+			'--url',
+			help='Test a server that is already running at this address, '
+				 'eg. http://127.0.0.1:8000, instead of starting one.',
+		)
+		parser.add_argument(
+			'--port',
+			type=int,
+			default=0,
+			help='Port for the local server. Any free port by default.',
+		)
+		parser.add_argument(
+			'--timeout',
+			type=float,
+			default=30,
+		)
+		parser.add_argument(
+			'--seed',
+			type=int,
+			default=1,
+		)
+		parser.add_argument(
+			'--output',
+			help='Write the JSON report to this file as well as stdout.',
+		)
+
+	def handle(self, *args, **options):
+		self.plan = self.funnel_plan(options['organisation'])
+		results = Results()
+
+		server = None
+		base_url = options['url']
+		if not base_url:
+			server = ThreadedWSGIServer(
+				('127.0.0.1', options['port']),
+				QuietRequestHandler,
+			)
+			server.set_app(get_internal_wsgi_application())
+			threading.Thread(target=server.serve_forever, daemon=True).start()
+			base_url = 'http://127.0.0.1:{}'.format(server.server_port)
+
+		# Emails sent by completed signups are kept in memory rather than
+		# going to the configured backend or piling up in the outbox, and the
+		# N+1 query detector would distort the timings.
+		with override_settings(
+			EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+			EMAIL_OUTBOX=False,
+			NPLUSONE_ENABLED=False,
+		):
+			elapsed = self.run_clients(base_url, results, options)
+
+		if server:
+			server.shutdown()
+			server.server_close()
+
+		report = {
+			'base_url': base_url,
+			'host': self.plan['host'],
+			'clients': options['clients'],
+			'export_clients': options['export_clients'],
+			'duration': round(elapsed, 2),
+			**results.summary(elapsed),
+		}
+		output = json.dumps(report, indent=2)
+		if options['output']:
+			with open(options['output'], 'w') as output_file:
+				output_file.write(output)
+		self.stdout.write(output)
+
+	def funnel_plan(self, organisation_id):
+		"""
+		Finds the packages, countries and bandings the clients can choose
+		from, reading them once before any load is applied.
+		"""
+		organisations = models.Organisation.objects.filter(
+			package__hidden=False,
+			accesslogexportcode__active=True,
+		)
+		if organisation_id:
+			organisations = organisations.filter(pk=organisation_id)
+		organisation = organisations.order_by('pk').first()
+		if organisation is None:
+			raise CommandError(
+				'No organisation with a visible package and an active '
+				'export code was found. Try manage.py generate_data.'
+			)
+
+		bandings = list(
+			models.Banding.objects.filter(
+				organisation=organisation,
+				country__isnull=False,
+			).values_list(
+				'country__code',
+				'pk',
+			)
+		)
+		if not bandings:
+			raise CommandError('The organisation has no country bandings.')
+
+		plan = {
+			'host': organisation.domain,
+			'packages': list(
+				organisation.package_set.filter(
+					hidden=False,
+				).values_list(
+					'pk',
+					flat=True,
+				)
+			),
+			'bandings': bandings,
+			'export_uuid': organisation.accesslogexportcode_set.filter(
+				active=True,
+			).values_list(
+				'uuid',
+				flat=True,
+			).first(),
+		}
+		connection.close()
+		return plan
+
+	def run_clients(self, base_url, results, options):
+		deadline = time.monotonic() + options['duration']
+		threads = [
+			threading.Thread(
+				target=self.signup_client,
+				args=(
+					Client(base_url, self.plan['host'], results, options['timeout']),
+					random.Random(options['seed'] + number),
+					deadline,
+				),
+			) for number in range(options['clients'])
+		] + [
+			threading.Thread(
+				target=self.export_client,
+				args=(
+					Client(base_url, self.plan['host'], results, options['timeout']),
+					deadline,
+				),
+			) for number in range(options['export_clients'])
+		]
+
+		start = time.perf_counter()
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		return time.perf_counter() - start
+
+	def signup_client(self, client, rng, deadline):
+		number = 0
+		while time.monotonic() < deadline:
+			package_id = rng.choice(self.plan['packages'])
+			country_code, banding_id = rng.choice(self.plan['bandings'])
+
+			client.request('index', reverse('index'))
+			client.request('package', reverse('package', args=[package_id]))
+			client.request(
+				'signup_start',
+				reverse('signup_start', args=[package_id]),
+			)
+			client.request(
+				'signup_banding',
+				reverse('signup_banding', kwargs={
+					'package_id': package_id,
+					'country_code': country_code,
+				}),
+			)
+
+			signup_data = reverse('signup_data', kwargs={
+				'package_id': package_id,
+				'country_code': country_code,
+				'banding_id': banding_id,
+			})
+			_status, body = client.request('signup_data', signup_data)
+			token = _csrf_token.search(body)
+			number += 1
+			client.request(
+				'signup_data_post',
+				signup_data,
+				data={
+					'csrfmiddlewaretoken': token.group(1) if token else '',
+					'first_name': 'Load',
+					'last_name': 'Test',
+					'email_address': 'loadtest{}@example.org'.format(number),
+					'institution': 'Load Test University {}'.format(number),
+					'address': '{} Benchmark Road'.format(number),
+					'post_code': 'LT1 1ST',
+					'technical_contact': 'it@example.org',
+				},
+			)
+			client.request('signup_thanks', reverse('signup_thanks'))
+
+	def export_client(self, client, deadline):
+		export = reverse(
+			'export_access_log',
+			args=[self.plan['export_uuid']],
+		)
+		while time.monotonic() < deadline:
+			client.request('export_access_log', export)
@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from signup import models
+
+
+class Command(BaseCommand):
+	help = 'Replays the access log and rebuilds the current access state ' \
+		   'stored on each SignUp.'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--verify',
+			action='store_true',
+			help='Report signups whose stored state is wrong without fixing '
+				 'them. Exits with an error if any are found.',
+		)
+		parser.add_argument(
+			'--batch-size',
+			type=int,
+			default=1000,
+		)
+
+	def handle(self, *args, **options):
+		replayed = {}
+		log_entries = models.AccessLog.objects.order_by(
+			'signup_id',
+			'date_stamp',
+			'pk',
+		).values_list(
+			'signup_id',
+			'access_type',
+			'date_stamp',
+			'ip_range',
+		).iterator(
+			chunk_size=options['batch_size'],
+		)
+		for signup_id, access_type, date_stamp, ip_range in log_entries:
+			replayed[signup_id] = (access_type, date_stamp, ip_range)
+
+		wrong = []
+		signups = models.SignUp.objects.only(
+			'access_status',
+			'access_status_date',
+			'access_ip_range',
+		).iterator(
+			chunk_size=options['batch_size'],
+		)
+		for signup in signups:
+			state = replayed.get(signup.pk, (None, None, None))
+			stored = (
+				signup.access_status,
+				signup.access_status_date,
+				signup.access_ip_range,
+			)
+			if stored != state:
+				(
+					signup.access_status,
+					signup.access_status_date,
+					signup.access_ip_range,
+				) = state
+				wrong.append(signup)
+
+		if options['verify']:
+			for signup in wrong:
+				self.stderr.write(
+					'SignUp {} has incorrect access state.'.format(signup.pk)
+				)
+			if wrong:
+				raise CommandError(
+					'{} signups have incorrect access state.'.format(len(wrong))
+				)
+			self.stdout.write('Access state is correct for all signups.')
+			return
+
+		models.SignUp.objects.bulk_update(
+			wrong,
+			['access_status', 'access_status_date', 'access_ip_range'],
+			batch_size=options['batch_size'],
+		)
+		self.stdout.write(
+			'Rebuilt access state for {} signups.'.format(len(wrong))
+		)
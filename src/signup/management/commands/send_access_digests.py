@@ -0,0 +1,70 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Min
+from django.utils import timezone
+
+from signup import models
+
+
+class Command(BaseCommand):
+	help = 'Sends access managers one email summarising the access ' \
+		   'changes recorded since their last digest.'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--window',
+			type=int,
+			default=getattr(settings, 'ACCESS_NOTIFICATION_DIGEST_WINDOW', 60),
+			help='Minutes to collect changes for before sending a digest, '
+				 'counted from the oldest unsent change.',
+		)
+		parser.add_argument(
+			'--force',
+			action='store_true',
+			help='Send every pending digest now.',
+		)
+
+	def handle(self, *args, **options):
+		now = timezone.now()
+		cutoff = now - timedelta(minutes=options['window'])
+		pending = models.AccessNotification.objects.filter(sent__isnull=True)
+
+		organisation_ids = pending.values(
+			'organisation_id',
+		).annotate(
+			oldest=Min('created'),
+		).order_by()
+		if not options['force']:
+			organisation_ids = organisation_ids.filter(oldest__lte=cutoff)
+
+		for row in organisation_ids:
+			notifications = list(
+				pending.filter(
+					organisation_id=row['organisation_id'],
+					created__lte=now,
+				).select_related(
+					'signup__package',
+				)
+			)
+			changes = models.collapse_access_changes(
+				[notification.as_change() for notification in notifications],
+			)
+			sent = models.send_access_changes(
+				row['organisation_id'],
+				changes,
+			)
+			models.AccessNotification.objects.filter(
+				pk__in=[notification.pk for notification in notifications],
+			).update(
+				sent=now,
+			)
+			self.stdout.write(
+				'Organisation {}: {} changes, {} collapsed, {} emails.'.format(
+					row['organisation_id'],
+					len(notifications),
+					len(notifications) - len(changes),
+					sent,
+				)
+			)
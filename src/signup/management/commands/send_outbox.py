@@ -0,0 +1,123 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from signup import models
+
+
+class Command(BaseCommand):
+	help = 'Sends queued emails from the outbox in batches over one ' \
+		   'connection, retrying failures with an exponential backoff.'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--batch-size',
+			type=int,
+			default=50,
+		)
+		parser.add_argument(
+			'--max-attempts',
+			type=int,
+			default=getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 6),
+			help='Messages that fail this many times are marked dead.',
+		)
+		parser.add_argument(
+			'--backoff',
+			type=int,
+			default=60,
+			help='Seconds to wait before the first retry. Each further '
+				 'retry waits twice as long as the one before.',
+		)
+		parser.add_argument(
+			'--loop',
+			action='store_true',
+			help='Keep running, polling the outbox every --interval seconds.',
+		)
+		parser.add_argument(
+			'--interval',
+			type=float,
+			default=5,
+		)
+
+	def handle(self, *args, **options):
+		while True:
+			# A full batch means more messages may be due.
+			while self.send_batch(
+				options['batch_size'],
+				options['max_attempts'],
+				options['backoff'],
+			) == options['batch_size']:
+				pass
+
+			if not options['loop']:
+				return
+			time.sleep(options['interval'])
+
+	def send_batch(self, batch_size, max_attempts, backoff):
+		"""
+		Sends one batch of due messages.
+		:return: the number of messages attempted
+		"""
+		with transaction.atomic():
+			messages = list(
+				models.OutboxMessage.objects.select_for_update(
+					skip_locked=True,
+				).filter(
+					status='pending',
+					next_attempt__lte=timezone.now(),
+				)[:batch_size]
+			)
+			if not messages:
+				return 0
+
+			connection = get_connection()
+			try:
+				connection.open()
+			except Exception as e:
+				for message in messages:
+					self.failed(message, e, max_attempts, backoff)
+			else:
+				for message in messages:
+					try:
+						connection.send_messages([message.as_email(connection)])
+					except Exception as e:
+						self.failed(message, e, max_attempts, backoff)
+					else:
+						message.status = 'sent'
+						message.sent = timezone.now()
+						message.attempts += 1
+				connection.close()
+
+			models.OutboxMessage.objects.bulk_update(
+				messages,
+				['status', 'sent', 'attempts', 'next_attempt', 'last_error'],
+			)
+
+		sent = sum(1 for message in messages if message.status == 'sent')
+		self.stdout.write(
+			'Sent {} of {} messages.'.format(sent, len(messages))
+		)
+		return len(messages)
+
+	def failed(self, message, error, max_attempts, backoff):
+		message.attempts += 1
+		message.last_error = repr(error)
+
+		if message.attempts >= max_attempts:
+			message.status = 'dead'
+			self.stderr.write(
+				'Giving up on message {} after {} attempts: {}'.format(
+					message.pk,
+					message.attempts,
+					message.last_error,
+				)
+			)
+		else:
+			message.next_attempt = timezone.now() + timedelta(
+				seconds=backoff * 2 ** (message.attempts - 1),
+			)
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from signup import models, exports
+
+
+class Command(BaseCommand):
+	help = 'Writes the pre-generated access log export for each organisation ' \
+		   'whose snapshot is missing or stale. Exports rebuild stale ' \
+		   'snapshots on read, run this after changes to keep that off the ' \
+		   'request path.'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--organisation',
+			type=int,
+			help='Only write the snapshot for the organisation with this pk.',
+		)
+		parser.add_argument(
+			'--force',
+			action='store_true',
+			help='Rewrite snapshots that are up to date too.',
+		)
+
+	def handle(self, *args, **options):
+		organisations = models.Organisation.objects.all()
+		if options['organisation']:
+			organisations = organisations.filter(pk=options['organisation'])
+
+		for organisation_id in organisations.values_list('pk', flat=True):
+			if not options['force'] and not exports.is_stale(organisation_id):
+				self.stdout.write(
+					'Organisation {} is up to date'.format(organisation_id),
+				)
+				continue
+
+			snapshot = exports.write_snapshot(organisation_id)
+			self.stdout.write(
+				'Wrote {} ({} entries up to cursor {})'.format(
+					snapshot.path,
+					exports.organisation_access_logs(
+						organisation_id,
+					).filter(
+						export_sequence__lte=snapshot.cursor,
+					).count(),
+					snapshot.cursor,
+				)
+			)
@@ -0,0 +1,329 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.template.base import Template
+
+
+DURATION_BUCKETS = (
+	0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_BUCKETS = (
+	1, 2, 5, 10, 20, 50, 100, 200, 500, 1000,
+)
+
+
+class Histogram(object):
+	"""
+	A Prometheus style histogram with one series per set of label values.
+	Values are aggregated in this process; see render_metrics() for how the
+	workers of a deployment are combined.
+	"""
+	def __init__(self, name, help_text, label_names, buckets):
+		self.name = name
+		self.help_text = help_text
+		self.label_names = label_names
+		self.buckets = buckets
+		self._lock = threading.Lock()
+		self._series = defaultdict(self.empty_series)
+
+	def empty_series(self):
+		return {'counts': [0] * len(self.buckets), 'sum': 0, 'count': 0}
+
+	def observe(self, labels, value):
+		with self._lock:
+			series = self._series[labels]
+			position = bisect_left(self.buckets, value)
+			if position < len(self.buckets):
+				series['counts'][position] += 1
+			series['sum'] += value
+			series['count'] += 1
+
+	def clear(self):
+		with self._lock:
+			self._series.clear()
+
+	def series(self):
+		"""
+		Returns a copy of the values of this process by label values.
+		"""
+		with self._lock:
+			return {
+				labels: {
+					'counts': list(values['counts']),
+					'sum': values['sum'],
+					'count': values['count'],
+				} for labels, values in self._series.items()
+			}
+
+	def merge(self, *series):
+		"""
+		Adds up the series of several processes.
+		"""
+		merged = defaultdict(self.empty_series)
+		for process_series in series:
+			for labels, values in process_series.items():
+				total = merged[labels]
+				total['counts'] = [
+					a + b for a, b in zip(total['counts'], values['counts'])
+				]
+				total['sum'] += values['sum']
+				total['count'] += values['count']
+		return merged
+
+	def render(self, series=None, extra_labels=()):
+		"""
+		:param series: the values to render, this process's by default
+		:param extra_labels: (name, value) pairs added to every series
+		"""
+		if series is None:
+			series = self.series()
+
+		lines = [
+			'# HELP {} {}'.format(self.name, self.help_text),
+			'# TYPE {} histogram'.format(self.name),
+		]
+		for labels, values in sorted(series.items()):
+			label_text = ','.join(
+				'{}="{}"'.format(name, escape_label(value))
+				for name, value in list(zip(self.label_names, labels)) +
+				list(extra_labels)
+			)
+			cumulative = 0
+			for bucket, count in zip(self.buckets, values['counts']):
+				cumulative += count
+				lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+					self.name, label_text, bucket, cumulative,
+				))
+			lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(
+				self.name, label_text, values['count'],
+			))
+			lines.append('{}_sum{{{}}} {}'.format(
+				self.name, label_text, values['sum'],
+			))
+			lines.append('{}_count{{{}}} {}'.format(
+				self.name, label_text, values['count'],
+			))
+
+		return '\n'.join(lines)
+
+
+def escape_label(value):
+	return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+LABELS = ('view', 'organisation')
+
+request_duration = Histogram(
+	'signup_request_duration_seconds',
+	'Time taken to respond to a request.',
+	LABELS,
+	DURATION_BUCKETS,
+)
+db_duration = Histogram(
+	'signup_request_db_duration_seconds',
+	'Time spent running database queries per request.',
+	LABELS,
+	DURATION_BUCKETS,
+)
+db_queries = Histogram(
+	'signup_request_db_queries',
+	'Database queries run per request.',
+	LABELS,
+	QUERY_BUCKETS,
+)
+template_duration = Histogram(
+	'signup_request_template_duration_seconds',
+	'Time spent rendering templates per request.',
+	LABELS,
+	DURATION_BUCKETS,
+)
+
+HISTOGRAMS = (
+	request_duration,
+	db_duration,
+	db_queries,
+	template_duration,
+)
+
+
+def metrics_dir():
+	return getattr(settings, 'METRICS_DIR', None)
+
+
+def process_label():
+	return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+class ProcessFile(object):
+	"""
+	The file in METRICS_DIR this process publishes its histograms to. Its
+	name is unique to the process, even when a pid is reused, so a new
+	worker never replaces the totals of one that has exited.
+	"""
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._pid = None
+		self._name = None
+		self._flushed = 0
+
+	def name(self):
+		if self._pid != os.getpid():
+			# A new process, or a worker forked from a preloaded one.
+			self._pid = os.getpid()
+			self._name = 'metrics_{}_{}.json'.format(
+				self._pid,
+				uuid.uuid4().hex[:12],
+			)
+			self._flushed = 0
+		return self._name
+
+	def flush(self, force=False):
+		"""
+		Writes the histograms of this process, at most once every
+		METRICS_FLUSH_INTERVAL seconds unless forced.
+		"""
+		directory = metrics_dir()
+		if not directory:
+			return
+
+		interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+		with self._lock:
+			name = self.name()
+			now = time.monotonic()
+			if not force and now - self._flushed < interval:
+				return
+			self._flushed = now
+
+			data = {
+				histogram.name: [
+					[list(labels), values]
+					for labels, values in histogram.series().items()
+				] for histogram in HISTOGRAMS
+			}
+			os.makedirs(directory, exist_ok=True)
+			fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+			with os.fdopen(fd, 'w') as temp_file:
+				json.dump(data, temp_file)
+			os.replace(temp_path, os.path.join(directory, name))
+
+
+process_file = ProcessFile()
+
+
+def read_process_files():
+	"""
+	Returns the series published by every process to METRICS_DIR, as a
+	list of {histogram name: series} dicts.
+	"""
+	directory = metrics_dir()
+	published = []
+	for name in sorted(os.listdir(directory)):
+		if not (name.startswith('metrics_') and name.endswith('.json')):
+			continue
+		try:
+			with open(os.path.join(directory, name)) as metrics_file:
+				data = json.load(metrics_file)
+		except (FileNotFoundError, ValueError):
+			continue
+		published.append({
+			histogram_name: {
+				tuple(labels): values for labels, values in series
+			} for histogram_name, series in data.items()
+		})
+	return published
+
+
+def render_metrics():
+	"""
+	Returns every histogram in the Prometheus text exposition format.
+
+	With METRICS_DIR set, every worker publishes its histograms there and
+	they are added up, so any worker can answer a scrape for the whole
+	deployment. The files of workers that have exited are still counted,
+	so totals never go down; empty the directory when the deployment is
+	restarted. Without it, only this worker's histograms are served, with
+	a process label so that series from different workers are not mixed.
+	"""
+	if not metrics_dir():
+		extra_labels = (('process', process_label()),)
+		return '\n'.join(
+			histogram.render(extra_labels=extra_labels)
+			for histogram in HISTOGRAMS
+		) + '\n'
+
+	process_file.flush(force=True)
+	published = read_process_files()
+	return '\n'.join(
+		histogram.render(histogram.merge(*[
+			process_series.get(histogram.name, {})
+			for process_series in published
+		]))
+		for histogram in HISTOGRAMS
+	) + '\n'
+
+
+class RequestTimings(object):
+	"""
+	Collects the database and template timings of one request. Use its
+	query() as a database execute wrapper.
+	"""
+	def __init__(self):
+		self.queries = 0
+		self.db_duration = 0
+		self.template_duration = 0
+
+	def query(self, execute, sql, params, many, context):
+		start = time.perf_counter()
+		try:
+			return execute(sql, params, many, context)
+		finally:
+			self.queries += 1
+			self.db_duration += time.perf_counter() - start
+
+
+_local = threading.local()
+_template_timer_lock = threading.Lock()
+_template_timer_installed = False
+
+
+def set_request_timings(timings):
+	_local.timings = timings
+	_local.depth = 0
+
+
+def install_template_timer():
+	"""
+	Wraps Template.render so the time spent rendering the outermost template
+	of each render is added to the RequestTimings of the current thread.
+	"""
+	global _template_timer_installed
+
+	with _template_timer_lock:
+		if _template_timer_installed:
+			return
+		_template_timer_installed = True
+
+	render = Template.render
+
+	def timed_render(self, context):
+		timings = getattr(_local, 'timings', None)
+		if timings is None or _local.depth:
+			return render(self, context)
+
+		_local.depth += 1
+		start = time.perf_counter()
+		try:
+			return render(self, context)
+		finally:
+			timings.template_duration += time.perf_counter() - start
+			_local.depth -= 1
+
+	Template.render = timed_render
@@ -1,8 +1,83 @@
-from django.shortcuts import get_object_or_404, reverse
+import os
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.shortcuts import reverse
 from django.http import Http404
-from django.http.request import split_domain_port
+from django.http.request import split_domain_port, validate_host
+
+from signup import metrics, models, nplusone
+from signup.profiling import RequestProfile
+from signup.cache import LocalCache, MISSING
+
+
+organisation_cache = LocalCache(
+    'ORGANISATION_CACHE_TIMEOUT',
+    size_setting='ORGANISATION_CACHE_SIZE',
+)
+
+
+def normalise_host(host):
+    """
+    Lower cases a host and removes any trailing dot so that equivalent hosts
+    share a single cache entry.
+    :param host: the value of request.get_host()
+    :return: the normalised host, including any port
+    """
+    return host.lower().rstrip('.')
+
+
+def get_organisation_for_host(host):
+    """
+    Returns the Organisation for a host, trying the host with its port first
+    and then the bare domain. Only the columns listed in
+    ORGANISATION_REQUEST_FIELDS are loaded, the remaining text fields are
+    fetched on first access. Results are cached per worker process. Misses
+    are only cached for hosts matching an ALLOWED_HOSTS entry other than *,
+    so arbitrary Host headers cannot fill the cache.
+    :param host: the value of request.get_host()
+    :return: an Organisation object or None
+    """
+    host = normalise_host(host)
+    organisation = organisation_cache.get(host)
+
+    if organisation is MISSING:
+        domain, _port = split_domain_port(host)
+        candidates = {
+            o.domain.lower(): o for o in models.Organisation.objects.filter(
+                domain__in={host, domain},
+            ).only(
+                *models.ORGANISATION_REQUEST_FIELDS,
+            )
+        }
+        organisation = candidates.get(host) or candidates.get(domain)
+        if organisation or is_explicitly_allowed(domain):
+            organisation_cache.set(host, organisation)
+
+    return organisation
+
 
-from signup import models
+def is_explicitly_allowed(domain):
+    """
+    Returns True when a domain matches one of the ALLOWED_HOSTS patterns,
+    not counting a * wildcard that allows every host.
+    """
+    return validate_host(
+        domain,
+        [host for host in settings.ALLOWED_HOSTS if host != '*'],
+    )
+
+
+def wrappable_stream(response):
+    """
+    Whether a response's content is streamed through Python and can be
+    wrapped. A FileResponse of a real file is left alone so the server can
+    send it with wsgi.file_wrapper, which a wrapped generator would prevent.
+    """
+    return response.streaming and \
+        getattr(response, 'file_to_stream', None) is None
 
 
 class BaseMiddleware(object):
@@ -14,21 +89,23 @@ class BaseMiddleware(object):
 
 
 class OrganisationMiddleware(BaseMiddleware):
+    _exempt_paths = None
+
+    @property
+    def exempt_paths(self):
+        if self._exempt_paths is None:
+            self._exempt_paths = (
+                reverse('admin:index'),
+                '/summernote',
+                reverse('metrics'),
+            )
+        return self._exempt_paths
+
     def process_view(self, request, view_func, view_args, view_kwargs):
-        if request.path.startswith(reverse('admin:index')) or request.path.startswith('/summernote'):
+        if request.path.startswith(self.exempt_paths):
             return None
 
-        domain = request.get_host()
-        try:
-            organisation = models.Organisation.objects.get(
-                domain=domain,
-            )
-        except models.Organisation.DoesNotExist:
-            domain, _port = split_domain_port(domain)
-            organisation = get_object_or_404(
-                models.Organisation,
-                domain=domain,
-            )
+        organisation = get_organisation_for_host(request.get_host())
 
         if not organisation:
             raise Http404
@@ -36,5 +113,148 @@ class OrganisationMiddleware(BaseMiddleware):
         request.organisation = organisation
 
 
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Measures the total time, database queries and template rendering of
+    each request. The figures are sent back in a Server-Timing header and
+    added to the histograms served by the metrics view, labelled with the
+    URL name and organisation domain.
+
+    The headers of a streaming response go out before its content, so its
+    Server-Timing covers the view only and says so with desc="before
+    streaming". Its histograms are observed once the content has been sent
+    and include the time and queries spent streaming, except for files
+    handed to the server, which are observed straight away.
+    """
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        metrics.install_template_timer()
 
+    def __call__(self, request):
+        timings = metrics.RequestTimings()
+        metrics.set_request_timings(timings)
+        start = time.perf_counter()
+        try:
+            with self.time_queries(timings):
+                response = self.get_response(request)
+        finally:
+            metrics.set_request_timings(None)
+        duration = time.perf_counter() - start
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        organisation = getattr(request, 'organisation', None)
+        labels = (
+            resolver_match.url_name or '' if resolver_match else 'unresolved',
+            organisation.domain if organisation else '',
+        )
+
+        total = 'total;dur={:.2f}'.format(duration * 1000)
+        if response.streaming:
+            total += ';desc="before streaming"'
+        response['Server-Timing'] = ', '.join([
+            'db;dur={:.2f};desc="{} queries"'.format(
+                timings.db_duration * 1000,
+                timings.queries,
+            ),
+            'tpl;dur={:.2f}'.format(timings.template_duration * 1000),
+            total,
+        ])
+
+        if wrappable_stream(response):
+            response.streaming_content = self.stream(
+                response.streaming_content,
+                timings,
+                start,
+                labels,
+            )
+        else:
+            self.observe(labels, timings, duration)
+        return response
+
+    def time_queries(self, timings):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timings.query))
+        return stack
+
+    def stream(self, content, timings, start, labels):
+        try:
+            with self.time_queries(timings):
+                yield from content
+        finally:
+            self.observe(labels, timings, time.perf_counter() - start)
+
+    def observe(self, labels, timings, duration):
+        metrics.request_duration.observe(labels, duration)
+        metrics.db_duration.observe(labels, timings.db_duration)
+        metrics.db_queries.observe(labels, timings.queries)
+        metrics.template_duration.observe(labels, timings.template_duration)
+        metrics.process_file.flush()
+
+
+class ProfilerMiddleware(BaseMiddleware):
+    """
+    Runs the view under cProfile when a staff user adds ?profile=1 or sends
+    an X-Profile: 1 header, saving the profile to PROFILE_DIR. Streaming
+    responses are profiled until their content has been sent. Must come
+    after OrganisationMiddleware so it calls the view last.
+    """
+    def wants_profile(self, request):
+        if not request.user.is_staff:
+            return False
+
+        return '1' in (
+            request.GET.get('profile'),
+            request.META.get('HTTP_X_PROFILE'),
+        )
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self.wants_profile(request):
+            return None
+
+        # Views such as admin changelists reject unknown parameters.
+        if 'profile' in request.GET:
+            request.GET = request.GET.copy()
+            del request.GET['profile']
+
+        profile = RequestProfile(request)
+        profile.start()
+        try:
+            response = profile.call(
+                view_func,
+                request,
+                *view_args,
+                **view_kwargs
+            )
+        except Exception:
+            profile.save()
+            raise
+
+        if wrappable_stream(response):
+            response.streaming_content = profile.stream(
+                response.streaming_content,
+            )
+        else:
+            if hasattr(response, 'render') and callable(response.render):
+                profile.call(response.render)
+            response['X-Profile'] = os.path.basename(profile.save())
+        return response
+
+
+class NPlusOneMiddleware(BaseMiddleware):
+    """
+    Records the queries of each request and raises an NPlusOneError, or
+    warns when NPLUSONE_ACTION is 'warn', if one query shape runs more than
+    NPLUSONE_THRESHOLD times. The message points at the template line or
+    code that made the queries. For development and tests only, and does
+    nothing unless NPLUSONE_ENABLED, or DEBUG when that is not set, is on.
+    """
+    def __call__(self, request):
+        if not getattr(settings, 'NPLUSONE_ENABLED', settings.DEBUG):
+            return self.get_response(request)
 
+        with nplusone.detect_n_plus_one(
+            action=getattr(settings, 'NPLUSONE_ACTION', 'raise'),
+            label=request.path,
+        ):
+            return self.get_response(request)
@@ -0,0 +1,46 @@
+# Generated by Django 3.1.1 on 2026-10-18 12:14
+
+from django.db import migrations, models
+
+
+def populate_access_state(apps, schema_editor):
+    SignUp = apps.get_model('signup', 'SignUp')
+    AccessLog = apps.get_model('signup', 'AccessLog')
+    db_alias = schema_editor.connection.alias
+
+    def latest(field):
+        return AccessLog.objects.using(db_alias).filter(
+            signup=models.OuterRef('pk'),
+        ).order_by('-date_stamp', '-pk').values(field)[:1]
+
+    SignUp.objects.using(db_alias).update(
+        access_status=models.Subquery(latest('access_type')),
+        access_status_date=models.Subquery(latest('date_stamp')),
+        access_ip_range=models.Subquery(latest('ip_range')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signup', '0030_organisation_analytics_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='signup',
+            name='access_ip_range',
+            field=models.TextField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='signup',
+            name='access_status',
+            field=models.CharField(blank=True, choices=[('grant', 'Grant'), ('revoke', 'Revoke')], editable=False, max_length=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='signup',
+            name='access_status_date',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(populate_access_state, migrations.RunPython.noop),
+    ]
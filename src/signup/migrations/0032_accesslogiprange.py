@@ -0,0 +1,61 @@
+# Generated by Django 3.1.1 on 2026-10-18 12:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_ip_ranges(apps, schema_editor):
+    from signup.ip_ranges import parse_ip_ranges, encode_ip
+
+    AccessLog = apps.get_model('signup', 'AccessLog')
+    AccessLogIPRange = apps.get_model('signup', 'AccessLogIPRange')
+    db_alias = schema_editor.connection.alias
+
+    access_logs = AccessLog.objects.using(db_alias).exclude(
+        ip_range=None,
+    ).only('pk', 'ip_range')
+
+    ranges = []
+    for access_log in access_logs.iterator(chunk_size=1000):
+        for interval in parse_ip_ranges(access_log.ip_range):
+            ranges.append(
+                AccessLogIPRange(
+                    access_log_id=access_log.pk,
+                    version=interval.version,
+                    start=encode_ip(interval.start),
+                    end=encode_ip(interval.end),
+                )
+            )
+        if len(ranges) >= 1000:
+            AccessLogIPRange.objects.using(db_alias).bulk_create(ranges)
+            ranges = []
+
+    AccessLogIPRange.objects.using(db_alias).bulk_create(ranges)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signup', '0031_signup_access_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessLogIPRange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveSmallIntegerField()),
+                ('start', models.CharField(max_length=32)),
+                ('end', models.CharField(max_length=32)),
+                ('access_log', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='signup.accesslog')),
+            ],
+            options={
+                'ordering': ('version', 'start'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='accesslogiprange',
+            index=models.Index(fields=['version', 'start'], name='signup_acce_version_3d88b8_idx'),
+        ),
+        migrations.RunPython(populate_ip_ranges, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.1.1 on 2026-10-18 12:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signup', '0033_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('access_type', models.CharField(choices=[('grant', 'Grant'), ('revoke', 'Revoke')], max_length=10)),
+                ('date_stamp', models.DateTimeField()),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sent', models.DateTimeField(blank=True, null=True)),
+                ('organisation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='signup.organisation')),
+                ('signup', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='signup.signup')),
+            ],
+            options={
+                'ordering': ('created', 'pk'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='accessnotification',
+            index=models.Index(fields=['organisation', 'sent'], name='signup_acce_organis_3f7f3a_idx'),
+        ),
+    ]
@@ -0,0 +1,116 @@
+from django.db import migrations
+
+
+# PostgreSQL keeps a tsvector column on signup_signup up to date with a
+# trigger and indexes it with GIN. Punctuation in email addresses is
+# replaced with spaces so the address can be found by any of its parts.
+POSTGRESQL_SEARCH_VECTOR = """
+    to_tsvector('simple',
+        coalesce({table}.institution, '') || ' ' ||
+        coalesce({table}.first_name, '') || ' ' ||
+        coalesce({table}.last_name, '') || ' ' ||
+        regexp_replace(coalesce({table}.email_address, ''), '[^[:alnum:]]+', ' ', 'g')
+    )
+"""
+
+POSTGRESQL_CREATE = (
+    'ALTER TABLE signup_signup ADD COLUMN search_vector tsvector',
+    """
+    CREATE FUNCTION signup_signup_search_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """.format(POSTGRESQL_SEARCH_VECTOR.format(table='NEW')),
+    """
+    CREATE TRIGGER signup_signup_search_update
+    BEFORE INSERT OR UPDATE OF institution, first_name, last_name, email_address
+    ON signup_signup
+    FOR EACH ROW EXECUTE PROCEDURE signup_signup_search_update()
+    """,
+    'UPDATE signup_signup SET search_vector = {}'.format(
+        POSTGRESQL_SEARCH_VECTOR.format(table='signup_signup'),
+    ),
+    'CREATE INDEX signup_signup_search_vector ON signup_signup '
+    'USING GIN (search_vector)',
+)
+
+POSTGRESQL_DROP = (
+    'DROP TRIGGER signup_signup_search_update ON signup_signup',
+    'DROP FUNCTION signup_signup_search_update()',
+    'ALTER TABLE signup_signup DROP COLUMN search_vector',
+)
+
+# SQLite indexes the same columns in an external content FTS5 table kept in
+# step by triggers. Rebuilding signup_signup, as SQLite's schema editor does
+# for most field changes, drops the triggers and a migration doing that must
+# recreate them. The signup.E001 check reports them missing.
+SQLITE_COLUMNS = 'institution, first_name, last_name, email_address'
+SQLITE_NEW = 'new.id, new.institution, new.first_name, new.last_name, new.email_address'
+SQLITE_OLD = 'old.id, old.institution, old.first_name, old.last_name, old.email_address'
+
+SQLITE_CREATE = (
+    """
+    CREATE VIRTUAL TABLE signup_signup_fts USING fts5(
+        {}, content='signup_signup', content_rowid='id'
+    )
+    """.format(SQLITE_COLUMNS),
+    """
+    CREATE TRIGGER signup_signup_fts_insert AFTER INSERT ON signup_signup BEGIN
+        INSERT INTO signup_signup_fts(rowid, {}) VALUES ({});
+    END
+    """.format(SQLITE_COLUMNS, SQLITE_NEW),
+    """
+    CREATE TRIGGER signup_signup_fts_delete AFTER DELETE ON signup_signup BEGIN
+        INSERT INTO signup_signup_fts(signup_signup_fts, rowid, {}) VALUES ('delete', {});
+    END
+    """.format(SQLITE_COLUMNS, SQLITE_OLD),
+    """
+    CREATE TRIGGER signup_signup_fts_update
+    AFTER UPDATE OF {} ON signup_signup BEGIN
+        INSERT INTO signup_signup_fts(signup_signup_fts, rowid, {}) VALUES ('delete', {});
+        INSERT INTO signup_signup_fts(rowid, {}) VALUES ({});
+    END
+    """.format(SQLITE_COLUMNS, SQLITE_COLUMNS, SQLITE_OLD, SQLITE_COLUMNS, SQLITE_NEW),
+    "INSERT INTO signup_signup_fts(signup_signup_fts) VALUES ('rebuild')",
+)
+
+SQLITE_DROP = (
+    'DROP TRIGGER signup_signup_fts_insert',
+    'DROP TRIGGER signup_signup_fts_delete',
+    'DROP TRIGGER signup_signup_fts_update',
+    'DROP TABLE signup_signup_fts',
+)
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {
+        'postgresql': POSTGRESQL_CREATE,
+        'sqlite': SQLITE_CREATE,
+    }.get(vendor, ())
+
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {
+        'postgresql': POSTGRESQL_DROP,
+        'sqlite': SQLITE_DROP,
+    }.get(vendor, ())
+
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signup', '0034_accessnotification'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
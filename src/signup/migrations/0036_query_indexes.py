@@ -0,0 +1,41 @@
+# Generated by Django 3.1.1 on 2026-10-18 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signup', '0035_signup_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accesslog',
+            index=models.Index(fields=['signup', '-date_stamp', '-id'], name='signup_acce_signup__bd743d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accesslogexportcode',
+            index=models.Index(fields=['uuid', 'active'], name='signup_acce_uuid_36f601_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['organisation', 'contact_type', 'country'], name='signup_cont_organis_b86d16_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='country',
+            index=models.Index(fields=['code'], name='signup_coun_code_735e97_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='newsitem',
+            index=models.Index(fields=['organisation', '-posted'], name='signup_news_organis_f83664_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='organisation',
+            index=models.Index(fields=['domain'], name='signup_orga_domain_2a7b21_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='package',
+            index=models.Index(fields=['organisation', 'order', 'name'], name='signup_pack_organis_eae9a0_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.1.1 on 2026-10-18 12:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signup', '0036_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessLogExportVersion',
+            fields=[
+                ('organisation', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='signup.organisation')),
+                ('version', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 3.1.1 on 2026-10-18 13:02
+
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def number_existing_entries(apps, schema_editor):
+    """
+    Existing entries keep their pk as their sequence and each organisation's
+    version starts after them, so cursors handed out before are still valid.
+    """
+    AccessLog = apps.get_model('signup', 'AccessLog')
+    AccessLogExportVersion = apps.get_model('signup', 'AccessLogExportVersion')
+    db_alias = schema_editor.connection.alias
+
+    AccessLog.objects.using(db_alias).update(export_sequence=F('pk'))
+
+    latest = AccessLog.objects.using(db_alias).values(
+        'signup__package__organisation_id',
+    ).annotate(
+        latest=Max('pk'),
+    ).values_list(
+        'signup__package__organisation_id',
+        'latest',
+    )
+    for organisation_id, latest_pk in latest:
+        if organisation_id is None:
+            continue
+        version, _created = AccessLogExportVersion.objects.using(
+            db_alias,
+        ).get_or_create(
+            organisation_id=organisation_id,
+        )
+        if version.version < latest_pk:
+            version.version = latest_pk
+            version.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signup', '0037_accesslogexportversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accesslog',
+            name='export_sequence',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='accesslog',
+            index=models.Index(fields=['export_sequence', 'id'], name='signup_acce_export__a1ee4d_idx'),
+        ),
+        migrations.RunPython(number_existing_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.1 on 2026-10-18 13:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signup', '0038_access_log_export_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accessnotification',
+            name='ip_range',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='accessnotification',
+            name='previous_ip_range',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='accessnotification',
+            name='previous_status',
+            field=models.CharField(blank=True, choices=[('grant', 'Grant'), ('revoke', 'Revoke')], max_length=10, null=True),
+        ),
+    ]
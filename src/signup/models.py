@@ -1,15 +1,34 @@
+import logging
+from collections import namedtuple
+from contextlib import nullcontext
 from uuid import uuid4
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.db.models import Q
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
-from django.template import Template, Context
-from django.template.defaultfilters import linebreaksbr
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.utils import timezone
 from django.contrib.auth.models import User
 
+from signup.cache import LocalCache, MISSING
+from signup.emails import render_email, build_email
+from signup.ip_ranges import (
+	IPInterval,
+	parse_ip_ranges,
+	encode_ip,
+	decode_ip,
+	format_ip,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+def outbox_enabled():
+	return getattr(settings, 'EMAIL_OUTBOX', False)
+
 
 class Package(models.Model):
 	organisation = models.ForeignKey(
@@ -44,6 +63,13 @@ class Package(models.Model):
 
 	class Meta:
 		ordering = ('order', 'name',)
+		indexes = [
+			# Serves an organisation's packages in display order without a
+			# sort. The hidden and front_page flags are checked on the few
+			# rows found, SQLite cannot match them against an index as
+			# Django filters booleans as bare columns.
+			models.Index(fields=['organisation', 'order', 'name']),
+		]
 
 	def __str__(self):
 		return self.name
@@ -66,6 +92,9 @@ class Country(models.Model):
 	class Meta:
 		verbose_name_plural = 'Countries'
 		ordering = ('name',)
+		indexes = [
+			models.Index(fields=['code']),
+		]
 
 	def __str__(self):
 		return self.name
@@ -122,6 +151,145 @@ class Banding(models.Model):
 		)
 
 
+class OutboxMessage(models.Model):
+	"""
+	An email waiting to be sent by the send_outbox management command.
+	Messages are queued here when the EMAIL_OUTBOX setting is enabled, and
+	when sending them straight away fails.
+	"""
+	subject = models.CharField(
+		max_length=998,
+	)
+	from_email = models.CharField(
+		max_length=255,
+	)
+	to = models.JSONField()
+	body = models.TextField()
+	html = models.TextField(
+		blank=True,
+		null=True,
+	)
+	status = models.CharField(
+		max_length=10,
+		choices=(
+			('pending', 'Pending'),
+			('sent', 'Sent'),
+			('dead', 'Dead'),
+		),
+		default='pending',
+	)
+	attempts = models.PositiveIntegerField(
+		default=0,
+	)
+	next_attempt = models.DateTimeField(
+		default=timezone.now,
+	)
+	last_error = models.TextField(
+		blank=True,
+		null=True,
+	)
+	created = models.DateTimeField(
+		default=timezone.now,
+	)
+	sent = models.DateTimeField(
+		blank=True,
+		null=True,
+	)
+
+	class Meta:
+		ordering = ('next_attempt', 'pk')
+		indexes = [
+			models.Index(fields=['status', 'next_attempt']),
+		]
+
+	def __str__(self):
+		return self.subject
+
+	@classmethod
+	def send_messages(cls, messages):
+		"""
+		Sends EmailMultiAlternatives objects. With EMAIL_OUTBOX enabled they
+		are queued in the outbox as part of the current transaction.
+		Otherwise they are sent over a single connection once the current
+		transaction, if any, has committed.
+		:param messages: a list of EmailMultiAlternatives
+		:return: the number of messages queued or to be sent
+		"""
+		if not messages:
+			return 0
+
+		if outbox_enabled():
+			cls.queue(messages)
+		else:
+			transaction.on_commit(lambda: cls.send_now(messages))
+		return len(messages)
+
+	@classmethod
+	def queue(cls, messages):
+		return cls.objects.bulk_create([
+			cls(
+				subject=message.subject,
+				from_email=message.from_email,
+				to=message.to,
+				body=message.body,
+				html=next(
+					(
+						content for content, mimetype in message.alternatives
+						if mimetype == 'text/html'
+					),
+					None,
+				),
+			) for message in messages
+		])
+
+	@classmethod
+	def send_now(cls, messages):
+		"""
+		Sends messages straight away. Any that cannot be sent are queued in
+		the outbox so send_outbox, or a retry from the admin, can send them
+		later rather than the error reaching the user.
+		:return: the number of messages sent
+		"""
+		failed = []
+		connection = get_connection()
+		try:
+			connection.open()
+		except Exception:
+			logger.exception('Could not connect to send %s emails', len(messages))
+			failed = messages
+		else:
+			for message in messages:
+				try:
+					connection.send_messages([message])
+				except Exception:
+					logger.exception('Could not send email to %s', message.to)
+					failed.append(message)
+			connection.close()
+
+		if failed:
+			cls.queue(failed)
+		return len(messages) - len(failed)
+
+	def as_email(self, connection=None):
+		msg = EmailMultiAlternatives(
+			self.subject,
+			self.body,
+			self.from_email,
+			self.to,
+			connection=connection,
+		)
+		if self.html:
+			msg.attach_alternative(self.html, 'text/html')
+		return msg
+
+
+def access_choices():
+	return (
+		('grant', 'Grant'),
+		('revoke', 'Revoke'),
+	)
+
+
 class SignUp(models.Model):
 	first_name = models.CharField(
 		max_length=50,
@@ -166,6 +334,25 @@ class SignUp(models.Model):
 		verbose_name='Customer in the last three years?',
 	)
 
+	# Copied from the latest AccessLog entry by update_access_state().
+	access_status = models.CharField(
+		choices=access_choices(),
+		max_length=10,
+		blank=True,
+		null=True,
+		editable=False,
+	)
+	access_status_date = models.DateTimeField(
+		blank=True,
+		null=True,
+		editable=False,
+	)
+	access_ip_range = models.TextField(
+		blank=True,
+		null=True,
+		editable=False,
+	)
+
 	class Meta:
 		ordering = ('institution',)
 
@@ -173,38 +360,33 @@ class SignUp(models.Model):
 		return self.institution
 
 	def process_complete(self, organisation, banding, package):
-		self.banding = banding
-		self.package = package
-		self.save()
-
-		context = {
-			'organisation': organisation,
-			'banding': banding,
-			'package': package,
-			'signup': self,
-		}
-
-		self.send_signup_acknowledgement(context)
-		self.send_billing_notifications(context)
+		# Queued emails are committed with the signup. Emails sent straight
+		# away wait until it has been saved, see OutboxMessage.send_messages.
+		with transaction.atomic() if outbox_enabled() else nullcontext():
+			self.banding = banding
+			self.package = package
+			self.save()
+
+			context = {
+				'organisation': organisation,
+				'banding': banding,
+				'package': package,
+				'signup': self,
+			}
+
+			self.send_signup_acknowledgement(context)
+			self.send_billing_notifications(context)
 
 	def render_email(self, context, template_text):
-		template = Template(template_text)
-		context['PRIMARY_BASE_DOMAIN'] = settings.PRIMARY_BASE_DOMAIN
-		html_content = template.render(Context(context))
-		return linebreaksbr(html_content)
+		return render_email(context, template_text)
 
-	def send_email(self, to, subject, html):
-		if not type(to) in [list, tuple]:
-			to = [to]
+	def build_email(self, to, subject, html, text=None):
+		return build_email(to, subject, html, text=text)
 
-		msg = EmailMultiAlternatives(
-			subject,
-			strip_tags(html),
-			settings.FROM_ADDRESS,
-			to,
+	def send_email(self, to, subject, html, text=None):
+		return OutboxMessage.send_messages(
+			[self.build_email(to, subject, html, text=text)],
 		)
-		msg.attach_alternative(html, "text/html")
-		return msg.send()
 
 	def send_signup_acknowledgement(self, context):
 		rendered_template = self.render_email(
@@ -225,34 +407,41 @@ class SignUp(models.Model):
 		)
 		banding = context.get('banding')
 
-		billing_managers = Contact.objects.filter(
-			Q(country__isnull=True) | Q(country=banding.country),
-			contact_type='billing',
-			organisation=organisation,
+		emails = Contact.recipient_emails(
+			organisation.pk,
+			'billing',
+			country_id=banding.country_id,
 		)
 
-		for billing_manager in billing_managers:
-			self.send_email(
-				billing_manager.email,
+		text = strip_tags(rendered_template)
+		OutboxMessage.send_messages([
+			self.build_email(
+				email,
 				'New pledge',
 				rendered_template,
-			)
+				text=text,
+			) for email in emails
+		])
 
 	def current_access_status(self):
-		return self.accesslog_set.first()
+		if not self.access_status:
+			return None
 
-	def admin_action_button(self):
-		access_logs = self.accesslog_set.all()
+		return '{} {}'.format(
+			self.access_status,
+			self.access_status_date,
+		)
 
-		if access_logs.exists():
-			if access_logs.first().access_type == 'revoke':
-				return 'grant'
-			else:
-				return 'revoke'
+	def admin_action_button(self):
+		if self.access_status == 'grant':
+			return 'revoke'
 
 		return 'grant'
 
 
+contact_cache = LocalCache('CONTACT_CACHE_TIMEOUT')
+
+
 class Contact(models.Model):
 	organisation = models.ForeignKey(
 		'Organisation',
@@ -283,24 +472,82 @@ class Contact(models.Model):
 
 	class Meta:
 		ordering = ('name',)
+		indexes = [
+			models.Index(fields=['organisation', 'contact_type', 'country']),
+		]
 
 	def __str__(self):
 		return self.name
 
-	def send_access_message(self, access_log):
+	@classmethod
+	def recipient_emails(cls, organisation_id, contact_type, country_id=MISSING):
+		"""
+		Returns the de-duplicated email addresses of an organisation's
+		contacts of a type, cached per worker until a Contact changes.
+		:param organisation_id: the pk of the Organisation
+		:param contact_type: 'billing' or 'access'
+		:param country_id: when given, only contacts for this country or
+		for all countries are included
+		:return: a tuple of email addresses
+		"""
+		key = (organisation_id, contact_type, country_id)
+		emails = contact_cache.get(key)
+
+		if emails is MISSING:
+			contacts = cls.objects.filter(
+				organisation_id=organisation_id,
+				contact_type=contact_type,
+			)
+			if country_id is not MISSING:
+				contacts = contacts.filter(
+					Q(country__isnull=True) | Q(country_id=country_id),
+				)
+
+			seen, emails = set(), []
+			for email in contacts.values_list('email', flat=True):
+				if email.lower() not in seen:
+					seen.add(email.lower())
+					emails.append(email)
+			emails = tuple(emails)
+			contact_cache.set(key, emails)
+
+		return emails
+
+	def build_access_message(self, organisation, changes, summary=True):
+		"""
+		Builds the email telling this contact about access changes.
+		:param organisation: the Organisation, with access_manager_message
+		:param changes: a list of AccessChange
+		:param summary: append a list of the changes to the message
+		:return: an EmailMultiAlternatives
+		"""
 		context = {
-			'organisation': self.organisation,
+			'organisation': organisation,
 			'contact': self,
+			'changes': changes,
 		}
-		message = self.organisation.access_manager_message
+		html = render_email(context, organisation.access_manager_message)
+		if summary:
+			html += render_to_string(
+				'signup/email/access_changes.html',
+				{'changes': changes},
+			)
 
-		html = access_log.signup.render_email(context, message)
-		access_log.signup.send_email(
+		return build_email(
 			self.email,
 			'Access Control Update',
 			html,
 		)
 
+	def send_access_message(self, access_log):
+		return OutboxMessage.send_messages([
+			self.build_access_message(
+				self.organisation,
+				[AccessChange.from_access_log(access_log)],
+				summary=False,
+			),
+		])
+
 
 class Organisation(models.Model):
 	name = models.CharField(
@@ -432,9 +679,56 @@ class Organisation(models.Model):
 		help_text='Add all required JS here.',
 	)
 
+	class Meta:
+		indexes = [
+			models.Index(fields=['domain']),
+		]
+
 	def __str__(self):
 		return self.name
 
+	def refresh_from_db(self, using=None, fields=None):
+		# The home page renders all three hero cards so when one deferred
+		# card text is requested we fetch the others in the same query.
+		if fields and set(fields) & set(HERO_CARD_TEXT_FIELDS):
+			fields = set(fields) | (
+				set(HERO_CARD_TEXT_FIELDS) & self.get_deferred_fields()
+			)
+		super().refresh_from_db(using=using, fields=fields)
+
+
+HERO_CARD_TEXT_FIELDS = (
+	'hero_card_one_text',
+	'hero_card_two_text',
+	'hero_card_three_text',
+)
+
+# Columns needed to render the nav, footer, hero and analytics code of every
+# public page. The large text fields are deferred and only fetched when a
+# page uses them.
+ORGANISATION_REQUEST_FIELDS = (
+	'name',
+	'domain',
+	'image',
+	'address_one',
+	'address_two',
+	'post_code',
+	'phone_number',
+	'main_page_hero_text',
+	'hero_card_one_title',
+	'hero_card_one_image',
+	'hero_card_two_title',
+	'hero_card_two_image',
+	'hero_card_three_title',
+	'hero_card_three_image',
+	'copyright_notice',
+	'contact_email',
+	'twitter_url',
+	'display_faq',
+	'display_resources',
+	'analytics_code',
+)
+
 
 class Resource(models.Model):
 	organisation = models.ForeignKey(
@@ -476,18 +770,14 @@ class NewsItem(models.Model):
 
 	class Meta:
 		ordering = ('-posted', 'title')
+		indexes = [
+			models.Index(fields=['organisation', '-posted']),
+		]
 
 	def __str__(self):
 		return self.title
 
 
-def access_choices():
-	return (
-		('grant', 'Grant'),
-		('revoke', 'Revoke'),
-	)
-
-
 class AccessLog(models.Model):
 	signup = models.ForeignKey(
 		SignUp,
@@ -514,9 +804,22 @@ class AccessLog(models.Model):
 		blank=True,
 		null=True,
 	)
+	# The organisation's AccessLogExportVersion from the transaction that
+	# last saved the entry, used as the incremental export cursor.
+	export_sequence = models.PositiveIntegerField(
+		blank=True,
+		null=True,
+		editable=False,
+	)
 
 	class Meta:
 		ordering = ('-date_stamp',)
+		indexes = [
+			# Matches the latest entry lookup in latest_access_log_values().
+			models.Index(fields=['signup', '-date_stamp', '-id']),
+			# Matches the cursor ordering in AccessLogExportFilterForm.
+			models.Index(fields=['export_sequence', 'id']),
+		]
 
 	def __str__(self):
 		return '{} {}'.format(
@@ -525,6 +828,379 @@ class AccessLog(models.Model):
 		)
 
 
+def granted_range(access_type, ip_range):
+	"""
+	The access a signup is left with by an entry: its IP range if it is a
+	grant, otherwise None, as for a signup without any entries.
+	"""
+	if access_type == 'grant':
+		return ip_range or ''
+	return None
+
+
+class AccessChange(namedtuple('AccessChange', (
+	'signup',
+	'access_type',
+	'date',
+	'ip_range',
+	'previous_status',
+	'previous_ip_range',
+))):
+	"""
+	A grant or revoke to tell access managers about, with the type and IP
+	range of the entry before it, if any.
+	"""
+	@classmethod
+	def from_access_log(cls, access_log, previous=(None, None)):
+		"""
+		:param previous: the access_type and ip_range of the signup's
+		AccessLog entry before this one
+		"""
+		return cls(
+			access_log.signup,
+			access_log.access_type,
+			access_log.date_stamp,
+			access_log.ip_range,
+			*previous
+		)
+
+
+class AccessNotification(models.Model):
+	"""
+	An access change waiting to be included in a digest email, used when
+	the ACCESS_NOTIFICATION_DIGEST setting is enabled.
+	"""
+	organisation = models.ForeignKey(
+		'Organisation',
+		on_delete=models.CASCADE,
+	)
+	signup = models.ForeignKey(
+		SignUp,
+		on_delete=models.CASCADE,
+	)
+	access_type = models.CharField(
+		choices=access_choices(),
+		max_length=10,
+	)
+	date_stamp = models.DateTimeField()
+	ip_range = models.TextField(
+		blank=True,
+		null=True,
+	)
+	previous_status = models.CharField(
+		choices=access_choices(),
+		max_length=10,
+		blank=True,
+		null=True,
+	)
+	previous_ip_range = models.TextField(
+		blank=True,
+		null=True,
+	)
+	created = models.DateTimeField(
+		default=timezone.now,
+	)
+	sent = models.DateTimeField(
+		blank=True,
+		null=True,
+	)
+
+	class Meta:
+		ordering = ('created', 'pk')
+		indexes = [
+			models.Index(fields=['organisation', 'sent']),
+		]
+
+	def as_change(self):
+		return AccessChange(
+			self.signup,
+			self.access_type,
+			self.date_stamp,
+			self.ip_range,
+			self.previous_status,
+			self.previous_ip_range,
+		)
+
+
+def collapse_access_changes(changes):
+	"""
+	Reduces a list of changes, oldest first, to the latest one for each
+	signup. A signup left with the same access it had before its first
+	change, such as a grant revoked again, is dropped.
+	:param changes: a list of AccessChange
+	:return: a list of AccessChange
+	"""
+	by_signup = {}
+	for change in changes:
+		by_signup.setdefault(change.signup.pk, []).append(change)
+
+	return [
+		signup_changes[-1] for signup_changes in by_signup.values()
+		if granted_range(
+			signup_changes[-1].access_type,
+			signup_changes[-1].ip_range,
+		) != granted_range(
+			signup_changes[0].previous_status,
+			signup_changes[0].previous_ip_range,
+		)
+	]
+
+
+def send_access_changes(organisation_id, changes, summary=True):
+	"""
+	Emails every access Contact of an organisation about some changes,
+	over a single connection.
+	"""
+	managers = list(
+		Contact.objects.filter(
+			organisation_id=organisation_id,
+			contact_type='access',
+		)
+	)
+	if not managers or not changes:
+		return 0
+
+	organisation = Organisation.objects.get(pk=organisation_id)
+	return OutboxMessage.send_messages([
+		manager.build_access_message(
+			organisation,
+			changes,
+			summary=summary,
+		) for manager in managers
+	])
+
+
+def previous_access_logs(access_logs):
+	"""
+	Finds the entry before each of some AccessLog entries in its signup's
+	log, in a single query.
+	:param access_logs: a list of AccessLog objects
+	:return: a dict of AccessLog pk to the access_type and ip_range of the
+	entry before it, without the first entries of signups
+	"""
+	entries = AccessLog.objects.filter(
+		signup_id__in={access_log.signup_id for access_log in access_logs},
+	).order_by(
+		'signup_id',
+		'date_stamp',
+		'pk',
+	).values_list(
+		'pk',
+		'signup_id',
+		'access_type',
+		'ip_range',
+	)
+
+	previous, latest = {}, {}
+	for pk, signup_id, access_type, ip_range in entries:
+		if signup_id in latest:
+			previous[pk] = latest[signup_id]
+		latest[signup_id] = (access_type, ip_range)
+
+	return previous
+
+
+def notify_access_changes(access_logs):
+	"""
+	Tells access managers about new AccessLog entries. In digest mode the
+	changes are recorded for send_access_digests, with the access each one
+	replaced, otherwise each organisation's managers are emailed once for
+	the whole list.
+	:param access_logs: a list of new AccessLog objects
+	"""
+	signups = SignUp.objects.filter(
+		pk__in={access_log.signup_id for access_log in access_logs},
+	).select_related(
+		'package',
+	).in_bulk()
+
+	digest = getattr(settings, 'ACCESS_NOTIFICATION_DIGEST', False)
+	previous = previous_access_logs(access_logs) if digest else {}
+
+	changes = {}
+	for access_log in access_logs:
+		signup = signups.get(access_log.signup_id)
+		if signup and signup.package:
+			access_log.signup = signup
+			changes.setdefault(
+				signup.package.organisation_id,
+				[],
+			).append(
+				AccessChange.from_access_log(
+					access_log,
+					previous.get(access_log.pk, (None, None)),
+				),
+			)
+
+	if digest:
+		AccessNotification.objects.bulk_create([
+			AccessNotification(
+				organisation_id=organisation_id,
+				signup=change.signup,
+				access_type=change.access_type,
+				date_stamp=change.date,
+				ip_range=change.ip_range,
+				previous_status=change.previous_status,
+				previous_ip_range=change.previous_ip_range,
+			)
+			for organisation_id, organisation_changes in changes.items()
+			for change in organisation_changes
+		])
+		return
+
+	for organisation_id, organisation_changes in changes.items():
+		send_access_changes(
+			organisation_id,
+			organisation_changes,
+			summary=len(organisation_changes) > 1,
+		)
+
+
+@transaction.atomic
+def record_access_changes(signups, access_type, user, ip_range=None,
+						  payment_handler=None):
+	"""
+	Grants or revokes access for many signups at once. The AccessLog and
+	AccessLogIPRange rows are written with bulk_create, the derived state is
+	refreshed in bulk and access managers are notified once for the batch.
+	:param signups: an iterable of SignUp objects
+	:param access_type: 'grant' or 'revoke'
+	:param user: the User making the change
+	:param ip_range: an IP range for every signup, when blank each signup
+	keeps its current IP range
+	:param payment_handler: optional payment handler for every signup
+	:return: the list of new AccessLog objects
+	"""
+	date_stamp = timezone.now()
+	access_logs = AccessLog.objects.bulk_create(
+		[
+			AccessLog(
+				signup=signup,
+				access_type=access_type,
+				date_stamp=date_stamp,
+				ip_range=ip_range or signup.access_ip_range,
+				user=user,
+				payment_handler=payment_handler or None,
+			) for signup in signups
+		],
+		batch_size=500,
+	)
+	signup_ids = [access_log.signup_id for access_log in access_logs]
+
+	if access_logs and access_logs[0].pk is None:
+		# Only some databases return the primary keys of bulk inserts.
+		access_logs = list(
+			AccessLog.objects.filter(
+				signup_id__in=signup_ids,
+				access_type=access_type,
+				date_stamp=date_stamp,
+			).select_related(
+				'signup',
+			)
+		)
+
+	AccessLogIPRange.objects.bulk_create(
+		[
+			ip_range
+			for access_log in access_logs
+			for ip_range in AccessLogIPRange.from_access_log(access_log)
+		],
+		batch_size=500,
+	)
+	access_logs_changed(
+		signup_ids,
+		[access_log.pk for access_log in access_logs],
+	)
+	transaction.on_commit(lambda: notify_access_changes(access_logs))
+
+	return access_logs
+
+
+class AccessLogIPRange(models.Model):
+	"""
+	One interval parsed from AccessLog.ip_range. Addresses are stored as
+	fixed width hex, see ip_ranges.encode_ip().
+	"""
+	access_log = models.ForeignKey(
+		AccessLog,
+		on_delete=models.CASCADE,
+	)
+	version = models.PositiveSmallIntegerField()
+	start = models.CharField(
+		max_length=32,
+	)
+	end = models.CharField(
+		max_length=32,
+	)
+
+	class Meta:
+		ordering = ('version', 'start')
+		indexes = [
+			models.Index(fields=['version', 'start']),
+		]
+
+	def __str__(self):
+		return '{}-{}'.format(
+			format_ip(self.version, decode_ip(self.start)),
+			format_ip(self.version, decode_ip(self.end)),
+		)
+
+	@property
+	def interval(self):
+		return IPInterval(
+			self.version,
+			decode_ip(self.start),
+			decode_ip(self.end),
+		)
+
+	@classmethod
+	def from_access_log(cls, access_log):
+		"""
+		Returns unsaved AccessLogIPRange objects for an AccessLog.
+		"""
+		return [
+			cls(
+				access_log=access_log,
+				version=interval.version,
+				start=encode_ip(interval.start),
+				end=encode_ip(interval.end),
+			) for interval in parse_ip_ranges(access_log.ip_range)
+		]
+
+
+def latest_access_log_values(field):
+	return AccessLog.objects.filter(
+		signup=models.OuterRef('pk'),
+	).order_by(
+		'-date_stamp',
+		'-pk',
+	).values(
+		field,
+	)[:1]
+
+
+def update_access_state(signup_ids):
+	"""
+	Copies the type, date and IP range of the latest AccessLog entry for
+	each signup onto the SignUp row, in a single UPDATE.
+	:param signup_ids: an iterable of SignUp pks
+	:return: the number of signups updated
+	"""
+	return SignUp.objects.filter(
+		pk__in=signup_ids,
+	).update(
+		access_status=models.Subquery(
+			latest_access_log_values('access_type'),
+		),
+		access_status_date=models.Subquery(
+			latest_access_log_values('date_stamp'),
+		),
+		access_ip_range=models.Subquery(
+			latest_access_log_values('ip_range'),
+		),
+	)
+
+
 class AccessLogExportCode(models.Model):
 	organisation = models.ForeignKey(
 		'Organisation',
@@ -537,19 +1213,173 @@ class AccessLogExportCode(models.Model):
 
 	class Meta:
 		ordering = ('-active',)
+		indexes = [
+			models.Index(fields=['uuid', 'active']),
+		]
+
+
+class AccessLogExportVersion(models.Model):
+	"""
+	Counts the changes to an organisation's access log export. It is bumped
+	in the transaction that makes each change, and a snapshot written from
+	an older version is rebuilt on its next read.
+
+	Bumping locks the row until the transaction commits, so versions are
+	handed out in commit order and every change up to the version read by
+	an export has been committed. That makes the version safe to use as
+	the incremental export cursor, unlike the AccessLog pk.
+	"""
+	organisation = models.OneToOneField(
+		'Organisation',
+		on_delete=models.CASCADE,
+		primary_key=True,
+	)
+	version = models.PositiveIntegerField(
+		default=0,
+	)
 
-
-from django.db.models.signals import post_save
+	@classmethod
+	def current(cls, organisation_id):
+		return cls.objects.filter(
+			organisation_id=organisation_id,
+		).values_list(
+			'version',
+			flat=True,
+		).first() or 0
+
+	@classmethod
+	def bump(cls, organisation_id):
+		"""
+		:return: the new version
+		"""
+		updated = cls.objects.filter(
+			organisation_id=organisation_id,
+		).update(
+			version=models.F('version') + 1,
+		)
+		if not updated:
+			try:
+				with transaction.atomic():
+					cls.objects.create(organisation_id=organisation_id, version=1)
+			except IntegrityError:
+				# Created by a concurrent change.
+				cls.objects.filter(
+					organisation_id=organisation_id,
+				).update(
+					version=models.F('version') + 1,
+				)
+
+		return cls.current(organisation_id)
+
+
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
 
 @receiver(post_save, sender=AccessLog)
 def send_access_update_message(sender, instance, created, **kwargs):
 	if created:
-		access_managers = Contact.objects.filter(
-			contact_type='access',
-			organisation=instance.signup.package.organisation,
+		transaction.on_commit(lambda: notify_access_changes([instance]))
+
+
+@receiver(post_save, sender=Contact)
+@receiver(post_delete, sender=Contact)
+def clear_contact_cache(sender, instance, **kwargs):
+	contact_cache.clear()
+
+
+@receiver(post_save, sender=Organisation)
+@receiver(post_delete, sender=Organisation)
+def clear_organisation_cache(sender, instance, **kwargs):
+	from signup.middleware import organisation_cache
+	organisation_cache.clear()
+
+
+def mark_access_log_snapshot_stale(organisation_id):
+	if organisation_id:
+		return AccessLogExportVersion.bump(organisation_id)
+
+
+def refresh_entitlements(organisation_id, signup_ids, version):
+	if organisation_id:
+		from signup.entitlements import update_signups
+		transaction.on_commit(
+			lambda: update_signups(organisation_id, signup_ids, version),
+		)
+
+
+def access_logs_changed(signup_ids, access_log_ids=()):
+	"""
+	Refreshes everything derived from the access log of some signups: the
+	access state stored on each SignUp, the export version, snapshot and
+	entitlement index of their organisations, and the export_sequence of
+	the saved entries, all in one transaction so that the version is never
+	bumped without the state it stands for.
+	:param signup_ids: a list of SignUp pks
+	:param access_log_ids: pks of the AccessLog entries created or edited
+	"""
+	with transaction.atomic():
+		update_access_state(signup_ids)
+		organisation_ids = Package.objects.filter(
+			signup__in=signup_ids,
+		).values_list(
+			'organisation_id',
+			flat=True,
+		).distinct().order_by(
+			'organisation_id',
 		)
 
-		for manager in access_managers:
-			manager.send_access_message(instance)
\ No newline at end of file
+		# In a consistent order, so that concurrent changes to several
+		# organisations wait on each other's version locks instead of
+		# deadlocking.
+		for organisation_id in organisation_ids:
+			version = AccessLogExportVersion.bump(organisation_id)
+			if access_log_ids:
+				AccessLog.objects.filter(
+					pk__in=access_log_ids,
+					signup__package__organisation_id=organisation_id,
+				).update(
+					export_sequence=version,
+				)
+			refresh_entitlements(organisation_id, signup_ids, version)
+
+
+@receiver(post_save, sender=AccessLog)
+def update_saved_access_log_state(sender, instance, **kwargs):
+	access_logs_changed([instance.signup_id], [instance.pk])
+
+
+@receiver(post_delete, sender=AccessLog)
+def update_access_log_state(sender, instance, **kwargs):
+	access_logs_changed([instance.signup_id])
+
+
+@receiver(post_save, sender=AccessLog)
+def update_access_log_ip_ranges(sender, instance, created, **kwargs):
+	if not created:
+		instance.accesslogiprange_set.all().delete()
+
+	AccessLogIPRange.objects.bulk_create(
+		AccessLogIPRange.from_access_log(instance),
+	)
+
+
+@receiver(post_save, sender=SignUp)
+@receiver(post_delete, sender=SignUp)
+def update_signup_access_log_snapshot(sender, instance, **kwargs):
+	# A new signup has no access log entries to export yet.
+	if not kwargs.get('created') and instance.package_id:
+		organisation_id = Package.objects.filter(
+			pk=instance.package_id,
+		).values_list(
+			'organisation_id',
+			flat=True,
+		).first()
+		version = mark_access_log_snapshot_stale(organisation_id)
+		refresh_entitlements(organisation_id, [instance.pk], version)
+
+
+@receiver(post_save, sender=Package)
+def update_package_access_log_snapshot(sender, instance, created, **kwargs):
+	if not created:
+		mark_access_log_snapshot_stale(instance.organisation_id)
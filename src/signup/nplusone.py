@@ -0,0 +1,200 @@
+import os
+import re
+import sys
+import warnings
+from collections import Counter, OrderedDict, namedtuple
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+from django.template.base import Node, TokenType
+
+
+_string = re.compile(r"'(?:[^']|'')*'")
+_number = re.compile(r'\b\d+(?:\.\d+)?\b')
+_placeholder = re.compile(r'%s|%\(\w+\)s')
+_in_list = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_whitespace = re.compile(r'\s+')
+
+QueryRecord = namedtuple(
+	'QueryRecord',
+	('sql', 'shape', 'stack', 'template_stack'),
+)
+
+# Where in a template a query was made: the template name, the line and the
+# tag or variable being rendered, eg. {{ package.image.url }}.
+TemplateFrame = namedtuple(
+	'TemplateFrame',
+	('template_name', 'lineno', 'source'),
+)
+
+
+class NPlusOneError(Exception):
+	pass
+
+
+class NPlusOneWarning(UserWarning):
+	pass
+
+
+def query_shape(sql):
+	"""
+	Returns the SQL with its values replaced by ? and any IN list reduced to
+	one value, so that queries differing only in their parameters match.
+	"""
+	shape = _string.sub('?', sql)
+	shape = _placeholder.sub('?', shape)
+	shape = _number.sub('?', shape)
+	shape = _in_list.sub('(?)', shape)
+	return _whitespace.sub(' ', shape).strip()
+
+
+def template_stack(frame):
+	"""
+	Returns the template nodes being rendered when frame was reached,
+	innermost first.
+	"""
+	stack = []
+	while frame is not None:
+		if frame.f_code is Node.render_annotated.__code__:
+			node = frame.f_locals.get('self')
+			token = getattr(node, 'token', None)
+			origin = getattr(node, 'origin', None)
+			if token is not None and origin is not None:
+				source = '{{{{ {} }}}}' if token.token_type == TokenType.VAR else '{{% {} %}}'
+				stack.append(TemplateFrame(
+					origin.template_name or origin.name,
+					token.lineno,
+					source.format(token.contents),
+				))
+		frame = frame.f_back
+	return stack
+
+
+def caller(frame):
+	"""
+	Returns the frame that ran the query, outside of any execute wrappers.
+	"""
+	wrapped = CursorWrapper._execute_with_wrappers.__code__
+	while frame is not None and frame.f_code is not wrapped:
+		frame = frame.f_back
+	return frame.f_back if frame is not None else None
+
+
+def python_stack(frame):
+	"""
+	Returns (file name, line number, function name) for the frames in this
+	project's code, innermost first, leaving out Django and other libraries.
+	"""
+	stack = []
+	base_dir = str(settings.BASE_DIR)
+	while frame is not None:
+		filename = frame.f_code.co_filename
+		if filename.startswith(base_dir):
+			stack.append((
+				os.path.relpath(filename, base_dir),
+				frame.f_lineno,
+				frame.f_code.co_name,
+			))
+		frame = frame.f_back
+	return stack
+
+
+class QueryRecorder(object):
+	"""
+	Records every query with the Python and template stack that made it.
+	Use its query() as a database execute wrapper.
+	"""
+	def __init__(self):
+		self.queries = []
+
+	def query(self, execute, sql, params, many, context):
+		frame = caller(sys._getframe())
+		self.queries.append(QueryRecord(
+			sql,
+			query_shape(sql),
+			python_stack(frame),
+			template_stack(frame),
+		))
+		return execute(sql, params, many, context)
+
+	def repeated(self, threshold):
+		"""
+		Returns the queries of each shape that ran more than threshold times,
+		by shape, most repeated first.
+		"""
+		shapes = OrderedDict()
+		for record in self.queries:
+			shapes.setdefault(record.shape, []).append(record)
+
+		return OrderedDict(
+			sorted(
+				(
+					(shape, records) for shape, records in shapes.items()
+					if len(records) > threshold
+				),
+				key=lambda item: -len(item[1]),
+			)
+		)
+
+
+def describe(shape, records):
+	"""
+	Describes a repeated query shape and the places it was made from,
+	pointing at the template line where there is one.
+	"""
+	origins = Counter()
+	for record in records:
+		if record.template_stack:
+			origin = '{2} in {0} line {1}'.format(*record.template_stack[0])
+		elif record.stack:
+			origin = '{} line {} in {}'.format(*record.stack[0])
+		else:
+			origin = 'unknown'
+		origins[origin] += 1
+
+	lines = ['{} queries: {}'.format(len(records), shape)]
+	for origin, count in origins.most_common():
+		lines.append('  {} from {}'.format(count, origin))
+	return '\n'.join(lines)
+
+
+def check(recorder, threshold, action='raise', label=None):
+	"""
+	Raises an NPlusOneError or warns with an NPlusOneWarning if any query
+	shape ran more than threshold times.
+	"""
+	repeated = recorder.repeated(threshold)
+	if not repeated:
+		return
+
+	message = '\n'.join(
+		['Query repeated more than {} times{}:'.format(
+			threshold,
+			' in {}'.format(label) if label else '',
+		)] + [describe(shape, records) for shape, records in repeated.items()]
+	)
+	if action == 'raise':
+		raise NPlusOneError(message)
+	warnings.warn(message, NPlusOneWarning, stacklevel=2)
+
+
+@contextmanager
+def detect_n_plus_one(threshold=None, action='raise', label=None):
+	"""
+	Records the queries made inside the block on every database connection
+	and raises or warns if one shape runs more than threshold times,
+	NPLUSONE_THRESHOLD by default.
+	:param action: 'raise' or 'warn'
+	"""
+	if threshold is None:
+		threshold = getattr(settings, 'NPLUSONE_THRESHOLD', 10)
+
+	recorder = QueryRecorder()
+	with ExitStack() as stack:
+		for connection in connections.all():
+			stack.enter_context(connection.execute_wrapper(recorder.query))
+		yield recorder
+
+	check(recorder, threshold, action, label)
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def planner_estimate(queryset):
+	"""
+	Returns the number of rows the PostgreSQL planner expects a queryset
+	to return, without running it.
+	"""
+	sql, params = queryset.query.sql_with_params()
+	with connections[queryset.db].cursor() as cursor:
+		cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+		plan = cursor.fetchone()[0]
+
+	return int(plan[0]['Plan']['Plan Rows'])
+
+
+class ApproximateCountPaginator(Paginator):
+	"""
+	A Paginator for tables too large to count on every request. Counts at
+	or above APPROXIMATE_COUNT_THRESHOLD are estimated from the planner
+	statistics on PostgreSQL and capped at the threshold elsewhere, which
+	sets approximate. Smaller results are counted exactly, as they are cheap.
+	"""
+	def __init__(self, *args, exact=False, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.exact = exact
+		self.approximate = False
+
+	@cached_property
+	def count(self):
+		if self.exact:
+			return super().count
+
+		threshold = getattr(settings, 'APPROXIMATE_COUNT_THRESHOLD', 10000)
+		queryset = self.object_list.order_by()
+
+		if connections[queryset.db].vendor == 'postgresql':
+			estimate = planner_estimate(queryset)
+			if estimate < threshold:
+				return queryset.count()
+			self.approximate = True
+			return estimate
+
+		count = queryset[:threshold + 1].count()
+		if count > threshold:
+			self.approximate = True
+			return threshold
+		return count
+
+	def validate_number(self, number):
+		try:
+			return super().validate_number(number)
+		except EmptyPage:
+			# An approximate count may be too low, so pages past it are
+			# allowed and are simply empty when there is nothing there.
+			if self.approximate and int(number) > 1:
+				return int(number)
+			raise
+
+	def page(self, number):
+		if not self.approximate:
+			return super().page(number)
+
+		number = self.validate_number(number)
+		bottom = (number - 1) * self.per_page
+		return self._get_page(
+			self.object_list[bottom:bottom + self.per_page],
+			number,
+			self,
+		)
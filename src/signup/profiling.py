@@ -0,0 +1,129 @@
+import cProfile
+import os
+import re
+import sys
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.utils import timezone
+
+
+_unsafe = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+def profile_dir():
+	return getattr(
+		settings,
+		'PROFILE_DIR',
+		os.path.join(settings.BASE_DIR, 'profiles'),
+	)
+
+
+def profile_name(request):
+	"""
+	Returns a file name for a request's profile made of the time, URL name
+	and organisation domain.
+	"""
+	resolver_match = getattr(request, 'resolver_match', None)
+	organisation = getattr(request, 'organisation', None)
+	parts = [
+		timezone.now().strftime('%Y%m%d-%H%M%S-%f'),
+		resolver_match.url_name if resolver_match and resolver_match.url_name else 'unnamed',
+		organisation.domain if organisation else 'no-organisation',
+	]
+	return '_'.join(_unsafe.sub('-', part) for part in parts)
+
+
+class StackSampler(object):
+	"""
+	Records the stack of a thread at a fixed interval and counts how often
+	each stack is seen, giving the collapsed stack format read by flame
+	graph tools.
+	"""
+	def __init__(self, thread_id, interval):
+		self.thread_id = thread_id
+		self.interval = interval
+		self.stacks = Counter()
+		self._stop = threading.Event()
+		self._thread = threading.Thread(target=self._run, daemon=True)
+
+	def start(self):
+		self._thread.start()
+
+	def stop(self):
+		self._stop.set()
+		self._thread.join()
+
+	def _run(self):
+		while not self._stop.wait(self.interval):
+			frame = sys._current_frames().get(self.thread_id)
+			if frame is not None:
+				self.stacks[self._collapse(frame)] += 1
+
+	def _collapse(self, frame):
+		names = []
+		while frame is not None:
+			code = frame.f_code
+			names.append('{} ({}:{})'.format(
+				code.co_name,
+				code.co_filename,
+				code.co_firstlineno,
+			))
+			frame = frame.f_back
+		return ';'.join(reversed(names))
+
+	def write(self, path):
+		with open(path, 'w') as collapsed_file:
+			for stack, count in self.stacks.most_common():
+				collapsed_file.write('{} {}\n'.format(stack, count))
+
+
+class RequestProfile(object):
+	"""
+	Profiles the work done for one request with cProfile and a StackSampler
+	and saves a pstats file and a collapsed stack file named after it.
+	"""
+	def __init__(self, request):
+		self.request = request
+		self.profiler = cProfile.Profile()
+		self.sampler = StackSampler(
+			threading.get_ident(),
+			getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.005),
+		)
+
+	def start(self):
+		self.sampler.start()
+
+	def save(self):
+		"""
+		Stops sampling and writes both files.
+		:return: the path of the files, without the extension
+		"""
+		self.sampler.stop()
+
+		directory = profile_dir()
+		os.makedirs(directory, exist_ok=True)
+		path = os.path.join(directory, profile_name(self.request))
+		self.profiler.dump_stats(path + '.prof')
+		self.sampler.write(path + '.collapsed')
+		return path
+
+	def call(self, func, *args, **kwargs):
+		return self.profiler.runcall(func, *args, **kwargs)
+
+	def stream(self, content):
+		"""
+		Profiles the iteration of a streaming response's content, saving
+		once it has all been sent.
+		"""
+		iterator = iter(content)
+		try:
+			while True:
+				try:
+					chunk = self.profiler.runcall(next, iterator)
+				except StopIteration:
+					return
+				yield chunk
+		finally:
+			self.save()
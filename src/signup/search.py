@@ -0,0 +1,118 @@
+import re
+
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+
+# Each backend keeps a full text index of the institution, name and email
+# address of every signup, maintained by triggers (see migration 0035).
+SEARCH_QUERIES = {
+	'postgresql': (
+		'SELECT id FROM signup_signup '
+		'WHERE search_vector @@ to_tsquery(\'simple\', %s)'
+	),
+	'sqlite': (
+		'SELECT rowid FROM signup_signup_fts '
+		'WHERE signup_signup_fts MATCH %s'
+	),
+}
+
+# What migration 0035 creates on each backend, by type.
+SEARCH_OBJECTS = {
+	'postgresql': {
+		'column': ('search_vector',),
+		'index': ('signup_signup_search_vector',),
+		'trigger': ('signup_signup_search_update',),
+	},
+	'sqlite': {
+		'table': ('signup_signup_fts',),
+		'trigger': (
+			'signup_signup_fts_insert',
+			'signup_signup_fts_delete',
+			'signup_signup_fts_update',
+		),
+	},
+}
+
+_words = re.compile(r'[^\W_]+')
+
+
+def search_words(search_term):
+	return [word.lower() for word in _words.findall(search_term)]
+
+
+def match_expression(vendor, words):
+	"""
+	Builds a full text query matching rows that contain a word starting with
+	each of the words searched for.
+	"""
+	if vendor == 'postgresql':
+		return ' & '.join('{}:*'.format(word) for word in words)
+
+	return ' '.join('"{}"*'.format(word) for word in words)
+
+
+def existing_search_objects(connection):
+	"""
+	Returns the (type, name) pairs of the search index objects that exist
+	on a database.
+	"""
+	with connection.cursor() as cursor:
+		if connection.vendor == 'sqlite':
+			cursor.execute(
+				"SELECT type, name FROM sqlite_master "
+				"WHERE type IN ('table', 'trigger')"
+			)
+			return set(cursor.fetchall())
+
+		cursor.execute(
+			"SELECT 'trigger', tgname FROM pg_trigger "
+			"WHERE tgrelid = 'signup_signup'::regclass AND NOT tgisinternal "
+			"UNION SELECT 'index', indexname FROM pg_indexes "
+			"WHERE tablename = 'signup_signup' "
+			"UNION SELECT 'column', column_name FROM information_schema.columns "
+			"WHERE table_name = 'signup_signup' AND data_type = 'tsvector'"
+		)
+		return set(cursor.fetchall())
+
+
+def missing_search_objects(connection):
+	"""
+	Returns the names of the search index objects missing from a database,
+	for example triggers dropped when SQLite rebuilt signup_signup.
+	"""
+	expected = SEARCH_OBJECTS.get(connection.vendor, {})
+	existing = existing_search_objects(connection) if expected else set()
+	return [
+		'{} {}'.format(object_type, name)
+		for object_type, names in expected.items()
+		for name in names
+		if (object_type, name) not in existing
+	]
+
+
+def can_search(queryset):
+	return connections[queryset.db].vendor in SEARCH_QUERIES
+
+
+def search_signups(queryset, search_term):
+	"""
+	Filters a SignUp queryset to the signups whose institution, first name,
+	last name or email address contain words starting with every word of
+	the search term, using the full text index rather than scanning the
+	table. Punctuation is ignored, so an email address matches on its parts.
+	:param queryset: a SignUp queryset on a database with a search index
+	:param search_term: the text searched for
+	:return: the filtered queryset
+	"""
+	words = search_words(search_term)
+	if not words:
+		return queryset
+
+	vendor = connections[queryset.db].vendor
+	return queryset.filter(
+		pk__in=RawSQL(
+			SEARCH_QUERIES[vendor],
+			[match_expression(vendor, words)],
+		),
+	)
@@ -0,0 +1,127 @@
+from django.contrib.auth.models import User
+
+from signup import models
+
+
+def create_organisation(domain='testserver', **kwargs):
+	defaults = {
+		'name': 'Test Organisation',
+		'address_one': '1 Test Street',
+		'address_two': 'Test Town',
+		'post_code': 'TE1 1ST',
+		'image': 'logo.png',
+		'hero_card_one_image': 'hero.png',
+		'hero_card_two_image': 'hero.png',
+		'hero_card_three_image': 'hero.png',
+		'institution_message': 'Thank you for your pledge.',
+		'billing_manager_message': 'New pledge from {{ signup.institution }}.',
+	}
+	defaults.update(kwargs)
+	return models.Organisation.objects.create(domain=domain, **defaults)
+
+
+def create_package(organisation, name='Package', **kwargs):
+	defaults = {
+		'image': 'package.png',
+		'items': '<ul><li>Item</li></ul>',
+	}
+	defaults.update(kwargs)
+	return models.Package.objects.create(
+		organisation=organisation,
+		name=name,
+		**defaults
+	)
+
+
+def create_banding(organisation, country=None, **kwargs):
+	defaults = {
+		'name': 'Band',
+		'price': 1000,
+		'currency': 'GBP',
+	}
+	defaults.update(kwargs)
+	return models.Banding.objects.create(
+		organisation=organisation,
+		country=country,
+		**defaults
+	)
+
+
+def create_signup(package, banding, number=0, **kwargs):
+	defaults = {
+		'first_name': 'First',
+		'last_name': 'Last',
+		'email_address': 'library{}@example.org'.format(number),
+		'institution': 'University {}'.format(number),
+		'address': '{} Library Road'.format(number),
+		'post_code': 'AB1 2CD',
+		'technical_contact': 'tech{}@example.org'.format(number),
+	}
+	defaults.update(kwargs)
+	return models.SignUp.objects.create(
+		package=package,
+		banding=banding,
+		**defaults
+	)
+
+
+def create_superuser(username='admin'):
+	return User.objects.create_superuser(
+		username,
+		'{}@example.org'.format(username),
+		'password',
+	)
+
+
+def add_rows(organisation, user, start, stop):
+	"""
+	Creates a package, banding, signup granted access, contact, news item,
+	resource and export code numbered from start to stop, to check that the
+	cost of a page does not grow with the rows behind it.
+	:param user: the user the access log entries are made by
+	"""
+	countries = list(models.Country.objects.all()[:30])
+	for number in range(start, stop):
+		country = countries[number % len(countries)]
+		package = create_package(
+			organisation,
+			name='Package {}'.format(number),
+			front_page=True,
+			order=number,
+		)
+		banding = create_banding(
+			organisation,
+			country=country,
+			name='Band {}'.format(number),
+		)
+		signup = create_signup(package, banding, number)
+		models.AccessLog.objects.create(
+			signup=signup,
+			access_type='grant',
+			ip_range='10.0.{}.0/24'.format(number),
+			user=user,
+		)
+		models.Contact.objects.create(
+			organisation=organisation,
+			name='Contact {}'.format(number),
+			email='contact{}@example.org'.format(number),
+			country=country,
+			contact_type=('billing', 'access')[number % 2],
+		)
+		models.NewsItem.objects.create(
+			organisation=organisation,
+			title='News {}'.format(number),
+			body='Body',
+			image='news.png',
+			posted_by=User.objects.create_user('poster{}'.format(number)),
+		)
+		models.Resource.objects.create(
+			organisation=organisation,
+			file='resource{}.pdf'.format(number),
+			title='Resource {}'.format(number),
+			order=number,
+		)
+		models.AccessLogExportCode.objects.create(
+			organisation=organisation,
+			issued_to='Platform {}'.format(number),
+		)
@@ -0,0 +1,205 @@
+import io
+from datetime import timedelta
+
+from django.core import mail
+from django.core.management import call_command
+from django.db import transaction
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from signup import models
+from signup.tests import helpers
+
+
+def change(signup_id, access_type, minutes=0, ip_range='10.0.0.0/24',
+		   previous=(None, None)):
+	return models.AccessChange(
+		models.SignUp(pk=signup_id),
+		access_type,
+		timezone.now() + timedelta(minutes=minutes),
+		ip_range,
+		*previous
+	)
+
+
+class CollapseAccessChangesTests(SimpleTestCase):
+	def test_grant_then_revoke_cancels(self):
+		self.assertEqual(
+			models.collapse_access_changes([
+				change(1, 'grant'),
+				change(1, 'revoke', 1),
+			]),
+			[],
+		)
+
+	def test_revoke_then_grant_cancels(self):
+		self.assertEqual(
+			models.collapse_access_changes([
+				change(1, 'revoke', previous=('grant', '10.0.0.0/24')),
+				change(1, 'grant', 1),
+			]),
+			[],
+		)
+
+	def test_changed_range_then_revoke_reported(self):
+		# Already granted before the window, so the revoke is a change.
+		changes = [
+			change(1, 'grant', ip_range='10.0.1.0/24',
+				   previous=('grant', '10.0.0.0/24')),
+			change(1, 'revoke', 1),
+		]
+
+		self.assertEqual(
+			models.collapse_access_changes(changes),
+			[changes[1]],
+		)
+
+	def test_changed_range_reported(self):
+		changes = [
+			change(1, 'grant', ip_range='10.0.1.0/24',
+				   previous=('grant', '10.0.0.0/24')),
+		]
+
+		self.assertEqual(models.collapse_access_changes(changes), changes)
+
+	def test_one_entry_per_signup(self):
+		changes = [
+			change(1, 'grant'),
+			change(2, 'revoke', 1, previous=('grant', '10.0.0.0/24')),
+			change(1, 'revoke', 2),
+			change(1, 'grant', 3),
+			change(2, 'revoke', 4),
+		]
+
+		self.assertEqual(
+			models.collapse_access_changes(changes),
+			[changes[3], changes[4]],
+		)
+
+	def test_empty(self):
+		self.assertEqual(models.collapse_access_changes([]), [])
+
+
+@override_settings(
+	ACCESS_NOTIFICATION_DIGEST=True,
+	EMAIL_OUTBOX=False,
+	EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+)
+class AccessDigestTests(TransactionTestCase):
+	"""
+	Changes are recorded once their transaction commits, and each access
+	manager gets one email per digest window listing the collapsed changes.
+	"""
+	serialized_rollback = True
+
+	def setUp(self):
+		models.contact_cache.clear()
+		self.organisation = helpers.create_organisation(
+			access_manager_message='Access changes for {{ organisation.name }}.',
+		)
+		package = helpers.create_package(self.organisation)
+		banding = helpers.create_banding(self.organisation)
+		self.signups = [
+			helpers.create_signup(package, banding, number)
+			for number in range(3)
+		]
+		for number in range(2):
+			models.Contact.objects.create(
+				organisation=self.organisation,
+				name='Access {}'.format(number),
+				email='access{}@example.org'.format(number),
+				contact_type='access',
+			)
+
+	def log(self, signup, access_type, ip_range='10.0.0.0/24'):
+		return models.AccessLog.objects.create(
+			signup=signup,
+			access_type=access_type,
+			ip_range=ip_range,
+		)
+
+	def send_digests(self, **options):
+		stdout = io.StringIO()
+		call_command('send_access_digests', stdout=stdout, **options)
+		return stdout.getvalue()
+
+	def test_recorded_on_commit(self):
+		with transaction.atomic():
+			self.log(self.signups[0], 'grant')
+			self.assertFalse(models.AccessNotification.objects.exists())
+
+		self.assertEqual(models.AccessNotification.objects.count(), 1)
+		self.assertEqual(len(mail.outbox), 0)
+
+	def test_not_recorded_on_rollback(self):
+		with self.assertRaises(ValueError), transaction.atomic():
+			self.log(self.signups[0], 'grant')
+			raise ValueError
+
+		self.assertFalse(models.AccessNotification.objects.exists())
+
+	def test_one_email_per_manager_per_window(self):
+		# Cancelled out.
+		self.log(self.signups[0], 'grant')
+		self.log(self.signups[0], 'revoke')
+		# Several changes to one signup.
+		self.log(self.signups[1], 'grant')
+		self.log(self.signups[1], 'revoke')
+		self.log(self.signups[1], 'grant')
+		models.record_access_changes([self.signups[2]], 'grant', None)
+
+		# Still inside the window.
+		self.assertEqual(self.send_digests(window=60), '')
+		self.assertEqual(len(mail.outbox), 0)
+
+		stdout = self.send_digests(force=True)
+
+		self.assertIn('6 changes, 4 collapsed, 2 emails', stdout)
+		self.assertEqual(
+			sorted(message.to[0] for message in mail.outbox),
+			['access0@example.org', 'access1@example.org'],
+		)
+		for message in mail.outbox:
+			body = message.alternatives[0][0]
+			self.assertNotIn('University 0', body)
+			self.assertEqual(body.count('University 1'), 1)
+			self.assertEqual(body.count('University 2'), 1)
+
+		self.send_digests(force=True)
+		self.assertEqual(len(mail.outbox), 2)
+
+	def test_collapsed_against_access_before_window(self):
+		self.log(self.signups[0], 'grant')
+		self.log(self.signups[1], 'grant')
+		self.send_digests(force=True)
+		mail.outbox = []
+
+		# Granted before the window, the revoke takes its access away.
+		self.log(self.signups[0], 'grant', '10.0.1.0/24')
+		self.log(self.signups[0], 'revoke')
+		# Revoked and granted the same range again.
+		self.log(self.signups[1], 'revoke')
+		self.log(self.signups[1], 'grant')
+
+		stdout = self.send_digests(force=True)
+
+		self.assertIn('4 changes, 3 collapsed, 2 emails', stdout)
+		for message in mail.outbox:
+			body = message.alternatives[0][0]
+			self.assertIn('Revoke: University 0', body)
+			self.assertNotIn('University 1', body)
+
+	def test_window_counted_from_oldest_change(self):
+		self.log(self.signups[0], 'grant')
+		models.AccessNotification.objects.update(
+			created=timezone.now() - timedelta(minutes=61),
+		)
+		self.log(self.signups[1], 'grant')
+
+		stdout = self.send_digests(window=60)
+
+		self.assertIn('2 changes, 0 collapsed, 2 emails', stdout)
+		self.assertEqual(len(mail.outbox), 2)
+		self.assertFalse(
+			models.AccessNotification.objects.filter(sent__isnull=True).exists(),
+		)
@@ -0,0 +1,169 @@
+import io
+from datetime import timedelta
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from signup import models
+from signup.tests import helpers
+
+
+class AccessStateTests(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.organisation = helpers.create_organisation()
+		cls.package = helpers.create_package(cls.organisation)
+		cls.banding = helpers.create_banding(cls.organisation)
+		cls.signup = helpers.create_signup(cls.package, cls.banding)
+		cls.other_signup = helpers.create_signup(cls.package, cls.banding, 1)
+		cls.now = timezone.now()
+
+	def log(self, access_type, days_ago=0, ip_range='10.0.0.0/24', signup=None):
+		return models.AccessLog.objects.create(
+			signup=signup or self.signup,
+			access_type=access_type,
+			date_stamp=self.now - timedelta(days=days_ago),
+			ip_range=ip_range,
+		)
+
+	def assertState(self, access_status, date_stamp=None, ip_range=None,
+					signup=None):
+		signup = models.SignUp.objects.get(pk=(signup or self.signup).pk)
+		self.assertEqual(
+			(
+				signup.access_status,
+				signup.access_status_date,
+				signup.access_ip_range,
+			),
+			(access_status, date_stamp, ip_range),
+		)
+
+	def test_new_signup_has_no_state(self):
+		self.assertState(None)
+
+	def test_latest_entry_wins(self):
+		self.log('grant', days_ago=10)
+		self.log('revoke', days_ago=5, ip_range='10.0.1.0/24')
+
+		self.assertState(
+			'revoke',
+			self.now - timedelta(days=5),
+			'10.0.1.0/24',
+		)
+
+	def test_back_dated_entry_does_not_replace_latest(self):
+		self.log('grant', days_ago=5)
+		self.log('revoke', days_ago=10)
+
+		self.assertState('grant', self.now - timedelta(days=5), '10.0.0.0/24')
+
+	def test_same_date_broken_by_pk(self):
+		self.log('grant')
+		self.log('revoke', ip_range='10.0.1.0/24')
+
+		self.assertState('revoke', self.now, '10.0.1.0/24')
+
+	def test_edit_updates_state(self):
+		access_log = self.log('grant')
+		access_log.ip_range = '192.168.0.0/16'
+		access_log.save()
+
+		self.assertState('grant', self.now, '192.168.0.0/16')
+
+	def test_delete_falls_back_to_previous_entry(self):
+		self.log('grant', days_ago=10)
+		latest = self.log('revoke', days_ago=5)
+
+		latest.delete()
+		self.assertState('grant', self.now - timedelta(days=10), '10.0.0.0/24')
+
+		models.AccessLog.objects.get(signup=self.signup).delete()
+		self.assertState(None)
+
+	def test_bulk_changes(self):
+		models.record_access_changes(
+			[self.signup, self.other_signup],
+			'grant',
+			None,
+			ip_range='10.9.0.0/16',
+		)
+
+		for signup in (self.signup, self.other_signup):
+			signup = models.SignUp.objects.get(pk=signup.pk)
+			self.assertEqual(signup.access_status, 'grant')
+			self.assertEqual(signup.access_ip_range, '10.9.0.0/16')
+
+	def test_update_access_state(self):
+		self.log('grant')
+		self.log('revoke', signup=self.other_signup)
+		models.SignUp.objects.update(
+			access_status=None,
+			access_status_date=None,
+			access_ip_range=None,
+		)
+
+		updated = models.update_access_state([self.signup.pk])
+
+		self.assertEqual(updated, 1)
+		self.assertState('grant', self.now, '10.0.0.0/24')
+		self.assertState(None, signup=self.other_signup)
+
+
+class RebuildAccessStateTests(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		organisation = helpers.create_organisation()
+		package = helpers.create_package(organisation)
+		banding = helpers.create_banding(organisation)
+		cls.signup = helpers.create_signup(package, banding)
+		cls.other_signup = helpers.create_signup(package, banding, 1)
+		models.AccessLog.objects.create(
+			signup=cls.signup,
+			access_type='grant',
+			ip_range='10.0.0.0/24',
+		)
+
+	def rebuild(self, **options):
+		stdout, stderr = io.StringIO(), io.StringIO()
+		call_command('rebuild_access_state', stdout=stdout, stderr=stderr, **options)
+		return stdout.getvalue(), stderr.getvalue()
+
+	def test_verify_passes(self):
+		stdout, _stderr = self.rebuild(verify=True)
+
+		self.assertIn('Access state is correct for all signups.', stdout)
+
+	def test_verify_reports_and_rebuild_fixes(self):
+		models.SignUp.objects.filter(pk=self.signup.pk).update(
+			access_status='revoke',
+		)
+		models.SignUp.objects.filter(pk=self.other_signup.pk).update(
+			access_status='grant',
+		)
+
+		stderr = io.StringIO()
+		with self.assertRaisesMessage(
+			CommandError,
+			'2 signups have incorrect access state.',
+		):
+			call_command('rebuild_access_state', verify=True, stderr=stderr)
+		self.assertIn(
+			'SignUp {} has incorrect access state.'.format(self.signup.pk),
+			stderr.getvalue(),
+		)
+		self.assertEqual(
+			models.SignUp.objects.get(pk=self.signup.pk).access_status,
+			'revoke',
+		)
+
+		stdout, _stderr = self.rebuild(batch_size=1)
+		self.assertIn('Rebuilt access state for 2 signups.', stdout)
+		self.assertEqual(
+			models.SignUp.objects.get(pk=self.signup.pk).access_status,
+			'grant',
+		)
+		self.assertIsNone(
+			models.SignUp.objects.get(pk=self.other_signup.pk).access_status,
+		)
+		self.rebuild(verify=True)
@@ -0,0 +1,227 @@
+from django.contrib import admin
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from signup import models
+from signup.tests import helpers
+
+
+class AdminChangelistQueryTests(TestCase):
+	"""
+	Each changelist should render in the same number of queries whatever
+	the number of rows on the page.
+	"""
+	@classmethod
+	def setUpTestData(cls):
+		cls.user = helpers.create_superuser()
+		cls.organisation = helpers.create_organisation()
+
+	def setUp(self):
+		self.client.force_login(self.user)
+
+	def changelist_queries(self, model):
+		url = reverse(
+			'admin:signup_{}_changelist'.format(model._meta.model_name),
+		)
+		with CaptureQueriesContext(connection) as context:
+			response = self.client.get(url)
+		self.assertEqual(response.status_code, 200)
+		return len(context.captured_queries)
+
+	def test_changelists_use_constant_queries(self):
+		admin_models = [
+			models.Package,
+			models.Country,
+			models.Banding,
+			models.SignUp,
+			models.Contact,
+			models.Organisation,
+			models.Resource,
+			models.NewsItem,
+			models.AccessLog,
+			models.AccessLogExportCode,
+			models.OutboxMessage,
+		]
+
+		helpers.add_rows(self.organisation, self.user, 0, 2)
+		small = {model: self.changelist_queries(model) for model in admin_models}
+
+		helpers.add_rows(self.organisation, self.user, 2, 20)
+		for model in admin_models:
+			with self.subTest(model=model.__name__):
+				self.assertEqual(self.changelist_queries(model), small[model])
+
+
+class AccessLogOverlapReportTests(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.user = helpers.create_superuser()
+		cls.organisation = helpers.create_organisation()
+		cls.package = helpers.create_package(cls.organisation)
+		cls.banding = helpers.create_banding(cls.organisation)
+
+	def setUp(self):
+		self.client.force_login(self.user)
+
+	def grant(self, number, ip_range, institution=None, revoke=False):
+		signup = helpers.create_signup(
+			self.package,
+			self.banding,
+			number,
+			institution=institution or 'University {}'.format(number),
+		)
+		access_log = models.AccessLog.objects.create(
+			signup=signup,
+			access_type='grant',
+			ip_range=ip_range,
+		)
+		if revoke:
+			models.AccessLog.objects.create(
+				signup=signup,
+				access_type='revoke',
+				ip_range=ip_range,
+			)
+		return access_log
+
+	def report(self):
+		response = self.client.get(reverse('admin:signup_accesslog_overlaps'))
+		self.assertEqual(response.status_code, 200)
+		return response
+
+	def test_lists_overlaps_between_institutions(self):
+		outer = self.grant(0, '10.0.0.0/16')
+		inner = self.grant(1, '10.0.5.0/24')
+		self.grant(2, '10.1.0.0/24')
+
+		response = self.report()
+
+		self.assertEqual(response.context['overlap_count'], 1)
+		row = response.context['overlaps'][0]
+		self.assertEqual(
+			(row['range'].access_log_id, row['other_range'].access_log_id),
+			(outer.pk, inner.pk),
+		)
+		self.assertEqual(row['overlap'], '10.0.5.0-10.0.5.255')
+		self.assertContains(response, '1 overlap found')
+
+	def test_ignores_same_institution_and_revoked_access(self):
+		self.grant(0, '10.0.0.0/16', institution='Northern University')
+		self.grant(1, '10.0.5.0/24', institution=' northern university')
+		self.grant(2, '10.0.6.0/24', revoke=True)
+
+		response = self.report()
+
+		self.assertEqual(response.context['overlap_count'], 0)
+		self.assertContains(response, '0 overlaps found')
+
+
+class SignUpAccessActionTests(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.user = helpers.create_superuser()
+		cls.organisation = helpers.create_organisation()
+		cls.package = helpers.create_package(cls.organisation)
+		cls.banding = helpers.create_banding(cls.organisation)
+		cls.new = helpers.create_signup(cls.package, cls.banding, 0)
+		cls.granted = helpers.create_signup(cls.package, cls.banding, 1)
+		cls.revoked = helpers.create_signup(cls.package, cls.banding, 2)
+		for signup in (cls.granted, cls.revoked):
+			models.AccessLog.objects.create(
+				signup=signup,
+				access_type='grant',
+				ip_range='10.0.0.0/24',
+			)
+		models.AccessLog.objects.create(
+			signup=cls.revoked,
+			access_type='revoke',
+			ip_range='10.0.0.0/24',
+		)
+
+	def setUp(self):
+		self.client.force_login(self.user)
+
+	def run_action(self, action, apply=True, **data):
+		post = {
+			'action': action,
+			admin.helpers.ACTION_CHECKBOX_NAME: [
+				self.new.pk,
+				self.granted.pk,
+				self.revoked.pk,
+			],
+			**data,
+		}
+		if apply:
+			post['apply'] = '1'
+		return self.client.post(
+			reverse('admin:signup_signup_changelist'),
+			post,
+			follow=apply,
+		)
+
+	def logged(self, access_type):
+		return sorted(
+			models.AccessLog.objects.filter(
+				access_type=access_type,
+				user=self.user,
+			).values_list(
+				'signup_id',
+				flat=True,
+			)
+		)
+
+	def messages(self, response):
+		return [str(message) for message in response.context['messages']]
+
+	def test_asks_for_ip_range_first(self):
+		response = self.run_action('grant_access', apply=False)
+
+		self.assertTemplateUsed(response, 'admin/signup/signup/change_access.html')
+		self.assertEqual(self.logged('grant'), [])
+
+	def test_grant_skips_signups_with_access(self):
+		response = self.run_action('grant_access')
+
+		self.assertEqual(self.logged('grant'), [self.new.pk, self.revoked.pk])
+		self.assertEqual(
+			self.messages(response),
+			['Recorded grant for 2 signup(s). Skipped 1 signup(s) that '
+			 'already had access.'],
+		)
+		self.assertEqual(
+			models.SignUp.objects.get(pk=self.revoked.pk).access_status,
+			'grant',
+		)
+
+	def test_grant_with_new_ip_range(self):
+		response = self.run_action('grant_access', ip_range='10.1.0.0/24')
+
+		self.assertEqual(
+			self.logged('grant'),
+			[self.new.pk, self.granted.pk, self.revoked.pk],
+		)
+		self.assertEqual(
+			self.messages(response),
+			['Recorded grant for 3 signup(s).'],
+		)
+		self.assertEqual(
+			models.SignUp.objects.get(pk=self.granted.pk).access_ip_range,
+			'10.1.0.0/24',
+		)
+
+	def test_revoke_skips_signups_without_access(self):
+		response = self.run_action('revoke_access')
+
+		self.assertEqual(self.logged('revoke'), [self.granted.pk])
+		self.assertEqual(
+			self.messages(response),
+			['Recorded revoke for 1 signup(s). Skipped 2 signup(s) that did '
+			 'not have access.'],
+		)
+
+	def test_rejects_invalid_ip_range(self):
+		response = self.run_action('grant_access', ip_range='see ticket')
+
+		self.assertContains(response, 'Not an IP address or range: see, ticket')
+		self.assertEqual(self.logged('grant'), [])
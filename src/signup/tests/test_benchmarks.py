@@ -0,0 +1,39 @@
+from django.test import SimpleTestCase
+
+from signup.benchmarks import BenchmarkResult, find_regressions
+
+
+def result(*times, name='bench'):
+	return BenchmarkResult(name, 1, list(times))
+
+
+class FindRegressionsTests(SimpleTestCase):
+	def test_compares_fastest_times(self):
+		baseline = {'bench': {'median': 1.0, 'min': 1.0, 'spread': 0}}
+
+		# A slow median from a few disturbed repeats is not a regression.
+		self.assertEqual(
+			find_regressions([result(1.1, 1.5, 1.6, 1.7)], baseline, 0.2),
+			[],
+		)
+		regressions = find_regressions([result(1.3, 1.3, 1.4)], baseline, 0.2)
+
+		self.assertEqual(len(regressions), 1)
+		self.assertAlmostEqual(regressions[0].change, 0.3)
+
+	def test_noisy_baseline_allows_more(self):
+		baseline = {'bench': {'median': 1.1, 'min': 1.0, 'spread': 0.1}}
+
+		self.assertEqual(
+			find_regressions([result(1.25)], baseline, 0.2),
+			[],
+		)
+		regressions = find_regressions([result(1.35)], baseline, 0.2)
+		self.assertEqual(len(regressions), 1)
+		self.assertAlmostEqual(regressions[0].tolerance, 0.3)
+
+	def test_baselines_without_spread(self):
+		baseline = {'bench': {'median': 1.0, 'min': 1.0}}
+
+		self.assertEqual(len(find_regressions([result(1.3)], baseline, 0.2)), 1)
+		self.assertEqual(find_regressions([result(5, name='new')], baseline, 0.2), [])
@@ -0,0 +1,75 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from signup.cache import LocalCache, MISSING
+from signup.middleware import get_organisation_for_host, organisation_cache
+from signup.tests import helpers
+
+
+class LocalCacheTests(SimpleTestCase):
+	@override_settings(TEST_CACHE_SIZE=2)
+	def test_evicts_least_recently_used(self):
+		cache = LocalCache('TEST_CACHE_TIMEOUT', size_setting='TEST_CACHE_SIZE')
+		cache.set('a', 1)
+		cache.set('b', 2)
+		cache.get('a')
+		cache.set('c', 3)
+
+		self.assertEqual(len(cache), 2)
+		self.assertEqual(cache.get('a'), 1)
+		self.assertIs(cache.get('b'), MISSING)
+		self.assertEqual(cache.get('c'), 3)
+
+	@override_settings(TEST_CACHE_TIMEOUT=10)
+	def test_expires(self):
+		cache = LocalCache('TEST_CACHE_TIMEOUT')
+		with mock.patch('signup.cache.monotonic', return_value=100):
+			cache.set('a', 1)
+		with mock.patch('signup.cache.monotonic', return_value=105):
+			self.assertEqual(cache.get('a'), 1)
+		with mock.patch('signup.cache.monotonic', return_value=111):
+			self.assertIs(cache.get('a'), MISSING)
+
+		self.assertEqual(len(cache), 0)
+
+
+class OrganisationHostCacheTests(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.organisation = helpers.create_organisation('known.example.org')
+
+	def setUp(self):
+		organisation_cache.clear()
+		self.addCleanup(organisation_cache.clear)
+
+	@override_settings(ALLOWED_HOSTS=['*'])
+	def test_hits_cached(self):
+		self.assertEqual(
+			get_organisation_for_host('known.example.org:8000'),
+			self.organisation,
+		)
+		with self.assertNumQueries(0):
+			get_organisation_for_host('KNOWN.example.org:8000')
+
+	@override_settings(ALLOWED_HOSTS=['*'])
+	def test_misses_not_cached_for_wildcard_hosts(self):
+		for port in range(10):
+			self.assertIsNone(
+				get_organisation_for_host('unknown.example.org:{}'.format(port)),
+			)
+
+		self.assertEqual(len(organisation_cache), 0)
+
+	@override_settings(ALLOWED_HOSTS=['.example.org'])
+	def test_misses_cached_for_allowed_hosts(self):
+		self.assertIsNone(get_organisation_for_host('unknown.example.org'))
+		with self.assertNumQueries(0):
+			self.assertIsNone(get_organisation_for_host('unknown.example.org'))
+
+	@override_settings(ORGANISATION_CACHE_SIZE=3, ALLOWED_HOSTS=['.example.org'])
+	def test_size_limited(self):
+		for number in range(10):
+			get_organisation_for_host('unknown{}.example.org'.format(number))
+
+		self.assertEqual(len(organisation_cache), 3)
@@ -0,0 +1,94 @@
+from django.test import TestCase
+
+from signup import models
+from signup.tests import helpers
+
+
+class RecipientEmailsTests(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.organisation = helpers.create_organisation()
+		cls.other_organisation = helpers.create_organisation('other.example')
+		cls.country = models.Country.objects.create(name='Testland', code='TL')
+		cls.other_country = models.Country.objects.create(
+			name='Otherland',
+			code='OL',
+		)
+		cls.contact('everywhere@example.org')
+		cls.contact('Everywhere@Example.org')
+		cls.contact('local@example.org', country=cls.country)
+		cls.contact('other@example.org', country=cls.other_country)
+		cls.contact('access@example.org', contact_type='access')
+		cls.contact(
+			'elsewhere@example.org',
+			organisation=cls.other_organisation,
+		)
+
+	@classmethod
+	def contact(cls, email, organisation=None, **kwargs):
+		return models.Contact.objects.create(
+			organisation=organisation or cls.organisation,
+			name=email,
+			email=email,
+			**kwargs
+		)
+
+	def setUp(self):
+		models.contact_cache.clear()
+		self.addCleanup(models.contact_cache.clear)
+
+	def emails(self, *args):
+		return sorted(
+			models.Contact.recipient_emails(self.organisation.pk, *args),
+		)
+
+	def test_deduplicated(self):
+		emails = self.emails('billing')
+		self.assertEqual(len(emails), 3)
+		self.assertEqual(
+			[email.lower() for email in emails],
+			[
+				'everywhere@example.org',
+				'local@example.org',
+				'other@example.org',
+			],
+		)
+
+	def test_country(self):
+		self.assertEqual(
+			[email.lower() for email in self.emails('billing', self.country.pk)],
+			['everywhere@example.org', 'local@example.org'],
+		)
+		self.assertEqual(
+			[email.lower() for email in self.emails('billing', None)],
+			['everywhere@example.org'],
+		)
+
+	def test_contact_type(self):
+		self.assertEqual(self.emails('access'), ['access@example.org'])
+
+	def test_cached(self):
+		self.emails('billing')
+		with self.assertNumQueries(0):
+			self.emails('billing')
+
+	def test_cleared_on_save(self):
+		self.assertEqual(self.emails('access'), ['access@example.org'])
+		self.contact('new@example.org', contact_type='access')
+		self.assertEqual(
+			self.emails('access'),
+			['access@example.org', 'new@example.org'],
+		)
+
+		contact = models.Contact.objects.get(email='new@example.org')
+		contact.email = 'renamed@example.org'
+		contact.save()
+		self.assertEqual(
+			self.emails('access'),
+			['access@example.org', 'renamed@example.org'],
+		)
+
+	def test_cleared_on_delete(self):
+		self.assertEqual(self.emails('access'), ['access@example.org'])
+		models.Contact.objects.get(email='access@example.org').delete()
+		self.assertEqual(self.emails('access'), [])
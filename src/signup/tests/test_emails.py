@@ -0,0 +1,53 @@
+from django.template import TemplateSyntaxError
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from signup import emails, forms
+
+
+class CompileEmailTemplateTests(SimpleTestCase):
+	def setUp(self):
+		emails._templates.clear()
+		self.addCleanup(emails._templates.clear)
+
+	def test_cached(self):
+		template = emails.compile_email_template('Hello {{ name }}')
+		self.assertIs(emails.compile_email_template('Hello {{ name }}'), template)
+		self.assertIsNot(emails.compile_email_template('Hi {{ name }}'), template)
+
+	@override_settings(EMAIL_TEMPLATE_CACHE_SIZE=2)
+	def test_least_recently_used_evicted(self):
+		first = emails.compile_email_template('first')
+		second = emails.compile_email_template('second')
+		# Using the first makes the second the least recently used.
+		emails.compile_email_template('first')
+		emails.compile_email_template('third')
+
+		self.assertEqual(len(emails._templates), 2)
+		self.assertIs(emails.compile_email_template('first'), first)
+		self.assertIsNot(emails.compile_email_template('second'), second)
+
+	def test_invalid(self):
+		with self.assertRaises(TemplateSyntaxError):
+			emails.compile_email_template('{% if %}')
+		self.assertEqual(len(emails._templates), 0)
+
+	def test_render(self):
+		self.assertEqual(
+			emails.render_email({'name': 'World'}, 'Hello {{ name }}\nBye'),
+			'Hello World<br>Bye',
+		)
+
+
+class OrganisationFormTests(TestCase):
+	def test_invalid_template(self):
+		form = forms.OrganisationForm(data={
+			'institution_message': 'Thanks {% if %}',
+			'billing_manager_message': 'New pledge from {{ signup.institution }}.',
+		})
+
+		self.assertFalse(form.is_valid())
+		self.assertEqual(len(form.errors['institution_message']), 1)
+		self.assertTrue(
+			form.errors['institution_message'][0].startswith('Template error:'),
+		)
+		self.assertNotIn('billing_manager_message', form.errors)
@@ -0,0 +1,301 @@
+import json
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from signup import entitlements, models
+from signup.entitlements import Entitlement, EntitlementIndex, lookup_result
+from signup.tests import helpers
+
+
+def row(signup_id, ip_range):
+	return (
+		signup_id,
+		'University {}'.format(signup_id),
+		1,
+		'Package',
+		ip_range,
+	)
+
+
+def signup_ids(index, ip):
+	return sorted(entitlement.signup_id for entitlement in index.lookup(ip))
+
+
+class EntitlementIndexTests(SimpleTestCase):
+	def test_empty(self):
+		index = EntitlementIndex()
+		self.assertEqual(index.lookup('10.0.0.1'), ())
+		self.assertEqual(index.lookup('2001:db8::1'), ())
+
+	def test_entitlement(self):
+		index = EntitlementIndex([row(1, '10.0.0.0/24')])
+		self.assertEqual(
+			index.lookup('10.0.0.1'),
+			(Entitlement(1, 'University 1', 1, 'Package'),),
+		)
+
+	def test_overlapping(self):
+		index = EntitlementIndex([
+			row(1, '10.0.0.0-10.0.0.20'),
+			row(2, '10.0.0.10-10.0.0.30'),
+		])
+		self.assertEqual(signup_ids(index, '10.0.0.9'), [1])
+		self.assertEqual(signup_ids(index, '10.0.0.10'), [1, 2])
+		self.assertEqual(signup_ids(index, '10.0.0.20'), [1, 2])
+		self.assertEqual(signup_ids(index, '10.0.0.21'), [2])
+		self.assertEqual(signup_ids(index, '10.0.0.30'), [2])
+		self.assertEqual(signup_ids(index, '10.0.0.31'), [])
+
+	def test_nested(self):
+		index = EntitlementIndex([
+			row(1, '10.0.0.0/16'),
+			row(2, '10.0.5.0/24'),
+		])
+		self.assertEqual(signup_ids(index, '10.0.4.255'), [1])
+		self.assertEqual(signup_ids(index, '10.0.5.0'), [1, 2])
+		self.assertEqual(signup_ids(index, '10.0.5.255'), [1, 2])
+		self.assertEqual(signup_ids(index, '10.0.6.0'), [1])
+		self.assertEqual(signup_ids(index, '10.1.0.0'), [])
+
+	def test_adjacent(self):
+		index = EntitlementIndex([
+			row(1, '10.0.0.0/24'),
+			row(2, '10.0.1.0/24'),
+		])
+		self.assertEqual(signup_ids(index, '10.0.0.255'), [1])
+		self.assertEqual(signup_ids(index, '10.0.1.0'), [2])
+
+	def test_several_ranges_of_one_signup(self):
+		index = EntitlementIndex([row(1, '10.0.0.0/24, 10.0.0.128/25')])
+		self.assertEqual(
+			index.lookup('10.0.0.200'),
+			(Entitlement(1, 'University 1', 1, 'Package'),),
+		)
+		self.assertEqual(signup_ids(index, '10.0.1.0'), [])
+
+	def test_ip_versions_kept_apart(self):
+		# ::a00:1 has the same integer value as 10.0.0.1.
+		index = EntitlementIndex([
+			row(1, '10.0.0.0/24'),
+			row(2, '2001:db8::/32'),
+		])
+		self.assertEqual(signup_ids(index, '10.0.0.1'), [1])
+		self.assertEqual(signup_ids(index, '::a00:1'), [])
+		self.assertEqual(signup_ids(index, '2001:db8::1'), [2])
+
+	def test_unparseable_ranges_skipped(self):
+		index = EntitlementIndex([row(1, 'not a range'), row(2, '')])
+		self.assertEqual(index.lookup('10.0.0.1'), ())
+
+	def test_update_replaces(self):
+		index = EntitlementIndex([row(1, '10.0.0.0/24')])
+		self.assertEqual(signup_ids(index, '10.0.0.1'), [1])
+		index.update(1, row(1, '10.0.1.0/24'))
+		self.assertEqual(signup_ids(index, '10.0.0.1'), [])
+		self.assertEqual(signup_ids(index, '10.0.1.1'), [1])
+
+	def test_update_removes(self):
+		index = EntitlementIndex([
+			row(1, '10.0.0.0/24'),
+			row(2, '10.0.0.0/16'),
+		])
+		self.assertEqual(signup_ids(index, '10.0.0.1'), [1, 2])
+		index.update(1)
+		self.assertEqual(signup_ids(index, '10.0.0.1'), [2])
+		index.update(3)
+		self.assertEqual(signup_ids(index, '10.0.0.1'), [2])
+
+	def test_update_adds(self):
+		index = EntitlementIndex()
+		index.update(1, row(1, '10.0.0.0/24'))
+		self.assertEqual(signup_ids(index, '10.0.0.1'), [1])
+
+	def test_lookup_result(self):
+		index = EntitlementIndex([row(1, '10.0.0.0/24')])
+		self.assertEqual(lookup_result(index, '10.0.0.1'), {
+			'ip': '10.0.0.1',
+			'entitled': True,
+			'entitlements': [{
+				'signup': 1,
+				'institution': 'University 1',
+				'package': 1,
+				'package_name': 'Package',
+			}],
+		})
+		self.assertEqual(lookup_result(index, '10.0.1.1'), {
+			'ip': '10.0.1.1',
+			'entitled': False,
+			'entitlements': [],
+		})
+
+	def test_lookup_result_invalid(self):
+		index = EntitlementIndex([row(1, '10.0.0.0/24')])
+		for ip in ('', 'example.org', '10.0.0.256', '10.0.0.0/24'):
+			self.assertEqual(lookup_result(index, ip), {
+				'ip': ip,
+				'entitled': False,
+				'error': 'Invalid IP address',
+			})
+
+
+class CachedIndexTests(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.user = User.objects.create_user('access')
+		cls.organisation = helpers.create_organisation()
+		cls.package = helpers.create_package(cls.organisation)
+		cls.banding = helpers.create_banding(cls.organisation)
+		cls.signups = [
+			helpers.create_signup(cls.package, cls.banding, number)
+			for number in range(2)
+		]
+		cls.grant(cls.signups[0], '10.0.0.0/24')
+		cls.export_code = models.AccessLogExportCode.objects.create(
+			organisation=cls.organisation,
+			issued_to='Platform',
+		)
+
+	@classmethod
+	def grant(cls, signup, ip_range):
+		models.AccessLog.objects.create(
+			signup=signup,
+			access_type='grant',
+			ip_range=ip_range,
+			user=cls.user,
+		)
+
+	def setUp(self):
+		entitlements.index_cache.clear()
+		self.addCleanup(entitlements.index_cache.clear)
+		self.url = reverse('lookup_access', args=[self.export_code.uuid])
+
+	def test_cached(self):
+		index = entitlements.get_index(self.organisation.pk)
+		with self.assertNumQueries(1):
+			self.assertIs(entitlements.get_index(self.organisation.pk), index)
+
+	def test_rebuilt_after_change(self):
+		# Changes made by another worker only reach this one through the
+		# export version.
+		index = entitlements.get_index(self.organisation.pk)
+		self.grant(self.signups[1], '10.0.1.0/24')
+		rebuilt = entitlements.get_index(self.organisation.pk)
+		self.assertIsNot(rebuilt, index)
+		self.assertEqual(signup_ids(rebuilt, '10.0.1.1'), [self.signups[1].pk])
+		self.assertEqual(
+			rebuilt.version,
+			models.AccessLogExportVersion.current(self.organisation.pk),
+		)
+
+	def test_update_signups(self):
+		index = entitlements.get_index(self.organisation.pk)
+		self.grant(self.signups[1], '10.0.1.0/24')
+		version = models.AccessLogExportVersion.current(self.organisation.pk)
+		entitlements.update_signups(
+			self.organisation.pk,
+			[self.signups[1].pk],
+			version,
+		)
+		with self.assertNumQueries(1):
+			self.assertIs(entitlements.get_index(self.organisation.pk), index)
+		self.assertEqual(signup_ids(index, '10.0.1.1'), [self.signups[1].pk])
+
+	def test_update_signups_after_missed_change(self):
+		index = entitlements.get_index(self.organisation.pk)
+		self.grant(self.signups[1], '10.0.1.0/24')
+		self.grant(self.signups[1], '10.0.2.0/24')
+		version = models.AccessLogExportVersion.current(self.organisation.pk)
+		entitlements.update_signups(
+			self.organisation.pk,
+			[self.signups[1].pk],
+			version,
+		)
+		self.assertEqual(signup_ids(index, '10.0.1.1'), [])
+		self.assertIsNot(entitlements.get_index(self.organisation.pk), index)
+
+	def test_get(self):
+		response = self.client.get(self.url, {'ip': '10.0.0.1'})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json()['ip'], '10.0.0.1')
+		self.assertIs(response.json()['entitled'], True)
+		self.assertEqual(
+			response.json()['entitlements'][0]['signup'],
+			self.signups[0].pk,
+		)
+
+	def test_get_several(self):
+		response = self.client.get(self.url, {'ip': ['10.0.0.1', 'nonsense']})
+		self.assertEqual(response.status_code, 200)
+		results = response.json()['results']
+		self.assertEqual([result['ip'] for result in results], [
+			'10.0.0.1',
+			'nonsense',
+		])
+		self.assertIs(results[0]['entitled'], True)
+		self.assertEqual(results[1]['error'], 'Invalid IP address')
+
+	def test_get_without_ip(self):
+		response = self.client.get(self.url)
+		self.assertEqual(response.status_code, 400)
+
+	def test_post(self):
+		response = self.client.post(
+			self.url,
+			json.dumps({'ips': ['10.0.0.1', '10.0.1.1']}),
+			content_type='application/json',
+		)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(
+			[result['entitled'] for result in response.json()['results']],
+			[True, False],
+		)
+
+	def test_post_invalid(self):
+		for body in ('nonsense', '{}', '{"ips": "10.0.0.1"}', '{"ips": [1]}'):
+			response = self.client.post(
+				self.url,
+				body,
+				content_type='application/json',
+			)
+			self.assertEqual(response.status_code, 400, body)
+
+	@override_settings(ENTITLEMENT_LOOKUP_BATCH_LIMIT=2)
+	def test_limit(self):
+		response = self.client.post(
+			self.url,
+			json.dumps({'ips': ['10.0.0.1', '10.0.0.2']}),
+			content_type='application/json',
+		)
+		self.assertEqual(response.status_code, 200)
+
+		response = self.client.post(
+			self.url,
+			json.dumps({'ips': ['10.0.0.1', '10.0.0.2', '10.0.0.3']}),
+			content_type='application/json',
+		)
+		self.assertEqual(response.status_code, 400)
+		response = self.client.get(
+			self.url,
+			{'ip': ['10.0.0.1', '10.0.0.2', '10.0.0.3']},
+		)
+		self.assertEqual(response.status_code, 400)
+
+	def test_inactive_code(self):
+		models.AccessLogExportCode.objects.filter(
+			pk=self.export_code.pk,
+		).update(active=False)
+		response = self.client.get(self.url, {'ip': '10.0.0.1'})
+		self.assertEqual(response.status_code, 404)
+
+	def test_one_version_query_per_request(self):
+		entitlements.get_index(self.organisation.pk)
+		ips = ['10.0.0.{}'.format(number) for number in range(50)]
+		with self.assertNumQueries(2):
+			response = self.client.post(
+				self.url,
+				json.dumps({'ips': ips}),
+				content_type='application/json',
+			)
+		self.assertEqual(len(response.json()['results']), 50)
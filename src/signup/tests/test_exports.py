@@ -0,0 +1,334 @@
+import csv
+import io
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from signup import exports, models
+from signup.tests import helpers
+
+
+class SnapshotTests(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.user = User.objects.create_user('access')
+		cls.organisation = helpers.create_organisation()
+		cls.package = helpers.create_package(cls.organisation)
+		cls.banding = helpers.create_banding(cls.organisation)
+		cls.signup = helpers.create_signup(cls.package, cls.banding)
+		cls.access_log = models.AccessLog.objects.create(
+			signup=cls.signup,
+			access_type='grant',
+			ip_range='10.0.0.0/24',
+			user=cls.user,
+		)
+		cls.export_code = models.AccessLogExportCode.objects.create(
+			organisation=cls.organisation,
+			issued_to='Platform',
+		)
+
+	def setUp(self):
+		self.snapshot_dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.snapshot_dir)
+		settings_override = override_settings(
+			ACCESS_LOG_SNAPSHOT_DIR=self.snapshot_dir,
+		)
+		settings_override.enable()
+		self.addCleanup(settings_override.disable)
+		self.url = reverse('export_access_log', args=[self.export_code.uuid])
+
+	def export(self, etag=None):
+		headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+		response = self.client.get(self.url, **headers)
+		body = b''.join(response.streaming_content).decode('utf-8') \
+			if response.status_code == 200 else ''
+		return response, body
+
+	def snapshot_files(self):
+		return sorted(
+			name for name in os.listdir(self.snapshot_dir)
+			if name.endswith(('.csv', '.tmp'))
+		)
+
+	def test_written_on_first_read(self):
+		response, body = self.export()
+
+		self.assertEqual(response.status_code, 200)
+		self.assertIn('10.0.0.0/24', body)
+		self.assertEqual(
+			response['X-Next-Cursor'],
+			str(models.AccessLogExportVersion.current(self.organisation.pk)),
+		)
+		self.assertEqual(len(self.snapshot_files()), 1)
+
+	def test_not_modified(self):
+		response, _body = self.export()
+		with self.assertNumQueries(2):
+			not_modified, _body = self.export(response['ETag'])
+
+		self.assertEqual(not_modified.status_code, 304)
+		self.assertEqual(not_modified['ETag'], response['ETag'])
+		self.assertEqual(not_modified['X-Next-Cursor'], response['X-Next-Cursor'])
+
+	def test_rebuilt_after_new_entry(self):
+		response, _body = self.export()
+		access_log = models.AccessLog.objects.create(
+			signup=self.signup,
+			access_type='revoke',
+			ip_range='10.0.0.0/24',
+			user=self.user,
+		)
+
+		rebuilt, body = self.export(response['ETag'])
+
+		self.assertEqual(rebuilt.status_code, 200)
+		self.assertNotEqual(rebuilt['ETag'], response['ETag'])
+		self.assertIn('revoke', body)
+		self.assertEqual(
+			rebuilt['X-Next-Cursor'],
+			str(models.AccessLog.objects.get(pk=access_log.pk).export_sequence),
+		)
+		self.assertEqual(len(self.snapshot_files()), 1)
+
+	def test_previous_served_while_rebuilding(self):
+		response, _body = self.export()
+		models.AccessLog.objects.create(
+			signup=self.signup,
+			access_type='revoke',
+			ip_range='10.0.0.0/24',
+			user=self.user,
+		)
+
+		# Another process holding the lock is rebuilding the snapshot.
+		with exports.snapshot_lock(self.organisation.pk):
+			previous, body = self.export()
+			not_modified, _body = self.export(response['ETag'])
+
+		self.assertEqual(previous.status_code, 200)
+		self.assertNotIn('revoke', body)
+		self.assertEqual(previous['ETag'], response['ETag'])
+		self.assertEqual(previous['X-Next-Cursor'], response['X-Next-Cursor'])
+		self.assertEqual(not_modified.status_code, 304)
+
+		rebuilt, body = self.export(response['ETag'])
+		self.assertEqual(rebuilt.status_code, 200)
+		self.assertIn('revoke', body)
+
+	def test_rebuilt_after_edits(self):
+		response, _body = self.export()
+
+		access_log = models.AccessLog.objects.get(pk=self.access_log.pk)
+		access_log.ip_range = '192.168.0.0/16'
+		access_log.save()
+		rebuilt, body = self.export(response['ETag'])
+		self.assertEqual(rebuilt.status_code, 200)
+		self.assertIn('192.168.0.0/16', body)
+
+		signup = models.SignUp.objects.get(pk=self.signup.pk)
+		signup.institution = 'Renamed University'
+		signup.save()
+		renamed, body = self.export(rebuilt['ETag'])
+		self.assertEqual(renamed.status_code, 200)
+		self.assertIn('Renamed University', body)
+
+		package = models.Package.objects.get(pk=self.package.pk)
+		package.name = 'Renamed Package'
+		package.save()
+		repackaged, body = self.export(renamed['ETag'])
+		self.assertEqual(repackaged.status_code, 200)
+		self.assertIn('Renamed Package', body)
+
+	def test_older_version_not_published(self):
+		models.AccessLogExportVersion.bump(self.organisation.pk)
+		newer = exports.write_snapshot(self.organisation.pk)
+
+		# A writer that read the version before the last change finishes
+		# after the newer snapshot was published.
+		models.AccessLog.objects.create(
+			signup=self.signup,
+			access_type='revoke',
+			user=self.user,
+		)
+		with mock.patch.object(
+			models.AccessLogExportVersion,
+			'current',
+			return_value=newer.version - 1,
+		):
+			snapshot = exports.write_snapshot(self.organisation.pk)
+
+		self.assertEqual(snapshot.etag, newer.etag)
+		self.assertEqual(exports.read_snapshot(self.organisation.pk).etag, newer.etag)
+		self.assertEqual(self.snapshot_files(), [os.path.basename(newer.path)])
+
+	def test_leftover_files_removed(self):
+		other = os.path.join(self.snapshot_dir, 'access_log_999_abc.csv')
+		for name in (
+			'access_log_{}_0123456789abcdef.csv',
+			'access_log_{}_unfinished.tmp',
+		):
+			open(os.path.join(
+				self.snapshot_dir,
+				name.format(self.organisation.pk),
+			), 'w').close()
+		open(other, 'w').close()
+
+		snapshot = exports.write_snapshot(self.organisation.pk)
+
+		self.assertEqual(
+			self.snapshot_files(),
+			sorted(['access_log_999_abc.csv', os.path.basename(snapshot.path)]),
+		)
+
+	def test_command_writes_stale_snapshots(self):
+		stdout = io.StringIO()
+		call_command('write_access_log_snapshots', stdout=stdout)
+		self.assertIn('(1 entries', stdout.getvalue())
+
+		stdout = io.StringIO()
+		call_command('write_access_log_snapshots', stdout=stdout)
+		self.assertIn(
+			'Organisation {} is up to date'.format(self.organisation.pk),
+			stdout.getvalue(),
+		)
+
+		models.AccessLog.objects.get(pk=self.access_log.pk).delete()
+		stdout = io.StringIO()
+		call_command('write_access_log_snapshots', stdout=stdout)
+		self.assertIn('(0 entries', stdout.getvalue())
+
+
+class IncrementalExportTests(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.organisation = helpers.create_organisation()
+		cls.package = helpers.create_package(cls.organisation)
+		cls.other_package = helpers.create_package(cls.organisation, 'Other')
+		cls.banding = helpers.create_banding(cls.organisation)
+		cls.signup = helpers.create_signup(cls.package, cls.banding)
+		cls.other_signup = helpers.create_signup(cls.other_package, cls.banding, 1)
+		cls.export_code = models.AccessLogExportCode.objects.create(
+			organisation=cls.organisation,
+			issued_to='Platform',
+		)
+
+	def setUp(self):
+		self.url = reverse('export_access_log', args=[self.export_code.uuid])
+		self.logged = 0
+
+	def log(self, signup=None, access_type='grant', **kwargs):
+		# Each entry gets its own IP range to tell the rows apart by.
+		self.logged += 1
+		return models.AccessLog.objects.create(
+			signup=signup or self.signup,
+			access_type=access_type,
+			ip_range='10.0.{}.0/24'.format(self.logged),
+			**kwargs
+		)
+
+	def export(self, **params):
+		response = self.client.get(self.url, params)
+		self.assertEqual(response.status_code, 200)
+		lines = b''.join(response.streaming_content).decode('utf-8')
+		rows = list(csv.DictReader(io.StringIO(lines, newline='')))
+		return response, [row['IP Range'] for row in rows]
+
+	def assertExports(self, rows, *access_logs):
+		self.assertEqual(rows, [access_log.ip_range for access_log in access_logs])
+
+	def test_since_returns_later_entries(self):
+		first = self.log()
+		response, rows = self.export(since=0)
+		self.assertExports(rows, first)
+
+		second = self.log(access_type='revoke')
+		later, rows = self.export(since=response['X-Next-Cursor'])
+		self.assertExports(rows, second)
+		self.assertEqual(
+			later['X-Next-Cursor'],
+			str(models.AccessLogExportVersion.current(self.organisation.pk)),
+		)
+
+		unchanged, rows = self.export(since=later['X-Next-Cursor'])
+		self.assertExports(rows)
+		self.assertEqual(unchanged['X-Next-Cursor'], later['X-Next-Cursor'])
+
+	def test_entry_committed_after_cursor_with_lower_pk(self):
+		# Stands in for an entry whose transaction took its pk before the
+		# entries in the previous export but committed after it.
+		self.log(pk=100)
+		response, _rows = self.export(since=0)
+
+		late = self.log(pk=50, date_stamp=timezone.now() - timedelta(days=30))
+		_response, rows = self.export(since=response['X-Next-Cursor'])
+
+		self.assertExports(rows, late)
+
+	def test_edited_entry_returned_again(self):
+		access_log = self.log()
+		self.log()
+		response, _rows = self.export(since=0)
+
+		access_log.ip_range = '192.168.0.0/16'
+		access_log.save()
+		_response, rows = self.export(since=response['X-Next-Cursor'])
+
+		self.assertEqual(rows, ['192.168.0.0/16'])
+
+	def test_bulk_changes_numbered(self):
+		response, _rows = self.export(since=0)
+		access_logs = models.record_access_changes(
+			[self.signup, self.other_signup],
+			'grant',
+			None,
+			ip_range='172.16.0.0/12',
+		)
+
+		_response, rows = self.export(since=response['X-Next-Cursor'])
+
+		self.assertEqual(len(access_logs), 2)
+		self.assertEqual(rows, ['172.16.0.0/12'] * 2)
+
+	def test_deleted_entry_not_returned(self):
+		access_log = self.log()
+		response, _rows = self.export(since=0)
+
+		access_log.delete()
+		_response, rows = self.export(since=response['X-Next-Cursor'])
+
+		self.assertExports(rows)
+
+	def test_filters(self):
+		now = timezone.now()
+		old = self.log(date_stamp=now - timedelta(days=10))
+		revoke = self.log(access_type='revoke', date_stamp=now)
+		other = self.log(self.other_signup, date_stamp=now)
+
+		_response, rows = self.export(package=self.other_package.pk)
+		self.assertExports(rows, other)
+
+		_response, rows = self.export(access_type='revoke')
+		self.assertExports(rows, revoke)
+
+		_response, rows = self.export(
+			date_from=(now - timedelta(days=1)).isoformat(),
+			since=0,
+		)
+		self.assertExports(rows, revoke, other)
+
+		_response, rows = self.export(
+			date_to=(now - timedelta(days=1)).isoformat(),
+		)
+		self.assertExports(rows, old)
+
+	def test_invalid_filters(self):
+		for params in ({'since': -1}, {'since': 'x'}, {'access_type': 'steal'}):
+			response = self.client.get(self.url, params)
+			self.assertEqual(response.status_code, 400)
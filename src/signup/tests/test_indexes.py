@@ -0,0 +1,109 @@
+from django.db import connection
+from django.db.models import Q
+from django.test import TestCase
+
+from signup import models
+from signup.tests import helpers
+
+
+def index_name(model, fields):
+	for index in model._meta.indexes:
+		if index.fields == fields:
+			return index.name
+
+	raise LookupError('{} has no index on {}'.format(model.__name__, fields))
+
+
+class QueryPlanTests(TestCase):
+	"""
+	The hot lookups should be answered from their composite indexes. Plans
+	are read with EXPLAIN, on PostgreSQL with sequential scans disabled as
+	the test tables are too small for the planner to prefer an index.
+	"""
+	@classmethod
+	def setUpTestData(cls):
+		cls.organisation = helpers.create_organisation()
+		cls.package = helpers.create_package(cls.organisation)
+		cls.banding = helpers.create_banding(cls.organisation)
+		cls.signup = helpers.create_signup(cls.package, cls.banding)
+
+	def setUp(self):
+		if connection.vendor == 'postgresql':
+			with connection.cursor() as cursor:
+				cursor.execute('SET LOCAL enable_seqscan = off')
+
+	def assertUsesIndex(self, queryset, fields):
+		plan = queryset.explain()
+		self.assertIn(index_name(queryset.model, fields), plan)
+		return plan
+
+	def test_country_code(self):
+		self.assertUsesIndex(
+			models.Country.objects.filter(code='GB'),
+			['code'],
+		)
+
+	def test_organisation_domain(self):
+		self.assertUsesIndex(
+			models.Organisation.objects.filter(
+				domain__in={'www.example.org', 'example.org'},
+			).only(
+				*models.ORGANISATION_REQUEST_FIELDS
+			),
+			['domain'],
+		)
+
+	def test_export_code(self):
+		self.assertUsesIndex(
+			models.AccessLogExportCode.objects.filter(
+				uuid='0cbbe0b2-5d1f-4b04-a0a6-6f3b0bb5e0a9',
+				active=True,
+			),
+			['uuid', 'active'],
+		)
+
+	def test_latest_access_log(self):
+		plan = self.assertUsesIndex(
+			models.AccessLog.objects.filter(
+				signup=self.signup,
+			).order_by(
+				'-date_stamp',
+				'-pk',
+			)[:1],
+			['signup', '-date_stamp', '-id'],
+		)
+		if connection.vendor == 'sqlite':
+			self.assertNotIn('TEMP B-TREE', plan)
+
+	def test_notification_contacts(self):
+		self.assertUsesIndex(
+			models.Contact.objects.filter(
+				organisation=self.organisation,
+				contact_type='billing',
+			).filter(
+				Q(country__isnull=True) | Q(country_id=1),
+			),
+			['organisation', 'contact_type', 'country'],
+		)
+
+	def test_news_items(self):
+		self.assertUsesIndex(
+			models.NewsItem.objects.filter(
+				organisation=self.organisation,
+			),
+			['organisation', '-posted'],
+		)
+
+	def test_packages(self):
+		packages = models.Package.objects.filter(
+			organisation=self.organisation,
+			hidden=False,
+		)
+
+		for queryset in (packages, packages.filter(front_page=True)):
+			plan = self.assertUsesIndex(
+				queryset,
+				['organisation', 'order', 'name'],
+			)
+			if connection.vendor == 'sqlite':
+				self.assertNotIn('TEMP B-TREE', plan)
@@ -0,0 +1,174 @@
+from ipaddress import ip_address
+
+from django.test import SimpleTestCase
+
+from signup import forms
+from signup.ip_ranges import (
+	IPInterval,
+	find_overlaps,
+	invalid_ip_ranges,
+	parse_ip_ranges,
+)
+
+
+def interval(start, end):
+	start, end = ip_address(start), ip_address(end)
+	return IPInterval(start.version, int(start), int(end))
+
+
+class ParseIPRangesTests(SimpleTestCase):
+	def assertParses(self, text, *intervals):
+		self.assertEqual(parse_ip_ranges(text), list(intervals))
+		self.assertEqual(invalid_ip_ranges(text), [])
+
+	def assertRejects(self, text, invalid=None):
+		self.assertEqual(parse_ip_ranges(text), [])
+		self.assertEqual(invalid_ip_ranges(text), invalid or [text])
+
+	def test_address(self):
+		self.assertParses('10.0.0.1', interval('10.0.0.1', '10.0.0.1'))
+		self.assertParses('2001:db8::1', interval('2001:db8::1', '2001:db8::1'))
+
+	def test_cidr(self):
+		self.assertParses('10.0.0.0/24', interval('10.0.0.0', '10.0.0.255'))
+		self.assertParses(
+			'2001:db8::/32',
+			interval('2001:db8::', '2001:db8:ffff:ffff:ffff:ffff:ffff:ffff'),
+		)
+
+	def test_start_end(self):
+		self.assertParses(
+			'10.0.0.1 - 10.0.0.9',
+			interval('10.0.0.1', '10.0.0.9'),
+		)
+		self.assertRejects('10.0.0.9-10.0.0.1')
+		self.assertRejects('10.0.0.1-2001:db8::1')
+
+	def test_wildcards(self):
+		self.assertParses('192.168.*.*', interval('192.168.0.0', '192.168.255.255'))
+		self.assertParses('192.168.*', interval('192.168.0.0', '192.168.255.255'))
+		self.assertParses(
+			'10.*.5.*',
+			*[
+				interval('10.{}.5.0'.format(n), '10.{}.5.255'.format(n))
+				for n in range(256)
+			]
+		)
+
+	def test_octet_ranges(self):
+		self.assertParses('10.0.1.1-50', interval('10.0.1.1', '10.0.1.50'))
+		self.assertParses('10.0.1-2.*', interval('10.0.1.0', '10.0.2.255'))
+		self.assertParses(
+			'10.1-2.0.*',
+			interval('10.1.0.0', '10.1.0.255'),
+			interval('10.2.0.0', '10.2.0.255'),
+		)
+		self.assertRejects('10.0.1.50-1')
+		self.assertRejects('10.0.1.1-256')
+
+	def test_separators(self):
+		self.assertParses(
+			'10.0.0.1, 10.0.0.2;10.0.0.3\n10.0.0.4',
+			*[interval('10.0.0.{}'.format(n), '10.0.0.{}'.format(n)) for n in range(1, 5)]
+		)
+
+	def test_first_octet_must_be_dotted_number(self):
+		self.assertRejects('1-50')
+		self.assertRejects('1-50.0.0.0')
+		self.assertRejects('*')
+		self.assertRejects('*.*')
+		self.assertRejects('*.0.0.1')
+		self.assertRejects('10')
+		self.assertRejects('10..*')
+		self.assertRejects('١٠.0.0.*')
+
+	def test_free_text(self):
+		self.assertRejects(
+			'see ticket 12-34',
+			['see', 'ticket', '12-34'],
+		)
+		self.assertEqual(
+			parse_ip_ranges('10.0.0.1 (main campus)'),
+			[interval('10.0.0.1', '10.0.0.1')],
+		)
+		self.assertEqual(
+			invalid_ip_ranges('10.0.0.1 (main campus)'),
+			['(main', 'campus)'],
+		)
+
+	def test_empty(self):
+		self.assertParses(None)
+		self.assertParses('')
+
+
+class FindOverlapsTests(SimpleTestCase):
+	def overlaps(self, *ranges):
+		return find_overlaps(
+			(interval(start, end), owner, name)
+			for name, owner, start, end in ranges
+		)
+
+	def test_adjacent_ranges_do_not_overlap(self):
+		self.assertEqual(
+			self.overlaps(
+				('a', 'one', '10.0.0.0', '10.0.0.255'),
+				('b', 'two', '10.0.1.0', '10.0.1.255'),
+			),
+			[],
+		)
+
+	def test_shared_address(self):
+		self.assertEqual(
+			self.overlaps(
+				('a', 'one', '10.0.0.0', '10.0.0.255'),
+				('b', 'two', '10.0.0.255', '10.0.1.255'),
+			),
+			[('a', 'b', interval('10.0.0.255', '10.0.0.255'))],
+		)
+
+	def test_nested(self):
+		self.assertEqual(
+			self.overlaps(
+				('outer', 'one', '10.0.0.0', '10.0.255.255'),
+				('inner', 'two', '10.0.5.0', '10.0.5.255'),
+				('after', 'three', '10.0.6.0', '10.0.6.255'),
+			),
+			[
+				('outer', 'inner', interval('10.0.5.0', '10.0.5.255')),
+				('outer', 'after', interval('10.0.6.0', '10.0.6.255')),
+			],
+		)
+
+	def test_same_owner_ignored(self):
+		self.assertEqual(
+			self.overlaps(
+				('a', 'one', '10.0.0.0', '10.0.255.255'),
+				('b', 'one', '10.0.5.0', '10.0.5.255'),
+			),
+			[],
+		)
+
+	def test_versions_kept_apart(self):
+		self.assertEqual(
+			find_overlaps([
+				(IPInterval(4, 0, 2 ** 32 - 1), 'one', 'a'),
+				(IPInterval(6, 0, 2 ** 32 - 1), 'two', 'b'),
+			]),
+			[],
+		)
+
+
+class BulkAccessFormTests(SimpleTestCase):
+	def test_rejects_text_that_is_not_an_address(self):
+		form = forms.BulkAccessForm({'ip_range': '10.0.0.0/24 see ticket 12-34'})
+
+		self.assertFalse(form.is_valid())
+		self.assertEqual(
+			form.errors['ip_range'],
+			['Not an IP address or range: see, ticket, 12-34'],
+		)
+
+	def test_accepts_ranges(self):
+		form = forms.BulkAccessForm({'ip_range': '10.0.0.0/24, 10.1.*'})
+
+		self.assertTrue(form.is_valid())
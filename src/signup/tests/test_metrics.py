@@ -0,0 +1,171 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+
+from django.test import (
+	RequestFactory,
+	SimpleTestCase,
+	TestCase,
+	override_settings,
+)
+from django.urls import reverse
+
+from signup import metrics, models, views
+from signup.middleware import MetricsMiddleware, organisation_cache
+from signup.tests import helpers
+
+
+def clear_histograms():
+	for histogram in metrics.HISTOGRAMS:
+		histogram.clear()
+
+
+class MetricsStoreTests(SimpleTestCase):
+	def setUp(self):
+		clear_histograms()
+		self.addCleanup(clear_histograms)
+		self.metrics_dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.metrics_dir)
+
+	def test_labelled_by_process_without_shared_store(self):
+		metrics.request_duration.observe(('index', 'example.org'), 0.02)
+
+		with override_settings(METRICS_DIR=None):
+			text = metrics.render_metrics()
+
+		self.assertIn(
+			'signup_request_duration_seconds_count{{view="index",'
+			'organisation="example.org",process="{}"}} 1'.format(
+				metrics.process_label(),
+			),
+			text,
+		)
+
+	def test_adds_up_processes(self):
+		with open(os.path.join(self.metrics_dir, 'metrics_1_other.json'), 'w') as other:
+			json.dump({
+				metrics.request_duration.name: [[
+					['index', 'example.org'],
+					{
+						'counts': [0, 1] + [0] * (len(metrics.DURATION_BUCKETS) - 2),
+						'sum': 0.01,
+						'count': 1,
+					},
+				]],
+			}, other)
+		metrics.request_duration.observe(('index', 'example.org'), 0.002)
+
+		with override_settings(METRICS_DIR=self.metrics_dir):
+			text = metrics.render_metrics()
+
+		series = 'view="index",organisation="example.org"'
+		self.assertIn(
+			'signup_request_duration_seconds_bucket{{{},le="0.005"}} 1'.format(series),
+			text,
+		)
+		self.assertIn(
+			'signup_request_duration_seconds_bucket{{{},le="0.01"}} 2'.format(series),
+			text,
+		)
+		self.assertIn(
+			'signup_request_duration_seconds_count{{{}}} 2'.format(series),
+			text,
+		)
+		self.assertNotIn('process=', text)
+
+	@override_settings(METRICS_FLUSH_INTERVAL=3600)
+	def test_flushes_at_most_once_per_interval(self):
+		with override_settings(METRICS_DIR=self.metrics_dir):
+			process_file = metrics.ProcessFile()
+			metrics.request_duration.observe(('index', ''), 0.1)
+			process_file.flush()
+			metrics.request_duration.observe(('index', ''), 0.1)
+			process_file.flush()
+
+			with open(os.path.join(self.metrics_dir, process_file.name())) as published:
+				data = json.load(published)
+
+		self.assertEqual(
+			data[metrics.request_duration.name][0][1]['count'],
+			1,
+		)
+
+
+@override_settings(METRICS_DIR=None)
+class StreamingMetricsTests(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.organisation = helpers.create_organisation()
+		cls.package = helpers.create_package(cls.organisation)
+		cls.banding = helpers.create_banding(cls.organisation)
+		cls.signup = helpers.create_signup(cls.package, cls.banding)
+		models.AccessLog.objects.create(signup=cls.signup, access_type='grant')
+		cls.export_code = models.AccessLogExportCode.objects.create(
+			organisation=cls.organisation,
+			issued_to='Platform',
+		)
+
+	def setUp(self):
+		organisation_cache.clear()
+		clear_histograms()
+		self.addCleanup(clear_histograms)
+
+	def exports_observed(self):
+		return sum(
+			values['count']
+			for labels, values in metrics.request_duration.series().items()
+			if labels[0] == 'export_access_log'
+		)
+
+	def test_observed_once_streamed(self):
+		response = self.client.get(
+			reverse('export_access_log', args=[self.export_code.uuid]),
+			{'since': 0},
+		)
+
+		self.assertIn('total;dur=', response['Server-Timing'])
+		self.assertIn('desc="before streaming"', response['Server-Timing'])
+		self.assertEqual(self.exports_observed(), 0)
+
+		before_streaming = int(
+			re.search(r'desc="(\d+) queries"', response['Server-Timing']).group(1),
+		)
+		b''.join(response.streaming_content)
+
+		self.assertEqual(self.exports_observed(), 1)
+		# The entries are only read while streaming.
+		self.assertGreater(
+			sum(
+				values['sum']
+				for labels, values in metrics.db_queries.series().items()
+				if labels[0] == 'export_access_log'
+			),
+			before_streaming,
+		)
+
+	def test_file_left_to_server(self):
+		snapshot_dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, snapshot_dir)
+		# The test client wraps streaming content itself, so call the
+		# middleware directly.
+		middleware = MetricsMiddleware(
+			lambda request: views.export_access_log(
+				request,
+				self.export_code.uuid,
+			),
+		)
+
+		with override_settings(ACCESS_LOG_SNAPSHOT_DIR=snapshot_dir):
+			response = middleware(RequestFactory().get('/'))
+		self.addCleanup(response.close)
+
+		self.assertIsNotNone(response.file_to_stream)
+		self.assertEqual(
+			sum(
+				values['count']
+				for values in metrics.request_duration.series().values()
+			),
+			1,
+		)
@@ -0,0 +1,84 @@
+from django.template.loader import render_to_string
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from signup import models
+from signup.middleware import organisation_cache
+from signup.nplusone import (
+	NPlusOneError,
+	NPlusOneWarning,
+	detect_n_plus_one,
+	query_shape,
+)
+from signup.tests import helpers
+
+
+class NPlusOneTests(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.organisation = helpers.create_organisation()
+		for number in range(5):
+			helpers.create_package(
+				cls.organisation,
+				name='Package {}'.format(number),
+			)
+
+	def setUp(self):
+		organisation_cache.clear()
+
+	def render_cards(self):
+		# image is deferred so every card loads it on its own.
+		for package in models.Package.objects.only('name', 'description'):
+			render_to_string(
+				'signup/elements/package_card.html',
+				{'package': package},
+			)
+
+	def test_query_shape(self):
+		self.assertEqual(
+			query_shape(
+				'SELECT "id" FROM "signup_package" WHERE "id" IN (%s, %s) '
+				'AND "name" = \'Gold\'  LIMIT 21'
+			),
+			'SELECT "id" FROM "signup_package" WHERE "id" IN (?) '
+			'AND "name" = ? LIMIT ?',
+		)
+
+	def test_repeated_query_raises_with_template_line(self):
+		with self.assertRaises(NPlusOneError) as raised:
+			with detect_n_plus_one(threshold=4):
+				self.render_cards()
+
+		self.assertIn(
+			'5 from {{ package.image.url }} in '
+			'signup/elements/package_card.html line 3',
+			str(raised.exception),
+		)
+
+	def test_repeated_query_warns(self):
+		with self.assertWarns(NPlusOneWarning):
+			with detect_n_plus_one(threshold=4, action='warn'):
+				self.render_cards()
+
+	def test_under_threshold(self):
+		with detect_n_plus_one(threshold=5) as recorder:
+			self.render_cards()
+
+		self.assertEqual(len(recorder.queries), 6)
+
+	@override_settings(NPLUSONE_THRESHOLD=0)
+	def test_middleware(self):
+		with self.assertRaises(NPlusOneError) as raised:
+			self.client.get(reverse('resources'))
+
+		self.assertIn(
+			'{% for resource in organisation.resource_set.all %} in '
+			'signup/resources.html line 21',
+			str(raised.exception),
+		)
+
+	@override_settings(NPLUSONE_THRESHOLD=0, NPLUSONE_ENABLED=False)
+	def test_middleware_disabled(self):
+		response = self.client.get(reverse('resources'))
+
+		self.assertEqual(response.status_code, 200)
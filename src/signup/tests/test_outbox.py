@@ -0,0 +1,277 @@
+import io
+import threading
+from datetime import timedelta
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import (
+	TestCase,
+	TransactionTestCase,
+	override_settings,
+	skipUnlessDBFeature,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from signup import models
+from signup.middleware import organisation_cache
+from signup.tests import helpers
+
+
+class FailingBackend(EmailBackend):
+	"""
+	A locmem backend that refuses messages to addresses containing 'fail'.
+	"""
+	def send_messages(self, messages):
+		for message in messages:
+			if any('fail' in address for address in message.to):
+				raise ConnectionRefusedError('Refused {}'.format(message.to))
+		return super().send_messages(messages)
+
+
+FAILING_BACKEND = 'signup.tests.test_outbox.FailingBackend'
+
+
+def create_message(to='library@example.org', **kwargs):
+	return models.OutboxMessage.objects.create(
+		subject='Subject',
+		from_email='noreply@example.org',
+		to=[to],
+		body='Body',
+		html='<p>Body</p>',
+		**kwargs
+	)
+
+
+def send_outbox(**options):
+	stdout, stderr = io.StringIO(), io.StringIO()
+	call_command('send_outbox', stdout=stdout, stderr=stderr, **options)
+	return stdout.getvalue(), stderr.getvalue()
+
+
+@override_settings(EMAIL_BACKEND=FAILING_BACKEND)
+class SendOutboxTests(TestCase):
+	def test_sends_in_batches(self):
+		for number in range(5):
+			create_message('library{}@example.org'.format(number))
+
+		stdout, _stderr = send_outbox(batch_size=2)
+
+		self.assertEqual(len(mail.outbox), 5)
+		self.assertEqual(
+			stdout.splitlines(),
+			['Sent 2 of 2 messages.'] * 2 + ['Sent 1 of 1 messages.'],
+		)
+		self.assertFalse(
+			models.OutboxMessage.objects.exclude(status='sent').exists(),
+		)
+
+	def test_html_alternative(self):
+		create_message()
+		send_outbox()
+
+		self.assertEqual(
+			mail.outbox[0].alternatives,
+			[('<p>Body</p>', 'text/html')],
+		)
+
+	def test_failure_backs_off(self):
+		message = create_message('fail@example.org')
+		sent = create_message()
+
+		before = timezone.now()
+		send_outbox(backoff=60)
+		message.refresh_from_db()
+
+		self.assertEqual(message.status, 'pending')
+		self.assertEqual(message.attempts, 1)
+		self.assertIn('ConnectionRefusedError', message.last_error)
+		self.assertGreaterEqual(message.next_attempt, before + timedelta(seconds=60))
+		self.assertEqual(len(mail.outbox), 1)
+		sent.refresh_from_db()
+		self.assertEqual(sent.status, 'sent')
+
+		# Not due yet, so not tried again.
+		send_outbox(backoff=60)
+		message.refresh_from_db()
+		self.assertEqual(message.attempts, 1)
+
+		models.OutboxMessage.objects.filter(pk=message.pk).update(
+			next_attempt=timezone.now(),
+		)
+		before = timezone.now()
+		send_outbox(backoff=60)
+		message.refresh_from_db()
+
+		self.assertEqual(message.attempts, 2)
+		self.assertGreaterEqual(
+			message.next_attempt,
+			before + timedelta(seconds=120),
+		)
+		self.assertLess(
+			message.next_attempt,
+			before + timedelta(seconds=180),
+		)
+
+	def test_dead_after_max_attempts(self):
+		message = create_message('fail@example.org')
+
+		send_outbox(max_attempts=2)
+		models.OutboxMessage.objects.filter(pk=message.pk).update(
+			next_attempt=timezone.now(),
+		)
+		_stdout, stderr = send_outbox(max_attempts=2)
+		message.refresh_from_db()
+
+		self.assertEqual(message.status, 'dead')
+		self.assertEqual(message.attempts, 2)
+		self.assertIn('Giving up on message {}'.format(message.pk), stderr)
+
+		models.OutboxMessage.objects.filter(pk=message.pk).update(
+			next_attempt=timezone.now(),
+		)
+		send_outbox(max_attempts=2)
+		message.refresh_from_db()
+		self.assertEqual(message.attempts, 2)
+
+	@override_settings(EMAIL_OUTBOX=True)
+	def test_send_messages_queues(self):
+		models.OutboxMessage.send_messages([
+			create_message().as_email(),
+		])
+
+		self.assertEqual(len(mail.outbox), 0)
+		self.assertEqual(
+			models.OutboxMessage.objects.filter(status='pending').count(),
+			2,
+		)
+
+
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+@override_settings(EMAIL_BACKEND=FAILING_BACKEND)
+class SendOutboxClaimTests(TransactionTestCase):
+	def test_skips_messages_claimed_by_another_worker(self):
+		claimed = create_message('claimed@example.org')
+		free = create_message('free@example.org')
+		locked, release = threading.Event(), threading.Event()
+
+		def other_worker():
+			with transaction.atomic():
+				list(
+					models.OutboxMessage.objects.select_for_update().filter(
+						pk=claimed.pk,
+					)
+				)
+				locked.set()
+				release.wait(10)
+			connection.close()
+
+		thread = threading.Thread(target=other_worker)
+		thread.start()
+		try:
+			self.assertTrue(locked.wait(10))
+			send_outbox()
+		finally:
+			release.set()
+			thread.join()
+
+		self.assertEqual(
+			[message.to for message in mail.outbox],
+			[['free@example.org']],
+		)
+		claimed.refresh_from_db()
+		free.refresh_from_db()
+		self.assertEqual(claimed.status, 'pending')
+		self.assertEqual(free.status, 'sent')
+
+
+@override_settings(
+	EMAIL_OUTBOX=False,
+	EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+	EMAIL_HOST='127.0.0.1',
+	EMAIL_PORT=1,
+)
+class InlineEmailTests(TransactionTestCase):
+	"""
+	Emails sent straight away go out once the signup has been committed and
+	a failure to send them is queued in the outbox rather than losing the
+	signup.
+	"""
+	serialized_rollback = True
+
+	def setUp(self):
+		organisation_cache.clear()
+		models.contact_cache.clear()
+		self.organisation = helpers.create_organisation()
+		self.package = helpers.create_package(self.organisation)
+		self.country = models.Country.objects.first()
+		self.banding = helpers.create_banding(
+			self.organisation,
+			country=self.country,
+		)
+		models.Contact.objects.create(
+			organisation=self.organisation,
+			name='Billing',
+			email='billing@example.org',
+		)
+
+	def post_signup(self):
+		return self.client.post(
+			reverse('signup_data', kwargs={
+				'package_id': self.package.pk,
+				'country_code': self.country.code,
+				'banding_id': self.banding.pk,
+			}),
+			{
+				'first_name': 'First',
+				'last_name': 'Last',
+				'email_address': 'library@example.org',
+				'institution': 'New University',
+				'address': '1 Library Road',
+				'post_code': 'AB1 2CD',
+				'technical_contact': 'tech@example.org',
+			},
+		)
+
+	def test_signup_saved_when_mail_server_is_down(self):
+		with self.assertLogs('signup.models', 'ERROR'):
+			response = self.post_signup()
+
+		self.assertRedirects(
+			response,
+			reverse('signup_thanks'),
+			fetch_redirect_response=False,
+		)
+		self.assertTrue(
+			models.SignUp.objects.filter(institution='New University').exists(),
+		)
+		self.assertEqual(
+			sorted(
+				message.to[0] for message in models.OutboxMessage.objects.filter(
+					status='pending',
+				)
+			),
+			['billing@example.org', 'library@example.org'],
+		)
+
+	@override_settings(EMAIL_BACKEND=FAILING_BACKEND)
+	def test_sent_after_commit(self):
+		with self.assertLogs('signup.models', 'ERROR'), transaction.atomic():
+			models.OutboxMessage.send_messages([
+				create_message().as_email(),
+				create_message('fail@example.org').as_email(),
+			])
+			self.assertEqual(len(mail.outbox), 0)
+
+		self.assertEqual(
+			[message.to for message in mail.outbox],
+			[['library@example.org']],
+		)
+		self.assertEqual(
+			models.OutboxMessage.objects.filter(
+				to=['fail@example.org'],
+			).count(),
+			2,
+		)
@@ -0,0 +1,84 @@
+from unittest import skipIf
+
+from django.core.paginator import EmptyPage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from signup import models
+from signup.paginators import ApproximateCountPaginator
+from signup.tests import helpers
+
+
+@skipIf(
+	connection.vendor == 'postgresql',
+	'Large counts are estimated by the planner on PostgreSQL',
+)
+@override_settings(APPROXIMATE_COUNT_THRESHOLD=3)
+class ApproximateCountPaginatorTests(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.user = helpers.create_superuser()
+		organisation = helpers.create_organisation()
+		package = helpers.create_package(organisation)
+		banding = helpers.create_banding(organisation)
+		for number in range(5):
+			helpers.create_signup(package, banding, number)
+
+	def paginator(self, per_page=2, **kwargs):
+		return ApproximateCountPaginator(
+			models.SignUp.objects.order_by('pk'),
+			per_page,
+			**kwargs
+		)
+
+	@override_settings(APPROXIMATE_COUNT_THRESHOLD=10)
+	def test_small_counted_exactly(self):
+		paginator = self.paginator()
+		self.assertEqual(paginator.count, 5)
+		self.assertFalse(paginator.approximate)
+		self.assertEqual(paginator.num_pages, 3)
+
+	def test_bounded_count(self):
+		paginator = self.paginator()
+		with CaptureQueriesContext(connection) as context:
+			self.assertEqual(paginator.count, 3)
+
+		self.assertTrue(paginator.approximate)
+		self.assertEqual(len(context.captured_queries), 1)
+		self.assertIn('LIMIT 4', context.captured_queries[0]['sql'])
+
+	def test_exact(self):
+		paginator = self.paginator(exact=True)
+		self.assertEqual(paginator.count, 5)
+		self.assertFalse(paginator.approximate)
+
+	def test_pages_past_estimate(self):
+		paginator = self.paginator()
+		self.assertEqual(paginator.num_pages, 2)
+
+		self.assertEqual(len(paginator.page(3).object_list), 1)
+		self.assertEqual(list(paginator.page(4).object_list), [])
+		with self.assertRaises(EmptyPage):
+			paginator.page(0)
+
+	def test_pages_past_exact_count(self):
+		paginator = self.paginator(exact=True)
+		self.assertEqual(len(paginator.page(3).object_list), 1)
+		with self.assertRaises(EmptyPage):
+			paginator.page(4)
+
+	def test_changelist(self):
+		self.client.force_login(self.user)
+		url = reverse('admin:signup_signup_changelist')
+
+		response = self.client.get(url)
+		self.assertEqual(response.context['cl'].result_count, 3)
+		self.assertContains(response, 'About 3')
+		self.assertContains(response, 'exact_count=1')
+
+		response = self.client.get(url, {'exact_count': '1'})
+		self.assertEqual(response.context['cl'].result_count, 5)
+		self.assertNotContains(response, 'About 5')
+		self.assertNotContains(response, 'exact_count=1')
@@ -0,0 +1,99 @@
+import os
+import pstats
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from signup import models
+from signup.tests import helpers
+
+
+class ProfilerMiddlewareTests(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.staff = helpers.create_superuser()
+		cls.user = User.objects.create_user('visitor', password='password')
+		cls.organisation = helpers.create_organisation()
+		cls.export_code = models.AccessLogExportCode.objects.create(
+			organisation=cls.organisation,
+			issued_to='Platform',
+		)
+
+	def setUp(self):
+		self.profile_dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.profile_dir)
+		settings_override = override_settings(
+			PROFILE_DIR=self.profile_dir,
+			ACCESS_LOG_SNAPSHOT_DIR=os.path.join(self.profile_dir, 'snapshots'),
+		)
+		settings_override.enable()
+		self.addCleanup(settings_override.disable)
+
+	def profiles(self):
+		return sorted(
+			name for name in os.listdir(self.profile_dir)
+			if name.endswith(('.prof', '.collapsed'))
+		)
+
+	def assertProfiled(self, name):
+		self.assertEqual(self.profiles(), [name + '.collapsed', name + '.prof'])
+		stats = pstats.Stats(os.path.join(self.profile_dir, name + '.prof'))
+		self.assertTrue(stats.total_calls)
+
+	def test_staff_request_profiled(self):
+		self.client.force_login(self.staff)
+		response = self.client.get(
+			reverse('admin:signup_signup_changelist'),
+			{'profile': '1'},
+		)
+
+		# The changelist would redirect with ?e=1 if profile was passed on.
+		self.assertEqual(response.status_code, 200)
+		self.assertIn('_signup_signup_changelist_', response['X-Profile'])
+		self.assertProfiled(response['X-Profile'])
+
+	def test_header(self):
+		self.client.force_login(self.staff)
+		response = self.client.get(reverse('index'), HTTP_X_PROFILE='1')
+
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response['X-Profile'].endswith('_index_testserver'))
+		self.assertProfiled(response['X-Profile'])
+
+	def test_non_staff_ignored(self):
+		self.client.force_login(self.user)
+		response = self.client.get(
+			reverse('index'),
+			{'profile': '1'},
+			HTTP_X_PROFILE='1',
+		)
+		self.assertNotIn('X-Profile', response)
+
+		self.client.logout()
+		response = self.client.get(reverse('index'), {'profile': '1'})
+		self.assertNotIn('X-Profile', response)
+
+		self.assertEqual(self.profiles(), [])
+
+	def test_not_requested(self):
+		self.client.force_login(self.staff)
+		response = self.client.get(reverse('index'))
+
+		self.assertNotIn('X-Profile', response)
+		self.assertEqual(self.profiles(), [])
+
+	def test_streaming_saved_when_sent(self):
+		self.client.force_login(self.staff)
+		response = self.client.get(
+			reverse('export_access_log', args=[self.export_code.uuid]),
+			{'since': '0'},
+			HTTP_X_PROFILE='1',
+		)
+
+		self.assertNotIn('X-Profile', response)
+		self.assertEqual(self.profiles(), [])
+		b''.join(response.streaming_content)
+		self.assertEqual(len(self.profiles()), 2)
@@ -0,0 +1,159 @@
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from signup import entitlements, models
+from signup.middleware import organisation_cache
+from signup.tests import helpers
+
+
+# The most queries and distinct templates each view may use, whatever the
+# amount of data behind it. Per worker caches are cleared first, so these
+# are the costs of a cold request.
+BUDGETS = {
+	'index': (4, 3),
+	'packages': (2, 3),
+	'package': (2, 2),
+	'page': (2, 2),
+	'resources': (3, 2),
+	'news': (3, 2),
+	'news_item': (3, 2),
+	'signup_start': (3, 5),
+	'signup_banding': (5, 2),
+	'signup_data': (5, 9),
+	'signup_data_post': (11, 1),
+	'signup_thanks': (1, 2),
+	'export_access_log': (5, 0),
+	'export_access_log_filtered': (4, 0),
+	'lookup_access': (4, 0),
+}
+
+
+class QueryBudgetTests(TestCase):
+	"""
+	Requests each public URL with a little data and with a lot more,
+	failing if any goes over its budget of queries or templates rendered.
+	Templates included inside loops are counted once, a growing number of
+	renders is only a problem when each one queries, which the query
+	budget catches.
+	"""
+	@classmethod
+	def setUpTestData(cls):
+		cls.user = User.objects.create_user('access')
+		cls.organisation = helpers.create_organisation()
+		cls.country = models.Country.objects.first()
+		cls.package = helpers.create_package(
+			cls.organisation,
+			front_page=True,
+		)
+		cls.banding = helpers.create_banding(
+			cls.organisation,
+			country=cls.country,
+		)
+		cls.news_item = models.NewsItem.objects.create(
+			organisation=cls.organisation,
+			title='News',
+			body='Body',
+			image='news.png',
+			posted_by=cls.user,
+		)
+		cls.export_code = models.AccessLogExportCode.objects.create(
+			organisation=cls.organisation,
+			issued_to='Platform',
+		)
+
+	def setUp(self):
+		self.snapshot_dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.snapshot_dir)
+		settings_override = override_settings(
+			ACCESS_LOG_SNAPSHOT_DIR=self.snapshot_dir,
+			EMAIL_OUTBOX=False,
+		)
+		settings_override.enable()
+		self.addCleanup(settings_override.disable)
+
+	def requests(self):
+		signup_data = reverse('signup_data', kwargs={
+			'package_id': self.package.pk,
+			'country_code': self.country.code,
+			'banding_id': self.banding.pk,
+		})
+		export = reverse('export_access_log', args=[self.export_code.uuid])
+
+		return {
+			'index': ('get', reverse('index'), {}),
+			'packages': ('get', reverse('packages'), {}),
+			'package': ('get', reverse('package', args=[self.package.pk]), {}),
+			'page': ('get', reverse('page', args=['about']), {}),
+			'resources': ('get', reverse('resources'), {}),
+			'news': ('get', reverse('news'), {}),
+			'news_item': (
+				'get',
+				reverse('news_item', args=[self.news_item.pk]),
+				{},
+			),
+			'signup_start': (
+				'get',
+				reverse('signup_start', args=[self.package.pk]),
+				{},
+			),
+			'signup_banding': (
+				'get',
+				reverse('signup_banding', kwargs={
+					'package_id': self.package.pk,
+					'country_code': self.country.code,
+				}),
+				{},
+			),
+			'signup_data': ('get', signup_data, {}),
+			'signup_data_post': ('post', signup_data, {
+				'first_name': 'First',
+				'last_name': 'Last',
+				'email_address': 'library@example.org',
+				'institution': 'New University',
+				'address': '1 Library Road',
+				'post_code': 'AB1 2CD',
+				'technical_contact': 'tech@example.org',
+			}),
+			'signup_thanks': ('get', reverse('signup_thanks'), {}),
+			'export_access_log': ('get', export, {}),
+			'export_access_log_filtered': ('get', export, {'since': 0}),
+			'lookup_access': (
+				'get',
+				reverse('lookup_access', args=[self.export_code.uuid]),
+				{'ip': ['10.0.1.1', '10.0.2.2']},
+			),
+		}
+
+	def measure(self, method, url, data):
+		organisation_cache.clear()
+		models.contact_cache.clear()
+		entitlements.index_cache.clear()
+		with CaptureQueriesContext(connection) as context:
+			response = getattr(self.client, method)(url, data)
+			if response.streaming:
+				b''.join(response.streaming_content)
+		self.assertLess(response.status_code, 400, url)
+		templates = {template.name for template in response.templates}
+		return len(context.captured_queries), len(templates)
+
+	def assertWithinBudgets(self):
+		for name, (method, url, data) in self.requests().items():
+			with self.subTest(view=name):
+				queries, templates = self.measure(method, url, data)
+				max_queries, max_templates = BUDGETS[name]
+				self.assertLessEqual(queries, max_queries)
+				self.assertLessEqual(templates, max_templates)
+
+	def test_small(self):
+		helpers.add_rows(self.organisation, self.user, 0, 2)
+		self.assertWithinBudgets()
+
+	def test_large(self):
+		helpers.add_rows(self.organisation, self.user, 0, 30)
+		self.assertWithinBudgets()
@@ -0,0 +1,150 @@
+import json
+
+from django.core import checks
+from django.db import connection
+from django.test import TestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from signup import models, search
+from signup.tests import helpers
+
+
+SEARCH_TABLES = {
+	'postgresql': 'search_vector',
+	'sqlite': 'signup_signup_fts',
+}
+
+
+class SearchIndexCheckTests(TestCase):
+	def run_check(self):
+		return [
+			error for error in checks.run_checks(
+				tags=[checks.Tags.database],
+				databases=['default'],
+			)
+			if error.id == 'signup.E001'
+		]
+
+	def test_index_exists_after_migrations(self):
+		self.assertEqual(search.missing_search_objects(connection), [])
+		self.assertEqual(self.run_check(), [])
+
+	@skipUnlessDBFeature('can_rollback_ddl')
+	def test_reports_missing_trigger(self):
+		if connection.vendor not in search.SEARCH_OBJECTS:
+			self.skipTest('No search index on {}'.format(connection.vendor))
+
+		trigger = search.SEARCH_OBJECTS[connection.vendor]['trigger'][0]
+		with connection.cursor() as cursor:
+			if connection.vendor == 'postgresql':
+				cursor.execute('DROP TRIGGER {} ON signup_signup'.format(trigger))
+			else:
+				cursor.execute('DROP TRIGGER {}'.format(trigger))
+
+		errors = self.run_check()
+
+		self.assertEqual(len(errors), 1)
+		self.assertIn('trigger {}'.format(trigger), errors[0].msg)
+
+
+class SignUpSearchTests(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.user = helpers.create_superuser()
+		cls.organisation = helpers.create_organisation()
+		cls.package = helpers.create_package(cls.organisation)
+		cls.banding = helpers.create_banding(cls.organisation)
+		cls.signup = helpers.create_signup(
+			cls.package,
+			cls.banding,
+			institution='Northern College',
+			email_address='library@northern.ac.example',
+		)
+		helpers.create_signup(cls.package, cls.banding, 1)
+
+	def setUp(self):
+		if connection.vendor not in SEARCH_TABLES:
+			self.skipTest('No search index on {}'.format(connection.vendor))
+		self.client.force_login(self.user)
+
+	def search(self, term):
+		return list(
+			search.search_signups(
+				models.SignUp.objects.all(),
+				term,
+			).values_list('institution', flat=True)
+		)
+
+	def test_changelist_uses_index(self):
+		with CaptureQueriesContext(connection) as context:
+			response = self.client.get(
+				reverse('admin:signup_signup_changelist'),
+				{'q': 'north'},
+			)
+
+		self.assertEqual(
+			[signup.institution for signup in response.context['cl'].result_list],
+			['Northern College'],
+		)
+		self.assertTrue(any(
+			SEARCH_TABLES[connection.vendor] in query['sql']
+			for query in context.captured_queries
+		))
+
+	def test_autocomplete_uses_index(self):
+		with CaptureQueriesContext(connection) as context:
+			response = self.client.get(
+				reverse('admin:signup_signup_autocomplete'),
+				{'term': 'northern.ac'},
+			)
+
+		self.assertEqual(
+			[result['id'] for result in json.loads(response.content)['results']],
+			[str(self.signup.pk)],
+		)
+		self.assertTrue(any(
+			SEARCH_TABLES[connection.vendor] in query['sql']
+			for query in context.captured_queries
+		))
+
+	def autocomplete(self, term):
+		response = self.client.get(
+			reverse('admin:signup_signup_autocomplete'),
+			{'term': term},
+		)
+		return [
+			result['text'] for result in json.loads(response.content)['results']
+		]
+
+	def test_autocomplete_ordering(self):
+		self.assertEqual(
+			self.autocomplete('example'),
+			['Northern College', 'University 1'],
+		)
+		# Without a term the newest signups come first, as on the
+		# changelist, rather than sorting the whole table by institution.
+		self.assertEqual(
+			self.autocomplete(''),
+			['University 1', 'Northern College'],
+		)
+
+	def test_insert_update_and_delete_reflected(self):
+		signup = helpers.create_signup(
+			self.package,
+			self.banding,
+			2,
+			institution='Southern Institute',
+		)
+		self.assertEqual(self.search('southern'), ['Southern Institute'])
+
+		signup.institution = 'Eastern Institute'
+		signup.save()
+		self.assertEqual(self.search('southern'), [])
+		self.assertEqual(self.search('eastern inst'), ['Eastern Institute'])
+
+		models.SignUp.objects.filter(pk=signup.pk).update(last_name='Westwood')
+		self.assertEqual(self.search('westwood'), ['Eastern Institute'])
+
+		signup.delete()
+		self.assertEqual(self.search('eastern'), [])
@@ -38,6 +38,9 @@ urlpatterns = [
     path('signup/thanks/', views.signup_thanks, name='signup_thanks'),
 
     path('accesslog/export/<uuid:uuid>/', views.export_access_log, name='export_access_log'),
+    path('accesslog/lookup/<uuid:uuid>/', views.lookup_access, name='lookup_access'),
+
+    path('metrics', views.prometheus_metrics, name='metrics'),
 ]
 
 if settings.DEBUG:
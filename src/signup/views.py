@@ -1,11 +1,24 @@
-import csv
+import json
 
 from django.shortcuts import render, get_object_or_404, redirect, reverse
-from django.http import Http404, HttpResponse
+from django.core.exceptions import PermissionDenied
+from django.http import (
+	Http404,
+	HttpResponse,
+	HttpResponseBadRequest,
+	StreamingHttpResponse,
+	FileResponse,
+	JsonResponse,
+)
+from django.conf import settings
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.utils.crypto import constant_time_compare
 from django.utils.html import strip_tags
+from django.utils.cache import get_conditional_response
 
-from signup import models, forms
+from signup import models, forms, exports, entitlements, metrics
 
 
 def index(request):
@@ -292,45 +305,137 @@ def export_access_log(request, uuid):
 		uuid=uuid,
 		active=True,
 	)
-	log_entries = models.AccessLog.objects.filter(
-		signup__package__organisation=access_code.organisation,
-	)
-
-	all_rows = []
-	headers = [
-		'Institution',
-		'Address',
-		'Tech Contact',
-		'Package',
-		'Date',
-		'Grant or Revoke',
-		'Email Address',
-		'Phone Number',
-		'IP Range',
-		'Existing Customer?',
-		'Payment Handler',
-	]
-	all_rows.append(headers)
-
-	for entry in log_entries:
-		row = [
-			entry.signup.institution,
-			entry.signup.address,
-			entry.signup.technical_contact,
-			entry.signup.package.name,
-			entry.date_stamp,
-			entry.access_type,
-			entry.signup.email_address,
-			entry.signup.phone_number,
-			entry.ip_range,
-			entry.signup.existing_customer,
-			entry.payment_handler
-		]
-		all_rows.append(row)
-
-	response = HttpResponse(content_type='text/csv')
+	if not request.GET:
+		return serve_access_log_snapshot(request, access_code.organisation_id)
+
+	form = forms.AccessLogExportFilterForm(request.GET)
+	if not form.is_valid():
+		return HttpResponseBadRequest(
+			form.errors.as_text(),
+			content_type='text/plain',
+		)
+
+	# Read before the entries and pin the export to it, so that the cursor
+	# we hand back covers exactly what was streamed.
+	next_cursor = models.AccessLogExportVersion.current(
+		access_code.organisation_id,
+	)
+	log_entries = form.filter(
+		exports.organisation_access_logs(access_code.organisation_id),
+	).filter(
+		export_sequence__lte=next_cursor,
+	)
+
+	response = StreamingHttpResponse(
+		exports.access_log_csv_rows(log_entries),
+		content_type='text/csv',
+	)
 	response['Content-Disposition'] = 'attachment; filename="access_log_export.csv"'
-	writer = csv.writer(response)
-	writer.writerows(all_rows)
+	response['X-Next-Cursor'] = next_cursor
 
 	return response
+
+
+def serve_access_log_snapshot(request, organisation_id):
+	"""
+	Serves the pre-generated full export for an organisation from disk.
+	Clients sending a matching If-None-Match header get a 304.
+	"""
+	snapshot = exports.get_snapshot(organisation_id)
+	etag = '"{}"'.format(snapshot.etag)
+
+	not_modified = get_conditional_response(request, etag=etag)
+	if not_modified is not None:
+		not_modified['ETag'] = etag
+		not_modified['X-Next-Cursor'] = snapshot.cursor
+		return not_modified
+
+	try:
+		snapshot_file = snapshot.open()
+	except FileNotFoundError:
+		# Replaced by a newer snapshot between reading its metadata and
+		# opening it.
+		snapshot = exports.get_snapshot(organisation_id)
+		etag = '"{}"'.format(snapshot.etag)
+		snapshot_file = snapshot.open()
+
+	response = FileResponse(
+		snapshot_file,
+		as_attachment=True,
+		filename='access_log_export.csv',
+		content_type='text/csv',
+	)
+	response['ETag'] = etag
+	response['X-Next-Cursor'] = snapshot.cursor
+	return response
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+def lookup_access(request, uuid):
+	"""
+	Reports whether IP addresses are covered by a granted signup. Send a
+	single address as ?ip=, several as repeated ip parameters or POST a
+	JSON body of the form {"ips": [...]}.
+	"""
+	access_code = get_object_or_404(
+		models.AccessLogExportCode,
+		uuid=uuid,
+		active=True,
+	)
+
+	if request.method == 'POST':
+		try:
+			ips = json.loads(request.body)['ips']
+		except (ValueError, KeyError, TypeError):
+			ips = None
+		if not isinstance(ips, list) or not all(
+			isinstance(ip, str) for ip in ips
+		):
+			return HttpResponseBadRequest(
+				'Expected a JSON body of the form {"ips": [...]}',
+				content_type='text/plain',
+			)
+		batch = True
+	else:
+		ips = request.GET.getlist('ip')
+		if not ips:
+			return HttpResponseBadRequest(
+				'No ip parameter given.',
+				content_type='text/plain',
+			)
+		batch = len(ips) > 1
+
+	limit = getattr(settings, 'ENTITLEMENT_LOOKUP_BATCH_LIMIT', 1000)
+	if len(ips) > limit:
+		return HttpResponseBadRequest(
+			'At most {} addresses can be looked up at once.'.format(limit),
+			content_type='text/plain',
+		)
+
+	index = entitlements.get_index(access_code.organisation_id)
+	results = [entitlements.lookup_result(index, ip) for ip in ips]
+
+	if batch:
+		return JsonResponse({'results': results})
+
+	return JsonResponse(results[0])
+
+
+def prometheus_metrics(request):
+	"""
+	Serves the request histograms in the Prometheus text format, to staff
+	or to clients sending the METRICS_TOKEN setting as a bearer token.
+	"""
+	token = getattr(settings, 'METRICS_TOKEN', None)
+	authorised = request.user.is_staff or token and constant_time_compare(
+		request.META.get('HTTP_AUTHORIZATION', ''),
+		'Bearer {}'.format(token),
+	)
+	if not authorised:
+		raise PermissionDenied
+
+	return HttpResponse(
+		metrics.render_metrics(),
+		content_type='text/plain; version=0.0.4; charset=utf-8',
+	)